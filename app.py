@@ -10,6 +10,10 @@ def create_app() -> Flask:
     app.register_blueprint(web_bp)
     app.register_blueprint(project_bp)
 
+    # Сжатие JSON/HTML-ответов (gzip/brotli) по Accept-Encoding
+    from modules.web.compact import compress_response
+    app.after_request(compress_response)
+
     return app
 
 
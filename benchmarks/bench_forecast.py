@@ -0,0 +1,73 @@
+"""Сравнение путей итеративного прогноза: model.predict на шаг, tf.function и NumPy.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_forecast --model mlp --steps 300
+    python -m benchmarks.bench_forecast --model rnn --steps 50 --batch 256
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from modules.models.tf_models import ModelConfig, build_model, iterative_forecast, batch_forecast, MODEL_CACHE
+from modules.models.numpy_runtime import NPZ_NAME, export_numpy_model, load_exported, numpy_forecast
+
+
+def _timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default="mlp", choices=["mlp", "cnn", "rnn"])
+    parser.add_argument("--window", type=int, default=32)
+    parser.add_argument("--horizon", type=int, default=1)
+    parser.add_argument("--steps", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--batch", type=int, default=0, help="сравнить batch_forecast на N рядах с N вызовами по одному")
+    args = parser.parse_args()
+
+    cfg = ModelConfig(model_type=args.model, window=args.window, horizon=args.horizon)
+    series = np.sin(np.arange(10_000) / 25.0)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "model.keras")
+        model = build_model(cfg)
+        model.save(path)
+        export_numpy_model(model, os.path.join(tmp, NPZ_NAME), source_path=path)
+        MODEL_CACHE.get(path)
+        np_model = load_exported(path)
+
+        run = {mode: (lambda m=mode: iterative_forecast(series, path, args.window, args.steps, args.horizon, mode=m))
+               for mode in ("predict", "compiled")}
+        run["numpy"] = lambda: numpy_forecast(series, np_model, args.steps, args.horizon)
+        t0 = time.perf_counter()
+        compiled = run["compiled"]()
+        trace = time.perf_counter() - t0
+        predict = run["predict"]()
+        print(f"{args.model}: window={args.window} horizon={args.horizon} steps={args.steps}")
+        print(f"  max |predict - compiled| = {np.max(np.abs(predict - compiled)):.2e}")
+        print(f"  max |numpy - compiled| = {np.max(np.abs(run['numpy']() - compiled)):.2e}")
+        print(f"  compiled, first call (trace): {trace * 1000:.1f} ms")
+        for mode, fn in run.items():
+            best = _timed(fn, args.repeat)
+            print(f"  {mode:>8}: {best * 1000:.1f} ms total, {best / args.steps * 1e6:.0f} us/step")
+
+        if args.batch:
+            offsets = np.linspace(0, len(series) - args.window, args.batch).astype(int)
+            reqs = [{"series": series[:o + args.window], "model_path": path, "window": args.window,
+                     "horizon": args.horizon, "steps": args.steps} for o in offsets]
+            batch_forecast(reqs)  # трассировка под размер пачки
+            one = _timed(lambda: [iterative_forecast(r["series"], path, args.window, args.steps, args.horizon) for r in reqs], 1)
+            many = _timed(lambda: batch_forecast(reqs), args.repeat)
+            print(f"  {args.batch} series: one by one {one * 1000:.1f} ms, batched {many * 1000:.1f} ms ({one / many:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
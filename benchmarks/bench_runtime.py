@@ -0,0 +1,83 @@
+"""Пропускная способность обучения MLP/CNN/RNN при параллельных процессах.
+
+Каждый процесс обучает свою модель с заданным профилем исполнения;
+печатается суммарная скорость (окон в секунду) и скорость на ядро.
+Запуск из корня проекта:
+    python -m benchmarks.bench_runtime --procs 1,2,4 --threads 1
+    python -m benchmarks.bench_runtime --procs 2 --threads 2 --jit --mixed mixed_bfloat16 --onednn 0
+"""
+import argparse
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+
+def _train(model_type: str, env: dict, epochs: int, length: int, barrier, out) -> None:
+    # Окружение задаётся до импорта TensorFlow в дочернем процессе
+    os.environ.update(env)
+    from modules.models.tf_models import ModelConfig, RuntimeProfile, build_model, _fit, _window_count
+
+    profile = RuntimeProfile.from_env()
+    cfg = ModelConfig(model_type=model_type, window=32, horizon=12, epochs=1, batch_size=64)
+    series = np.sin(np.arange(length) / 25.0) + np.random.default_rng(0).normal(0, 0.05, length)
+    model = build_model(cfg, profile)
+    _fit(model, series, cfg)  # прогрев: трассировка графа и компиляция
+    barrier.wait()
+    cfg.epochs = epochs
+    t0 = time.perf_counter()
+    _fit(model, series, cfg)
+    elapsed = time.perf_counter() - t0
+    out.put(_window_count(length, cfg.window, cfg.horizon) * epochs / elapsed)
+
+
+def run(model_type: str, procs: int, env: dict, epochs: int, length: int) -> float:
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(procs)
+    out = ctx.Queue()
+    workers = [ctx.Process(target=_train, args=(model_type, env, epochs, length, barrier, out)) for _ in range(procs)]
+    for w in workers:
+        w.start()
+    rates = [out.get() for _ in workers]
+    for w in workers:
+        w.join()
+    return float(sum(rates))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--models", default="mlp,cnn,rnn")
+    parser.add_argument("--procs", default="1,2", help="число параллельных процессов (через запятую)")
+    parser.add_argument("--threads", type=int, default=1, help="intra-op потоков на процесс")
+    parser.add_argument("--inter", type=int, default=1, help="inter-op потоков на процесс")
+    parser.add_argument("--jit", action="store_true", help="XLA JIT при компиляции моделей")
+    parser.add_argument("--mixed", default="", choices=["", "mixed_bfloat16", "mixed_float16"])
+    parser.add_argument("--onednn", default="", choices=["", "0", "1"])
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--length", type=int, default=20_000)
+    args = parser.parse_args()
+
+    env = {
+        "OMP_NUM_THREADS": str(args.threads),
+        "TF_NUM_INTRAOP_THREADS": str(args.threads),
+        "TF_NUM_INTEROP_THREADS": str(args.inter),
+        "TF_JIT_COMPILE": "1" if args.jit else "0",
+        "TF_MIXED_PRECISION": args.mixed,
+        "TF_CPP_MIN_LOG_LEVEL": "2",
+    }
+    if args.onednn:
+        env["TF_ENABLE_ONEDNN_OPTS"] = args.onednn
+    cores = os.cpu_count() or 1
+    print(f"cpu={cores} threads/proc={args.threads} inter={args.inter} jit={args.jit} "
+          f"mixed={args.mixed or '-'} onednn={args.onednn or 'default'}")
+    print(f"{'model':<6}{'procs':>6}{'windows/s':>14}{'per core':>12}")
+    for model_type in args.models.split(","):
+        for procs in (int(p) for p in args.procs.split(",")):
+            rate = run(model_type, procs, env, args.epochs, args.length)
+            used = min(cores, procs * args.threads)
+            print(f"{model_type:<6}{procs:>6}{rate:>14.0f}{rate / used:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
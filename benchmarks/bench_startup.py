@@ -0,0 +1,55 @@
+"""Время старта и память процессов веб-уровня и рабочих процессов задач.
+
+Каждый модуль импортируется в отдельном чистом процессе; печатается медиана
+времени импорта, пиковый RSS и какие тяжёлые библиотеки оказались загружены.
+Запуск из корня проекта:
+    python -m benchmarks.bench_startup --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# app — то, что грузит каждый воркер gunicorn; tasks — рабочий процесс задач
+# до первой задачи обучения; tf_models — цена TensorFlow для сравнения.
+TARGETS = ("app", "modules.web.tasks", "modules.models.tf_models")
+HEAVY = ("tensorflow", "keras", "scipy", "pandas", "numpy")
+
+_PROBE = """
+import json, resource, sys, time
+t0 = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t0
+print(json.dumps({{
+    "seconds": elapsed,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "loaded": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def probe(module: str) -> dict:
+    code = _PROBE.format(module=module, heavy=HEAVY)
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                         env={**os.environ, "TF_CPP_MIN_LOG_LEVEL": "3"})
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--targets", default=",".join(TARGETS))
+    args = parser.parse_args()
+
+    print(f"{'module':<28}{'import, s':>11}{'RSS, MB':>10}  loaded")
+    for module in args.targets.split(","):
+        runs = [probe(module) for _ in range(args.repeat)]
+        seconds = statistics.median(r["seconds"] for r in runs)
+        rss = statistics.median(r["rss_mb"] for r in runs)
+        print(f"{module:<28}{seconds:>11.2f}{rss:>10.0f}  {', '.join(runs[-1]['loaded'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,4 @@
 import numpy as np
-from scipy.signal import find_peaks
 import pandas as pd
 
 class DisorderResult:
@@ -7,28 +6,65 @@ class DisorderResult:
         self.B = B
         self.indMax = indMax
 
+def _as_columns(A):
+    """Приводит вход к матрице (n, m): каждый столбец — отдельный ряд."""
+    X = np.asarray(A, dtype=float)
+    if X.ndim == 1:
+        return X[:, np.newaxis]
+    if X.ndim != 2:
+        raise ValueError('ожидается 1-D или 2-D массив')
+    return X
+
+def _first_abs_max(B):
+    """Индекс первого максимума |B| по оси 0 (как в исходном цикле со строгим >)."""
+    if B.shape[0] == 0:
+        return np.zeros(B.shape[1], dtype=int)
+    score = np.abs(B)
+    score[np.isnan(score)] = -np.inf
+    return np.argmax(score, axis=0)
+
+def cusum_batch(A):
+    """CUSUM сразу для нескольких рядов: A формы (n, m), ряды — по столбцам.
+    Возвращает DisorderResult с B формы (n, m) и indMax формы (m,).
+    """
+    X = _as_columns(A)
+    n = X.shape[0]
+    if n == 0:
+        return DisorderResult(np.zeros(X.shape), np.zeros(X.shape[1], dtype=int))
+    centered = X - np.mean(X, axis=0)
+    dispersion_sum = np.sqrt(np.sum(centered ** 2, axis=0) * n)
+    B = np.cumsum(centered, axis=0) / dispersion_sum
+    return DisorderResult(B, _first_abs_max(B))
+
 def cusum(A):
-    average = np.mean(A)
-    dispersion_sum = np.sqrt(np.sum((A - average) ** 2) * len(A))
-    B = np.zeros(len(A))
-    indMax = 0
-    for i in range(len(A)):
-        sum_val = np.sum(A[:i+1] - average)
-        B[i] = sum_val / dispersion_sum
-        indMax = i if abs(B[i]) > abs(B[indMax]) else indMax
-    return DisorderResult(B, indMax)
+    res = cusum_batch(np.asarray(A, dtype=float).ravel())
+    return DisorderResult(res.B[:, 0], int(res.indMax[0]))
 
-def min_info_error(A):
-        B = np.zeros(len(A))
+def min_info_error_batch(A):
+    """Критерий минимума информационной ошибки для нескольких рядов сразу.
+    A формы (n, m), ряды — по столбцам; средние квадратов обеих частей
+    берутся из накопленной суммы, поэтому проход линейный по n.
+    """
+    X = _as_columns(A)
+    n, m = X.shape
+    B = np.zeros((n, m))
+    if n > 2:
         c = np.log(2 * np.pi) + 1
-        indMax = 0
-        for i in range(len(A) - 2):
-            c1 = -(i + 1) * (np.log(np.mean(A[:i + 1] ** 2)) + c) / 2
-            c2 = -(len(A) - i - 1) * (np.log(np.mean(A[i + 1:] ** 2)) + c) / 2
-            c3 = len(A) * (np.log(np.mean(A ** 2)) + c) / 2
-            B[i] = c1 + c2 + c3
-            indMax = i if abs(B[i]) > abs(B[indMax]) else indMax
-        return DisorderResult(B, indMax)
+        cs = np.cumsum(X ** 2, axis=0)
+        total = cs[-1]
+        left = np.arange(1, n - 1, dtype=float)[:, np.newaxis]
+        right = n - left
+        with np.errstate(divide='ignore', invalid='ignore'):
+            c1 = -left * (np.log(cs[:n - 2] / left) + c) / 2
+            tail = np.maximum(total - cs[:n - 2], 0.0)
+            c2 = -right * (np.log(tail / right) + c) / 2
+            c3 = n * (np.log(total / n) + c) / 2
+        B[:n - 2] = c1 + c2 + c3
+    return DisorderResult(B, _first_abs_max(B))
+
+def min_info_error(A):
+    res = min_info_error_batch(np.asarray(A, dtype=float).ravel())
+    return DisorderResult(res.B[:, 0], int(res.indMax[0]))
 
 def get_more_points(pointnow, points_data = [], procents = 0.1):
     plus = points_data[pointnow] + points_data[pointnow]*procents
@@ -50,22 +86,35 @@ def get_more_points(pointnow, points_data = [], procents = 0.1):
 def get_point_with_max_index(points_data = []):
     return points_data[len(points_data)-1]
 
+def _hurst_design(window_size):
+    """Веса МНК для наклона по log(T), T = 1..window_size (замена polyfit)."""
+    log_t = np.log(np.arange(1, window_size + 1, dtype=float))
+    centered = log_t - log_t.mean()
+    return centered / np.sum(centered ** 2)
+
+def rolling_hurst(signal, window_size, chunk_size=None):
+    """Показатель Хёрста по R/S для всех окон сразу.
+    Окна берутся как представление sliding_window_view без копирования;
+    chunk_size ограничивает число окон, обрабатываемых за один шаг (память).
+    """
+    x = np.asarray(signal, dtype=float)
+    count = len(x) - window_size + 1
+    if window_size < 2 or count <= 0:
+        return np.array([], dtype=float)
+    windows = np.lib.stride_tricks.sliding_window_view(x, window_size)
+    weights = _hurst_design(window_size)
+    if chunk_size is None:
+        chunk_size = max(1, (1 << 22) // window_size)
+    epsilon = 1e-10  # небольшая константа для предотвращения деления на ноль
+    out = np.empty(count, dtype=float)
+    for start in range(0, count, chunk_size):
+        w = windows[start:start + chunk_size]
+        Y = np.cumsum(w - w.mean(axis=1, keepdims=True), axis=1)
+        R = np.maximum.accumulate(Y, axis=1) - np.minimum.accumulate(Y, axis=1)
+        S = w.std(axis=1, keepdims=True)
+        out[start:start + len(w)] = np.log(R / S + epsilon) @ weights
+    return out
+
 # Функция для вычисления локальной фрактальной размерности
-def local_fractal_dimension(signal, window_size):
-    def hurst_exponent(ts):
-        N = len(ts)
-        T = np.arange(1, N+1)
-        Y = np.cumsum(ts - np.mean(ts))
-        R = np.maximum.accumulate(Y) - np.minimum.accumulate(Y)
-        S = np.std(ts)
-        R_S = R / S
-        epsilon = 1e-10  # небольшая константа для предотвращения деления на ноль
-        return np.polyfit(np.log(T), np.log(R_S + epsilon), 1)[0]
-    
-    lfd_series = []
-    for i in range(len(signal) - window_size + 1):
-        window = signal[i:i + window_size]
-        lfd = hurst_exponent(window)
-        lfd_series.append(lfd)
-    
-    return np.array(lfd_series)
\ No newline at end of file
+def local_fractal_dimension(signal, window_size, chunk_size=None):
+    return rolling_hurst(signal, window_size, chunk_size)
@@ -0,0 +1,390 @@
+"""Колоночный кэш загруженного CSV.
+
+CSV разбирается один раз: каждая колонка сохраняется в отдельный .npy
+в папке cache/ рядом с файлом данных, дальше читатели открывают только
+нужные колонки через memory-mapping. Кэш привязан к размеру и mtime
+исходного файла и пересобирается, если файл изменился. Дописанные в конец
+файла строки (append_rows) продлевают колонки на месте, без повторного
+разбора и хэширования всего файла: хэш данных после дописывания — sha1 от
+прежнего хэша и хэша новой части, части перечислены в манифесте (appends).
+Читатели берут из колонок ровно manifest["rows"] строк, поэтому колонка,
+продлеваемая в этот момент, видна им в прежней длине.
+"""
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import io
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+CACHE_DIRNAME = "cache"
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = ".lock"
+CHUNK_ROWS = 200_000
+
+
+def cache_dir_for(csv_path: str) -> str:
+    return os.path.join(os.path.dirname(csv_path), CACHE_DIRNAME)
+
+
+@contextmanager
+def cache_lock(csv_path: str):
+    """Эксклюзивная блокировка кэша файла данных (flock: между процессами и
+    потоками). Под ней кэш собирается и продлевается; чтение её не берёт."""
+    cache_dir = cache_dir_for(csv_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, LOCK_NAME), "a+b") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _tmp_suffix() -> str:
+    # Уникален для потока: несколько потоков одного процесса не пишут в один временный файл
+    return f"tmp-{os.getpid()}-{threading.get_ident()}"
+
+
+def _file_stamp(csv_path: str) -> Dict[str, Any]:
+    st = os.stat(csv_path)
+    return {"size": int(st.st_size), "mtime_ns": int(st.st_mtime_ns)}
+
+
+def _file_hash(csv_path: str) -> str:
+    h = hashlib.sha1()
+    with open(csv_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _column_array(col: pd.Series) -> np.ndarray:
+    # Числа и bool храним как есть, остальное — строками фиксированной ширины ('' = пропуск)
+    if pd.api.types.is_numeric_dtype(col) or pd.api.types.is_bool_dtype(col):
+        return col.to_numpy()
+    return col.astype(object).where(col.notna(), "").to_numpy(dtype=str)
+
+
+def _text_array(arr: np.ndarray) -> np.ndarray:
+    """Значения колонки строками по правилам _column_array (пропуск — '')."""
+    if arr.dtype.kind == "U":
+        return arr
+    return _column_array(pd.Series(arr, dtype=object))
+
+
+def _text_width(arr: np.ndarray) -> int:
+    """Длина самого длинного значения колонки в строковом виде (по частям)."""
+    if arr.dtype.kind == "U":
+        return arr.dtype.itemsize // 4
+    width = 0
+    for start in range(0, len(arr), CHUNK_ROWS):
+        part = _text_array(np.asarray(arr[start:start + CHUNK_ROWS]))
+        width = max(width, int(np.char.str_len(part).max(initial=0)))
+    return width
+
+
+def _final_dtype(arrays: List[np.ndarray]) -> np.dtype:
+    """Общий тип частей колонки. Если среди частей есть текст, колонка
+    строковая, а ширина — по самому длинному значению всех частей, в том
+    числе числовых в строковом виде."""
+    if any(a.dtype.kind in ("U", "O") for a in arrays):
+        return np.dtype(f"<U{max(1, max(_text_width(a) for a in arrays))}")
+    return np.result_type(*(a.dtype for a in arrays))
+
+
+def _cast_into(out: np.ndarray, pos: int, arr: np.ndarray) -> None:
+    """out[pos:pos + len(arr)] = arr; в строковую колонку числа пишутся по
+    правилам _column_array (astype дал бы 'nan' вместо пропуска)."""
+    if out.dtype.kind != "U" or arr.dtype.kind == "U":
+        out[pos:pos + len(arr)] = arr.astype(out.dtype, copy=False)
+        return
+    for start in range(0, len(arr), CHUNK_ROWS):
+        part = _text_array(np.asarray(arr[start:start + CHUNK_ROWS]))
+        out[pos + start:pos + start + len(part)] = part
+
+
+def _write_json(path: str, data: Dict[str, Any]) -> None:
+    tmp = f"{path}.{_tmp_suffix()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def build_column_cache(csv_path: str, chunksize: int = CHUNK_ROWS) -> Dict[str, Any]:
+    """Разбирает CSV частями и сохраняет колонки в .npy. Возвращает манифест."""
+    with cache_lock(csv_path):
+        return _build_column_cache(csv_path, chunksize)
+
+
+def _build_column_cache(csv_path: str, chunksize: int = CHUNK_ROWS) -> Dict[str, Any]:
+    # Вызывается только под cache_lock
+    cache_dir = cache_dir_for(csv_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    stamp = _file_stamp(csv_path)
+    suffix = _tmp_suffix()
+
+    names: List[str] = []
+    parts: Dict[str, List[str]] = {}
+    rows = 0
+    for n_chunk, chunk in enumerate(pd.read_csv(csv_path, chunksize=chunksize)):
+        if not names:
+            names = [str(c) for c in chunk.columns]
+            parts = {c: [] for c in names}
+        for idx, col in enumerate(names):
+            arr = _column_array(chunk.iloc[:, idx])
+            part = os.path.join(cache_dir, f"c{idx}.part{n_chunk}.{suffix}.npy")
+            np.save(part, arr, allow_pickle=False)
+            parts[col].append(part)
+        rows += len(chunk)
+
+    columns = []
+    for idx, col in enumerate(names):
+        arrays = [np.load(part, mmap_mode="r") for part in parts[col]]
+        dtype = _final_dtype(arrays)
+        fname = f"c{idx}.npy"
+        tmp = os.path.join(cache_dir, f"c{idx}.{suffix}.npy")
+        out = np.lib.format.open_memmap(tmp, mode="w+", dtype=dtype, shape=(rows,))
+        pos = 0
+        for arr in arrays:
+            _cast_into(out, pos, arr)
+            pos += len(arr)
+        out.flush()
+        del out, arrays
+        for part in parts[col]:
+            os.remove(part)
+        os.replace(tmp, os.path.join(cache_dir, fname))
+        columns.append({"name": col, "file": fname, "dtype": dtype.str, "text": dtype.kind == "U"})
+
+    manifest = {
+        "source": os.path.basename(csv_path),
+        **stamp,
+        "hash": _file_hash(csv_path),
+        "rows": rows,
+        "columns": columns,
+    }
+    _write_json(os.path.join(cache_dir, MANIFEST_NAME), manifest)
+    return manifest
+
+
+def load_manifest(csv_path: str) -> Optional[Dict[str, Any]]:
+    """Манифест кэша, если он соответствует текущему файлу, иначе None."""
+    path = os.path.join(cache_dir_for(csv_path), MANIFEST_NAME)
+    if not os.path.exists(path) or not os.path.exists(csv_path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except Exception:
+        return None
+    stamp = _file_stamp(csv_path)
+    if manifest.get("source") != os.path.basename(csv_path) or any(manifest.get(k) != v for k, v in stamp.items()):
+        return None
+    return manifest
+
+
+def ensure_column_cache(csv_path: str) -> Dict[str, Any]:
+    manifest = load_manifest(csv_path)
+    if manifest is not None:
+        return manifest
+    with cache_lock(csv_path):
+        # Пока ждали блокировку, кэш мог собрать другой поток или процесс
+        return load_manifest(csv_path) or _build_column_cache(csv_path)
+
+
+def data_file_hash(csv_path: str) -> str:
+    """Хэш данных из манифеста кэша: sha1 файла, после дописываний — цепочка
+    sha1 от прежнего хэша и дописанной части."""
+    return ensure_column_cache(csv_path)["hash"]
+
+
+def _select(manifest: Dict[str, Any], columns: Optional[List[str]]) -> List[Dict[str, Any]]:
+    if not columns:
+        return manifest["columns"]
+    wanted = set(columns)
+    selected = [c for c in manifest["columns"] if c["name"] in wanted]
+    missing = wanted - {c["name"] for c in selected}
+    if missing:
+        raise ValueError(f"Колонки не найдены в файле: {sorted(missing)}")
+    return selected
+
+
+def read_column_array(csv_path: str, column: str, manifest: Optional[Dict[str, Any]] = None) -> np.ndarray:
+    """Колонка как np.memmap только для чтения (текстовые — строками, '' = пропуск).
+    manifest — уже загруженный манифест (под cache_lock кэш заново не проверяется)."""
+    manifest = manifest or ensure_column_cache(csv_path)
+    meta = _select(manifest, [column])[0]
+    return np.load(os.path.join(cache_dir_for(csv_path), meta["file"]), mmap_mode="r")[:manifest["rows"]]
+
+
+def _frame(cache_dir: str, metas: List[Dict[str, Any]], start: int, stop: int) -> pd.DataFrame:
+    data = {}
+    for meta in metas:
+        arr = np.load(os.path.join(cache_dir, meta["file"]), mmap_mode="r")[start:stop]
+        if meta.get("text"):
+            col = pd.Series(arr, dtype=object)
+            data[meta["name"]] = col.where(col != "", np.nan)
+        else:
+            data[meta["name"]] = np.array(arr)
+    return pd.DataFrame(data)
+
+
+def read_columns(csv_path: str, columns: Optional[List[str]] = None, limit: Optional[int] = None) -> pd.DataFrame:
+    """Аналог pd.read_csv(csv_path, usecols=columns).head(limit) поверх кэша.
+    Порядок колонок — как в файле.
+    """
+    manifest = ensure_column_cache(csv_path)
+    rows = manifest["rows"] if limit is None else min(limit, manifest["rows"])
+    return _frame(cache_dir_for(csv_path), _select(manifest, columns), 0, rows)
+
+
+def iter_columns(csv_path: str, columns: Optional[List[str]] = None, chunksize: int = CHUNK_ROWS, start: int = 0):
+    """Аналог pd.read_csv(csv_path, usecols=columns, chunksize=chunksize) поверх
+    кэша: части по chunksize строк, начиная со строки start; в памяти — только
+    текущая часть."""
+    manifest = ensure_column_cache(csv_path)
+    cache_dir = cache_dir_for(csv_path)
+    metas = _select(manifest, columns)
+    for pos in range(start, manifest["rows"], chunksize):
+        yield _frame(cache_dir, metas, pos, min(pos + chunksize, manifest["rows"]))
+
+
+def rows_at(manifest: Dict[str, Any], data_hash: Optional[str]) -> Optional[int]:
+    """Сколько строк было в файле, когда его хэш был data_hash (по журналу
+    дописываний манифеста). None — если с тех пор файл менялся не только
+    дописыванием строк."""
+    rows = manifest["rows"]
+    if data_hash == manifest["hash"]:
+        return rows
+    for entry in reversed(manifest.get("appends", [])):
+        rows -= entry["rows"]
+        if entry["parent"] == data_hash:
+            return rows
+    return None
+
+
+def check_append_header(csv_path: str, raw: bytes) -> List[str]:
+    """Быстрая проверка перед append_rows: разбирается только заголовок raw.
+    ValueError — если набор колонок не совпадает с файлом данных."""
+    try:
+        header = [str(c) for c in pd.read_csv(io.BytesIO(raw), nrows=0).columns]
+    except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as exc:
+        raise ValueError(f"Не удалось разобрать CSV: {exc}") from exc
+    names = [c["name"] for c in ensure_column_cache(csv_path)["columns"]]
+    if set(header) != set(names) or len(header) != len(names):
+        raise ValueError(f"Колонки новых строк не совпадают с файлом: ожидаются {names}")
+    return header
+
+
+def _extend_npy(path: str, rows: int, new: np.ndarray) -> bool:
+    """Дописывает new в конец колонки .npy на месте: данные после первых rows
+    строк, затем заголовок с новой длиной (numpy оставляет в заголовке место
+    для роста длины). False — если тип колонки надо расширять (тогда колонка
+    переписывается целиком)."""
+    fmt = np.lib.format
+    with open(path, "r+b") as f:
+        version = fmt.read_magic(f)
+        if version not in ((1, 0), (2, 0)):
+            return False
+        read_header = fmt.read_array_header_1_0 if version == (1, 0) else fmt.read_array_header_2_0
+        _, fortran, dtype = read_header(f)
+        header_len = f.tell()
+        # Без переписывания — только если тип не меняется: в числовую колонку
+        # не пришёл текст, а в строковую — значения не длиннее её ширины
+        if fortran or _final_dtype([np.empty(0, dtype), new]) != dtype:
+            return False
+        header = io.BytesIO()
+        write_header = fmt.write_array_header_1_0 if version == (1, 0) else fmt.write_array_header_2_0
+        write_header(header, {"descr": fmt.dtype_to_descr(dtype), "fortran_order": False, "shape": (rows + len(new),)})
+        if len(header.getvalue()) != header_len:
+            return False
+        f.seek(header_len + rows * dtype.itemsize)
+        new = _text_array(new) if dtype.kind == "U" else new
+        f.write(np.ascontiguousarray(new.astype(dtype, copy=False)).tobytes())
+        f.truncate()
+        f.flush()
+        # Заголовок — последним: читатель без блокировки видит либо прежнюю длину, либо все данные
+        f.seek(0)
+        f.write(header.getvalue())
+    return True
+
+
+def append_rows(csv_path: str, raw: bytes) -> Tuple[Dict[str, Any], pd.DataFrame]:
+    """Дописывает строки CSV (raw — с заголовком) в конец файла данных и
+    продлевает колонки кэша под cache_lock. Разбирается и хэшируется только
+    новая часть, колонки продлеваются на месте. Возвращает (манифест, новые строки).
+    """
+    try:
+        added = pd.read_csv(io.BytesIO(raw))
+    except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as exc:
+        raise ValueError(f"Не удалось разобрать CSV: {exc}") from exc
+    added.columns = [str(c) for c in added.columns]
+    with cache_lock(csv_path):
+        manifest = load_manifest(csv_path) or _build_column_cache(csv_path)
+        names = [c["name"] for c in manifest["columns"]]
+        if set(added.columns) != set(names) or len(added.columns) != len(names):
+            raise ValueError(f"Колонки новых строк не совпадают с файлом: ожидаются {names}")
+        if added.empty:
+            return manifest, added
+
+        if list(added.columns) == names:
+            # Порядок совпадает — дописываем байты как есть, без переформатирования
+            body = raw.split(b"\n", 1)[1] if b"\n" in raw else b""
+            if body and not body.endswith(b"\n"):
+                body += b"\n"
+        else:
+            added = added[names]
+            body = added.to_csv(index=False, header=False).encode("utf-8")
+        with open(csv_path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    body = b"\n" + body
+            f.write(body)
+
+        # Если процесс прервётся раньше записи манифеста, штамп файла не совпадёт
+        # и кэш будет пересобран целиком при следующем чтении
+        cache_dir = cache_dir_for(csv_path)
+        suffix = _tmp_suffix()
+        rows = manifest["rows"]
+        columns = []
+        for idx, meta in enumerate(manifest["columns"]):
+            path = os.path.join(cache_dir, meta["file"])
+            new = _column_array(added.iloc[:, idx])
+            if _extend_npy(path, rows, new):
+                columns.append(meta)
+                continue
+            # Тип расширяется (целые -> дробные, числа -> текст, более длинные
+            # строки): колонка переписывается, ширина — по старым и новым значениям
+            old = np.load(path, mmap_mode="r")[:rows]
+            dtype = _final_dtype([old, new])
+            tmp = os.path.join(cache_dir, f"c{idx}.{suffix}.npy")
+            out = np.lib.format.open_memmap(tmp, mode="w+", dtype=dtype, shape=(rows + len(new),))
+            _cast_into(out, 0, old)
+            _cast_into(out, rows, new)
+            out.flush()
+            del out, old
+            os.replace(tmp, path)
+            columns.append({**meta, "dtype": dtype.str, "text": dtype.kind == "U"})
+
+        part_hash = hashlib.sha1(body).hexdigest()
+        manifest = {
+            **manifest,
+            **_file_stamp(csv_path),
+            "hash": hashlib.sha1(f"{manifest['hash']}:{part_hash}".encode("ascii")).hexdigest(),
+            "rows": rows + len(added),
+            "columns": columns,
+            "appends": manifest.get("appends", []) + [
+                {"parent": manifest["hash"], "rows": int(len(added)), "bytes": len(body), "sha1": part_hash}],
+        }
+        _write_json(os.path.join(cache_dir, MANIFEST_NAME), manifest)
+    return manifest, added
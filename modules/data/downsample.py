@@ -0,0 +1,88 @@
+"""Прореживание рядов для графиков.
+
+Браузеру не нужно больше точек, чем пикселей по ширине графика: ряд любой
+длины сводится к ~points точкам, сохраняющим форму кривой.
+lttb   — Largest-Triangle-Three-Buckets: из каждой корзины берётся точка,
+         дающая наибольший треугольник с соседями (гладкий вид кривой);
+minmax — минимум и максимум каждой корзины (все пики и провалы).
+Функции возвращают индексы отобранных строк, чтобы по ним же брать ось X.
+"""
+from __future__ import annotations
+
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+
+PLOT_POINTS = 2000
+METHODS = ("lttb", "minmax")
+
+
+def lttb_indices(y: np.ndarray, points: int, x: Optional[np.ndarray] = None) -> np.ndarray:
+    """Индексы точек по LTTB. Пропуски (NaN) не выбираются."""
+    y = np.asarray(y, dtype=float)
+    valid = np.flatnonzero(np.isfinite(y))
+    if valid.size <= max(points, 2):
+        return valid
+    xs = (np.asarray(x, dtype=float)[valid] if x is not None else valid.astype(float))
+    ys = y[valid]
+    n = valid.size
+    # Первая и последняя точки фиксированы, середина делится на points-2 корзины
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    starts, stops = edges[:-1], edges[1:]
+    # Средние по корзинам — «третья» вершина треугольника для предыдущей корзины
+    counts = stops - starts
+    avg_x = np.add.reduceat(xs[:n - 1], starts) / counts
+    avg_y = np.add.reduceat(ys[:n - 1], starts) / counts
+    avg_x = np.append(avg_x[1:], xs[-1])
+    avg_y = np.append(avg_y[1:], ys[-1])
+
+    out = np.empty(points, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for b, (lo, hi) in enumerate(zip(starts, stops)):
+        bx, by = xs[lo:hi], ys[lo:hi]
+        # Удвоенная площадь треугольника (a, кандидат, среднее следующей корзины)
+        area = np.abs((xs[a] - avg_x[b]) * (by - ys[a]) - (xs[a] - bx) * (avg_y[b] - ys[a]))
+        a = lo + int(np.argmax(area))
+        out[b + 1] = a
+    return valid[out]
+
+
+def minmax_indices(y: np.ndarray, points: int) -> np.ndarray:
+    """Индексы минимума и максимума в каждой из points/2 корзин равной длины."""
+    y = np.asarray(y, dtype=float)
+    n = y.shape[0]
+    if n <= max(points, 2):
+        return np.flatnonzero(np.isfinite(y))
+    buckets = max(1, points // 2)
+    size = -(-n // buckets)
+    pad = buckets * size - n
+    lo = np.concatenate([np.where(np.isfinite(y), y, np.inf), np.full(pad, np.inf)]).reshape(buckets, size)
+    hi = np.concatenate([np.where(np.isfinite(y), y, -np.inf), np.full(pad, -np.inf)]).reshape(buckets, size)
+    base = np.arange(buckets, dtype=np.int64) * size
+    idx = np.concatenate([base + lo.argmin(axis=1), base + hi.argmax(axis=1)])
+    idx = idx[idx < n]
+    return np.unique(idx[np.isfinite(y[idx])])
+
+
+def downsample_indices(columns: Sequence[np.ndarray], points: int = PLOT_POINTS, method: str = "lttb") -> np.ndarray:
+    """Общие индексы строк для нескольких колонок одной длины: объединение
+    отобранных по каждой колонке, плюс первая и последняя строка."""
+    if method not in METHODS:
+        raise ValueError(f"Неизвестный метод прореживания: {method}")
+    points = max(3, int(points))
+    n = len(columns[0]) if columns else 0
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+    if n <= points:
+        return np.arange(n, dtype=np.int64)
+    # Бюджет точек делится между колонками, чтобы ответ оставался ограниченным
+    per_column = max(3, points // max(1, len(columns)))
+    parts: List[np.ndarray] = [np.array([0, n - 1], dtype=np.int64)]
+    for col in columns:
+        if method == "lttb":
+            parts.append(lttb_indices(col, per_column))
+        else:
+            parts.append(minmax_indices(col, per_column))
+    return np.unique(np.concatenate(parts))
@@ -1,6 +1,16 @@
 import os
+import numpy as np
 import pandas as pd
-from typing import Dict, Any
+from typing import Callable, Dict, Any, Optional, Sequence, Tuple
+
+from modules.data.column_cache import ensure_column_cache, iter_columns, read_columns, read_column_array, data_file_hash
+from modules.data.downsample import PLOT_POINTS, downsample_indices
+from modules.data.preprocess import StreamingPreprocess
+from modules.storage.projects import load_snapshot_stage, save_snapshot_stage
+
+
+# Этапы, которые страница проекта дозагружает отдельными запросами
+SNAPSHOT_STAGES = ("preview", "sample", "preprocess", "train")
 
 
 def save_uploaded_csv(file_storage, base_dir: str, project_id: str) -> tuple[str, bool]:
@@ -15,15 +25,40 @@ def save_uploaded_csv(file_storage, base_dir: str, project_id: str) -> tuple[str
     return filepath, file_exists
 
 
-def dataframe_preview(csv_path: str, max_rows: int = 5) -> Dict[str, Any]:
-    df = pd.read_csv(csv_path)
-    head = df.head(max_rows)
+def _merge_dtype(a, b):
+    # Тип колонки по всему файлу, как его вывел бы pandas при чтении целиком
+    if a is None or a == b:
+        return b
+    if a.kind in "iuf" and b.kind in "iuf":
+        return np.result_type(a, b)
+    return np.dtype(object)
+
+
+def dataframe_preview(csv_path: str, max_rows: int = 5, chunksize: int = 100_000) -> Dict[str, Any]:
+    """Предпросмотр за один потоковый проход: в памяти только текущая часть файла."""
+    head = None
+    rows = 0
+    dtypes: Dict[str, Any] = {}
+    na_counts: Dict[str, int] = {}
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        if head is None:
+            head = chunk.head(max_rows)
+            dtypes = {col: None for col in chunk.columns}
+            na_counts = {col: 0 for col in chunk.columns}
+        rows += len(chunk)
+        for col, dtype in chunk.dtypes.items():
+            dtypes[col] = _merge_dtype(dtypes[col], dtype)
+        for col, cnt in chunk.isna().sum().items():
+            na_counts[col] += int(cnt)
+    for col, dtype in dtypes.items():
+        if head[col].dtype != dtype:
+            head[col] = head[col].astype(dtype)
     info = {
-        "rows": int(df.shape[0]),
-        "columns": int(df.shape[1]),
-        "column_names": list(df.columns.astype(str)),
-        "dtypes": {col: str(dtype) for col, dtype in df.dtypes.items()},
-        "na_counts": {col: int(df[col].isna().sum()) for col in df.columns},
+        "rows": int(rows),
+        "columns": int(head.shape[1]),
+        "column_names": list(head.columns.astype(str)),
+        "dtypes": {col: str(dtype) for col, dtype in dtypes.items()},
+        "na_counts": na_counts,
     }
     return {
         "head": head.to_dict(orient="records"),
@@ -31,10 +66,22 @@ def dataframe_preview(csv_path: str, max_rows: int = 5) -> Dict[str, Any]:
     }
 
 
+def extend_preview(preview: Dict[str, Any], added: pd.DataFrame) -> Dict[str, Any]:
+    """Предпросмотр после дописывания строк: счётчики и типы обновляются
+    по новым строкам, первые строки файла не меняются."""
+    info = dict(preview["info"])
+    dtypes = {col: np.dtype(dt) for col, dt in info["dtypes"].items()}
+    na_counts = dict(info["na_counts"])
+    for col, dtype in added.dtypes.items():
+        dtypes[col] = _merge_dtype(dtypes.get(col), dtype)
+    for col, cnt in added.isna().sum().items():
+        na_counts[col] = na_counts.get(col, 0) + int(cnt)
+    info.update(rows=int(info["rows"]) + len(added), dtypes={col: str(dt) for col, dt in dtypes.items()}, na_counts=na_counts)
+    return {**preview, "info": info}
+
+
 def sample_columns(csv_path: str, columns: list[str], limit: int = 1000) -> Dict[str, Any]:
-    usecols = columns if columns else None
-    df = pd.read_csv(csv_path, usecols=usecols)
-    sample = df.head(limit)
+    sample = read_columns(csv_path, columns, limit=limit)
     return {
         "records": sample.to_dict(orient="records"),
         "columns": list(sample.columns.astype(str)),
@@ -42,6 +89,41 @@ def sample_columns(csv_path: str, columns: list[str], limit: int = 1000) -> Dict
     }
 
 
+def plot_columns(csv_path: str, columns: list[str], points: int = PLOT_POINTS, start: Optional[int] = None,
+                 stop: Optional[int] = None, method: str = "lttb", axis: Optional[str] = None) -> Dict[str, Any]:
+    """Ряды для графика по всему файлу (или строкам [start, stop)), прореженные
+    до ~points точек по числовым колонкам. Текстовые колонки и колонка оси
+    axis (время) берутся в тех же строках. В records есть _row — номер строки
+    в файле, по нему страница запрашивает участок при приближении.
+    """
+    columns = list(dict.fromkeys(columns))
+    arrays = {c: read_column_array(csv_path, c) for c in columns}
+    total = len(next(iter(arrays.values()))) if arrays else 0
+    lo = max(0, min(total, start or 0))
+    hi = max(lo, min(total, total if stop is None else stop))
+    numeric = [arr[lo:hi] for col, arr in arrays.items() if arr.dtype.kind in "iufb" and col != axis]
+    if numeric:
+        rows = lo + downsample_indices([np.asarray(a, dtype=float) for a in numeric], points, method)
+    else:
+        rows = np.arange(lo, hi, dtype=np.int64)[:max(1, points)]
+    data: Dict[str, Any] = {"_row": rows}
+    for col, arr in arrays.items():
+        values = pd.Series(arr[rows])
+        if arr.dtype.kind == "U":
+            values = values.where(values != "", None)
+        data[col] = values.astype(object).where(values.notna(), None)
+    frame = pd.DataFrame(data)
+    return {
+        "columns": list(columns) + ["_row"],
+        "records": frame.to_dict(orient="records"),
+        "size": int(hi - lo),
+        "start": int(lo),
+        "stop": int(hi),
+        "rows": int(total),
+        "method": method,
+    }
+
+
 def restore_preview_from_metadata(project_id: str, data_path: str) -> Dict[str, Any]:
     """Восстанавливает preview данных из файла"""
     return dataframe_preview(data_path)
@@ -55,100 +137,105 @@ def restore_selection_from_metadata(project_id: str, data_path: str, target: str
     if time:
         cols.append(time)
     cols.extend([c for c in features if c and c != target])
-    return sample_columns(data_path, cols)
-
-
-def restore_preprocess_from_metadata(project_id: str, data_path: str, target: str, method: str, time_col: str) -> Dict[str, Any]:
-    """Восстанавливает результаты предобработки из файла"""
-    from modules.data.preprocess import preprocess_pipeline
-    import pandas as pd
-    
-    df_info = sample_columns(data_path, [target, time_col])
-    df = pd.DataFrame(df_info["records"])
-    out = preprocess_pipeline(df, target=target, method=method)
-    seg = out["segment"].to_dict(orient="records")
-    
-    return {
-        "segment": {"columns": list(out["segment"].columns), "records": seg}, 
-        "bounds": out["bounds"], 
-        "curve": out["curve"]
-    }
-
-
-def restore_train_from_metadata(project_id: str, data_path: str, target: str, model_config: Dict[str, Any]) -> Dict[str, Any]:
-    """Восстанавливает результаты обучения из файла"""
-    from modules.models.tf_models import ModelConfig, train_and_predict
-    import pandas as pd
-    import os
-    
-    # Загружаем данные
-    df = pd.read_csv(data_path, usecols=[target])
-    series = df[target].astype(float).to_numpy()
-    
-    # Создаем конфигурацию модели
-    cfg = ModelConfig(
-        model_type=model_config.get("model", "mlp"),
-        window=model_config.get("window", 32),
-        horizon=model_config.get("horizon", 12),
-        epochs=model_config.get("epochs", 5)
-    )
-    
-    # Получаем путь к артефактам
-    artifacts_dir = os.path.join(os.path.dirname(data_path), "artifacts")
-    os.makedirs(artifacts_dir, exist_ok=True)
-    
-    # Обучаем модель
-    out = train_and_predict(series, cfg, save_dir=artifacts_dir)
-    
-    return {
-        "loss": out['loss'], 
-        "prediction": out['prediction'], 
-        "cfg": model_config
+    data = sample_columns(data_path, cols)
+    data["plot"] = plot_columns(data_path, cols, axis=time)
+    return data
+
+
+def preprocess_file(data_path: str, target: str, method: str, time_col: Optional[str] = None,
+                    progress: Optional[Callable[[float], None]] = None, pcts: Sequence[float] = (),
+                    state: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Предобработка по всему файлу: колонки читаются из кэша частями
+    (StreamingPreprocess). progress(доля прочитанных строк) — после каждой части.
+    pcts — пороги дополнительных кривых длительности. state — состояние
+    прошлого прохода (StreamingPreprocess.snapshot): читаются только строки
+    после state["rows"]. Возвращает (результат, новое состояние)."""
+    columns = [c for c in (target, time_col) if c]
+    if state is not None:
+        stream = StreamingPreprocess.restore(state)
+        start = int(state["rows"])
+    else:
+        stream = StreamingPreprocess(target, method=method, pcts=pcts)
+        start = 0
+    total = max(1, ensure_column_cache(data_path)["rows"] - start)
+    done = 0
+    for chunk in iter_columns(data_path, columns, start=start):
+        stream.update(chunk)
+        done += len(chunk)
+        if progress:
+            progress(done / total)
+    out = stream.result()
+    result = {
+        "segment": {"columns": list(out["segment"].columns), "records": out["segment"].to_dict(orient="records")},
+        "bounds": out["bounds"],
+        "bounds_count": out["bounds_count"],
+        "rows": out["rows"],
+        "curve": out["curve"],
     }
-
-
-def restore_full_snapshot_from_metadata(project_id: str, metadata: Dict[str, Any], data_path: str, snapshot:  Dict[str, Any] = {}) -> Dict[str, Any]:
-    """Восстанавливает полный снапшот из метаданных"""
-    
-    # Восстанавливаем preview
-    if metadata.get("has_preview") and not snapshot.get("preview"):
-        snapshot["preview"] = restore_preview_from_metadata(project_id, data_path)
-    
-    if metadata.get("time") and not snapshot.get("time"):
-        time_meta = metadata["time"]
-        snapshot["time"] = time_meta
-    
-    if metadata.get("selection") and not snapshot.get("selection"):
-        selection_meta = metadata["selection"]
-        snapshot["selection"] = selection_meta
-
-    # Восстанавливаем selection
-    if metadata.get("selection") and not snapshot.get("sample"):
-        snapshot["sample"] = restore_selection_from_metadata(
-            project_id, data_path, 
-            selection_meta.get("target"), 
-            selection_meta.get("features", []),
-            time_meta.get("column")
-        )
-    
-    # Восстанавливаем preprocess
-    if metadata.get("preprocess") and not snapshot.get("preprocess"):
-        preprocess_meta = metadata["preprocess"]
-        snapshot["preprocess"] = restore_preprocess_from_metadata(
-            project_id, data_path,
-            preprocess_meta.get("target"),
-            preprocess_meta.get("method", "cusum"),
-            metadata["time"].get("column")
-        )
-    
-    # Восстанавливаем train
-    if metadata.get("train") and not snapshot.get("train"):
-        train_meta = metadata["train"]
-        snapshot["train"] = restore_train_from_metadata(
-            project_id, data_path,
-            train_meta.get("target"),
-            train_meta.get("cfg", {})
-        )
-    
-    return snapshot
-
+    if "curves" in out:
+        result["curves"] = out["curves"]
+    return result, stream.snapshot()
+
+
+def stage_config(stage: str, metadata: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Входные параметры этапа (None — этап не выполнялся)."""
+    metadata = metadata or {}
+    time_col = (metadata.get("time") or {}).get("column")
+    if stage == "preview":
+        return {} if metadata.get("has_preview") else None
+    if stage == "sample":
+        sel = metadata.get("selection")
+        return {"target": sel.get("target"), "features": sel.get("features", []), "time": time_col} if sel else None
+    if stage == "preprocess":
+        pp = metadata.get("preprocess")
+        if not pp:
+            return None
+        cfg = {"target": pp.get("target"), "method": pp.get("method", "cusum"), "time": time_col}
+        if pp.get("pcts"):
+            cfg["pcts"] = pp["pcts"]
+        return cfg
+    if stage == "train":
+        return metadata.get("train")
+    raise ValueError(f"Неизвестный этап: {stage}")
+
+
+def stage_source(data_path: str, cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """Ключ результата этапа: хэш файла данных и параметры этапа."""
+    return {"data": data_file_hash(data_path), "cfg": cfg}
+
+
+def snapshot_outline(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Лёгкая часть снапшота для рендера страницы: метаданные и список этапов для дозагрузки"""
+    metadata = metadata or {}
+    outline: Dict[str, Any] = {"stages": [s for s in SNAPSHOT_STAGES if stage_config(s, metadata) is not None]}
+    if metadata.get("time"):
+        outline["time"] = metadata["time"]
+    if metadata.get("selection"):
+        outline["selection"] = metadata["selection"]
+    return outline
+
+
+def restore_snapshot_stage(project_id: str, stage: str, metadata: Dict[str, Any], data_path: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Результат этапа для страницы: сохранённый, если ключ совпадает, иначе пересчитанный.
+    Тяжёлые этапы (предобработка по всему файлу, обучение) здесь не запускаются:
+    для preprocess и train отдаётся сохранённое с пометкой stale, пересчёт — задачей.
+    """
+    cfg = stage_config(stage, metadata)
+    stored = load_snapshot_stage(project_id, stage)
+    if cfg is None or not data_path or not os.path.exists(data_path):
+        return stored
+    source = stage_source(data_path, cfg)
+    if stored is not None and stored.get("source") == source:
+        return stored
+    if stage in ("preprocess", "train"):
+        if stored is not None:
+            stored["stale"] = True
+        return stored
+
+    if stage == "preview":
+        data = restore_preview_from_metadata(project_id, data_path)
+    else:
+        data = restore_selection_from_metadata(project_id, data_path, cfg["target"], cfg["features"], cfg["time"])
+    data["source"] = source
+    save_snapshot_stage(project_id, stage, data)
+    return data
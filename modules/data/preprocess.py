@@ -1,9 +1,20 @@
 from __future__ import annotations
 
-from typing import Dict, Any, Tuple, List
+from collections import deque
+from typing import Dict, Any, Iterable, Iterator, Sequence, Tuple, List
 import numpy as np
 import pandas as pd
 
+from modules.data.downsample import PLOT_POINTS, downsample_indices
+
+
+# Сколько последних границ CUSUM хранить при проходе по всему файлу
+MAX_BOUNDS = 1000
+# Сколько порогов кривой длительности можно запросить за один проход
+MAX_PCTS = 8
+# Сколько строк StreamingFill держит, ожидая первое значение пустой колонки
+FILL_MAX_PENDING = 1_000_000
+
 
 def fill_missing(df: pd.DataFrame) -> pd.DataFrame:
     # Простая стратегия: forward fill, затем backward fill, затем средним
@@ -18,28 +29,197 @@ def fill_missing(df: pd.DataFrame) -> pd.DataFrame:
     return filled
 
 
+def _json_values(values: Dict[str, Any]) -> Dict[str, Any]:
+    # Скаляры numpy — в числа/строки Python, NaN — в None
+    return {k: None if pd.isna(v) else (v.item() if hasattr(v, "item") else v) for k, v in values.items()}
+
+
+class StreamingFill:
+    """fill_missing для таблицы, читаемой частями, с тем же результатом.
+
+    Forward fill переносит последнее значение колонки в следующую часть.
+    Начальные пропуски (backward fill) ждут в буфере, пока в каждой колонке
+    не встретится первое значение. Колонки без единого значения остаются
+    пустыми, как и в fill_missing (их среднее — NaN).
+    Буфер ограничен max_pending строками: если колонка пуста дольше, её
+    начальные пропуски остаются пустыми (отличие от fill_missing только
+    для колонок, значения в которых появляются позже max_pending строк).
+    """
+
+    def __init__(self, max_pending: int = FILL_MAX_PENDING):
+        self.max_pending = max_pending
+        self.last: Dict[str, Any] = {}
+        self.first: Dict[str, Any] = {}
+        self._pending: List[pd.DataFrame] = []
+        self._pending_rows = 0
+
+    def update(self, chunk: pd.DataFrame) -> List[pd.DataFrame]:
+        """Заполняет очередную часть; возвращает части, готовые к выдаче."""
+        filled = chunk.ffill()
+        for col in filled.columns:
+            if col in self.last:
+                filled[col] = filled[col].fillna(self.last[col])
+            valid = filled[col].dropna()
+            if not valid.empty:
+                self.first.setdefault(col, valid.iloc[0])
+                self.last[col] = valid.iloc[-1]
+        self._pending.append(filled)
+        self._pending_rows += len(filled)
+        if len(self.first) < len(filled.columns):
+            if self._pending_rows <= self.max_pending:
+                return []
+            # Буфер полон: пустые пока колонки больше не ждём
+            for col in filled.columns:
+                self.first.setdefault(col, np.nan)
+        return self.finish()
+
+    def finish(self) -> List[pd.DataFrame]:
+        # Оставшиеся пропуски — только начальные: заполняем первым значением колонки
+        ready = [p.fillna(self.first) for p in self._pending]
+        self._pending = []
+        self._pending_rows = 0
+        return ready
+
+    def stream(self, chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        for chunk in chunks:
+            yield from self.update(chunk)
+        yield from self.finish()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Перенос значений между частями (после finish буфер пуст)."""
+        return {"last": _json_values(self.last), "first": _json_values(self.first)}
+
+    @classmethod
+    def restore(cls, state: Dict[str, Any]) -> "StreamingFill":
+        fill = cls()
+        fill.last = {k: np.nan if v is None else v for k, v in state.get("last", {}).items()}
+        fill.first = {k: np.nan if v is None else v for k, v in state.get("first", {}).items()}
+        return fill
+
+
 def select_last_segment(df: pd.DataFrame, length: int = 200) -> pd.DataFrame:
     if len(df) <= length:
         return df.copy()
     return df.iloc[-length:].copy()
 
 
+class CusumDetector:
+    """Онлайн-CUSUM: ряд подаётся частями, состояние переносится между ними.
+
+    Сразу после тревоги ряд проходится коротким скалярным циклом, дальше —
+    векторно блоками растущего размера (рекурсия max(0, s + d) сводится
+    к cumsum и накопленному минимуму), так что длинные участки без границ
+    не идут через Python-цикл.
+    Если начальное среднее не задано, оно берётся по первой части ряда
+    (select_cusum_segment берёт среднее по анализируемому окну целиком,
+    поэтому до первой тревоги границы могут отличаться).
+    """
+
+    history = 100
+    min_block = 64
+    max_block = 65536
+
+    def __init__(self, k: float = 0.5, h: float = 5.0, mean: float | None = None):
+        self.k = float(k)
+        self.h = float(h)
+        self.mean = None if mean is None else float(mean)
+        self.s_pos = 0.0
+        self.s_neg = 0.0
+        self.count = 0
+        self.last_bound: int | None = None
+        self._tail = np.empty(0, dtype=float)
+
+    def _scan_scalar(self, vals: List[float], base: int, pos: int, end: int) -> int | None:
+        # Короткий поэлементный проход: дешевле векторного, когда тревоги идут часто
+        s_pos, s_neg, mean, k, h = self.s_pos, self.s_neg, self.mean, self.k, self.h
+        for j in range(pos, end):
+            v = vals[base + j]
+            s_pos = max(0.0, s_pos + (v - mean - k))
+            s_neg = min(0.0, s_neg + (v - mean + k))
+            if s_pos > h or s_neg < -h:
+                return j
+        self.s_pos, self.s_neg = s_pos, s_neg
+        return None
+
+    def _scan_vector(self, x: np.ndarray, pos: int, end: int) -> int | None:
+        d = x[pos:end] - self.mean
+        cp = self.s_pos + np.cumsum(d - self.k)
+        cn = self.s_neg + np.cumsum(d + self.k)
+        s_pos = cp - np.minimum(np.minimum.accumulate(cp), 0.0)
+        s_neg = cn - np.maximum(np.maximum.accumulate(cn), 0.0)
+        hit = np.flatnonzero((s_pos > self.h) | (s_neg < -self.h))
+        if hit.size:
+            return pos + int(hit[0])
+        self.s_pos = float(s_pos[-1])
+        self.s_neg = float(s_neg[-1])
+        return None
+
+    def update(self, chunk) -> List[int]:
+        """Обрабатывает очередную часть ряда, возвращает новые границы (глобальные индексы)."""
+        x = np.asarray(chunk, dtype=float).ravel()
+        n = x.shape[0]
+        if n == 0:
+            return []
+        if self.mean is None:
+            self.mean = float(np.mean(x))
+        buf = np.concatenate([self._tail, x])
+        vals = buf.tolist()
+        base = self._tail.shape[0]
+        bounds: List[int] = []
+        pos = 0
+        while pos < n:
+            end = min(n, pos + self.min_block)
+            j = self._scan_scalar(vals, base, pos, end)
+            block = self.min_block
+            while j is None and end < n:
+                pos = end
+                block = min(block * 2, self.max_block)
+                end = min(n, pos + block)
+                j = self._scan_vector(x, pos, end)
+            if j is None:
+                break
+            bounds.append(self.count + j)
+            self.s_pos = 0.0
+            self.s_neg = 0.0
+            window = vals[max(0, base + j - self.history): base + j + 1]
+            self.mean = sum(window) / len(window)
+            pos = j + 1
+        self.count += n
+        self._tail = buf[-self.history:].copy()
+        if bounds:
+            self.last_bound = bounds[-1]
+        return bounds
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Состояние детектора в виде JSON-совместимого словаря."""
+        return {
+            "k": self.k,
+            "h": self.h,
+            "mean": self.mean,
+            "s_pos": self.s_pos,
+            "s_neg": self.s_neg,
+            "count": self.count,
+            "last_bound": self.last_bound,
+            "tail": self._tail.tolist(),
+        }
+
+    @classmethod
+    def restore(cls, state: Dict[str, Any]) -> "CusumDetector":
+        det = cls(k=state.get("k", 0.5), h=state.get("h", 5.0), mean=state.get("mean"))
+        det.s_pos = float(state.get("s_pos", 0.0))
+        det.s_neg = float(state.get("s_neg", 0.0))
+        det.count = int(state.get("count", 0))
+        det.last_bound = state.get("last_bound")
+        det._tail = np.asarray(state.get("tail", []), dtype=float)
+        return det
+
+
 def cusum_bounds(series: pd.Series, k: float = 0.5, h: float = 5.0) -> List[int]:
     # CUSUM для обнаружения сдвигов среднего, возвращаем индексы границ
     x = series.astype(float).to_numpy()
-    s_pos = 0.0
-    s_neg = 0.0
-    mean = np.mean(x)
-    bounds: List[int] = []
-    for i in range(len(x)):
-        s_pos = max(0.0, s_pos + (x[i] - mean - k))
-        s_neg = min(0.0, s_neg + (x[i] - mean + k))
-        if s_pos > h or s_neg < -h:
-            bounds.append(i)
-            s_pos = 0.0
-            s_neg = 0.0
-            mean = np.mean(x[max(0, i - 100): i + 1])
-    return bounds
+    if len(x) == 0:
+        return []
+    return CusumDetector(k=k, h=h, mean=np.mean(x)).update(x)
 
 
 def select_cusum_segment(df: pd.DataFrame, target: str, back_window: int = 600) -> Tuple[pd.DataFrame, List[int]]:
@@ -54,46 +234,311 @@ def select_cusum_segment(df: pd.DataFrame, target: str, back_window: int = 600)
     return seg, bnds
 
 
+# Сколько следующих элементов проверяется сразу для всех стартов; цепочки длиннее
+# добираются поиском блоками удваивающейся длины
+DURATION_LOOKAHEAD = 8
+
+
+def _band(arr: np.ndarray, pct: float) -> Tuple[np.ndarray, np.ndarray]:
+    # Те же операции, что и для одного стартового значения: start * (1 -+ pct)
+    with np.errstate(invalid="ignore"):  # inf * 0 при pct = 1 -> NaN, как и для float
+        return arr * (1 - pct), arr * (1 + pct)
+
+
+def _first_violation(arr: np.ndarray, lo: float, hi: float, pos: int) -> int:
+    """Первый индекс >= pos со значением вне [lo, hi] или пропуском; len(arr), если его нет."""
+    n = arr.shape[0]
+    block = 64
+    while pos < n:
+        seg = arr[pos:pos + block]
+        bad = np.flatnonzero(~((lo <= seg) & (seg <= hi)))
+        if bad.size:
+            return pos + int(bad[0])
+        pos += seg.shape[0]
+        block *= 2
+    return n
+
+
+def _duration_runs(arr: np.ndarray, pct: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Цепочки change_duration_curve: массивы стартов и концов (индекс первого
+    элемента вне полосы старта; len(arr) — цепочка дошла до конца ряда).
+
+    Конец цепочки для каждого возможного старта ищется сразу по всем стартам
+    масками нарушения полосы на сдвигах 1..DURATION_LOOKAHEAD; по цепочке
+    проходит только цикл по стартам, длинные цепочки добираются поиском
+    блоками. Время — линейное по длине ряда.
+    """
+    n = arr.shape[0]
+    if n == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    lo, hi = _band(arr, pct)
+    idx = np.arange(n, dtype=np.int64)
+    # Стартовое значение вне собственной полосы (отрицательное, пропуск) — цепочка длины 0
+    end = np.where((lo <= arr) & (arr <= hi), -1, idx)
+    for shift in range(1, min(DURATION_LOOKAHEAD, n - 1) + 1):
+        nxt = arr[shift:]
+        open_ = end[:-shift] < 0
+        broken = open_ & ~((lo[:-shift] <= nxt) & (nxt <= hi[:-shift]))
+        end[:-shift][broken] = idx[:-shift][broken] + shift
+    # Не оборвавшиеся в пределах окна и проверенные до конца ряда — дошли до конца
+    end[(end < 0) & (idx + DURATION_LOOKAHEAD >= n - 1)] = n
+    # Следующий непропущенный элемент: пропуск не начинает цепочку
+    valid = ~np.isnan(arr)
+    next_valid = np.where(valid, idx, n)
+    next_valid = np.minimum.accumulate(next_valid[::-1])[::-1].tolist()
+
+    ends = end.tolist()
+    starts_out: List[int] = []
+    ends_out: List[int] = []
+    i = next_valid[0]
+    while i < n:
+        j = ends[i]
+        if j < 0:
+            j = _first_violation(arr, lo[i], hi[i], i + DURATION_LOOKAHEAD + 1)
+        starts_out.append(i)
+        ends_out.append(j)
+        i = j if j > i else i + 1
+        if i < n:
+            i = next_valid[i]
+    return np.asarray(starts_out, dtype=np.int64), np.asarray(ends_out, dtype=np.int64)
+
+
+def _duration_points(arr: np.ndarray, starts: np.ndarray, ends: np.ndarray, start_values=None) -> Tuple[np.ndarray, np.ndarray]:
+    """Точки кривой для оборвавшихся цепочек (ends < len(arr)): x — индекс обрыва,
+    y — длина со знаком направления (0, если цепочку оборвал пропуск).
+    start_values — стартовые значения, если они не из arr."""
+    stop = arr[ends]
+    start = arr[starts] if start_values is None else start_values
+    sign = np.where(np.isnan(stop), 0, np.where(stop > start, 1, -1))
+    return ends, sign * (ends - starts)
+
+
+def _duration_curve(arr: np.ndarray, pct: float) -> Tuple[np.ndarray, np.ndarray]:
+    n = arr.shape[0]
+    starts, ends = _duration_runs(arr, pct)
+    closed = ends < n
+    # Цепочка, дошедшая до конца ряда, отмечается последним индексом с нулевой длиной
+    x = np.full(ends.shape[0], n - 1, dtype=np.int64)
+    y = np.zeros(ends.shape[0], dtype=np.int64)
+    x[closed], y[closed] = _duration_points(arr, starts[closed], ends[closed])
+    return x, y
+
+
 def change_duration_curve(series: pd.Series, pct: float = 0.05) -> Dict[str, Any]:
     # y: длина цепочки подряд идущих значений в пределах +-pct от стартового
     # знак y зависит от направления изменения: положит., если текущее > стартового; отрицат., если ниже
-    x_marks: List[int] = []
-    y_vals: List[int] = []
+    x, y = _duration_curve(series.astype(float).to_numpy(), pct)
+    return {"x": x.tolist(), "y": y.tolist()}
+
+
+def change_duration_curves(series: pd.Series, pcts: Iterable[float]) -> List[Dict[str, Any]]:
+    """change_duration_curve для нескольких порогов по одному разбору ряда:
+    [{"pct", "x", "y"}, ...] в порядке pcts."""
     arr = series.astype(float).to_numpy()
-    n = len(arr)
-    i = 0
-    while i < n:
-        start = arr[i]
-        if np.isnan(start):
-            i += 1
-            continue
-        limit_low = start * (1 - pct)
-        limit_high = start * (1 + pct)
-        j = i
-        while j < n and not np.isnan(arr[j]) and (limit_low <= arr[j] <= limit_high):
-            j += 1
-        length = j - i
-        if j < n and not np.isnan(arr[j]):
-            sign = 1 if arr[j] > start else -1
-        else:
-            sign = 0
-        x_marks.append(j if j < n else n - 1)
-        y_vals.append(sign * length)
-        i = max(j, i + 1)
-    return {"x": x_marks, "y": y_vals}
-
-
-def preprocess_pipeline(df: pd.DataFrame, target: str, method: str = "cusum") -> Dict[str, Any]:
-    clean = fill_missing(df)
-    if method == "last":
-        seg = select_last_segment(clean, 200)
-        bounds = []
-    else:
-        seg, bounds = select_cusum_segment(clean, target=target)
-    curve = change_duration_curve(seg[target]) if target in seg.columns else {"x": [], "y": []}
-    return {
-        "segment": seg,
-        "bounds": bounds,
-        "curve": curve,
-    }
+    out = []
+    for p in pcts:
+        x, y = _duration_curve(arr, p)
+        out.append({"pct": float(p), "x": x.tolist(), "y": y.tolist()})
+    return out
+
+
+class ChangeDurationCurve:
+    """change_duration_curve для ряда, подаваемого частями: незакрытая
+    цепочка (стартовое значение и длина) переносится в следующую часть.
+    Точки кривой копятся массивами по частям, результат — как у
+    change_duration_curve на всём ряде.
+    """
+
+    def __init__(self, pct: float = 0.05):
+        self.pct = float(pct)
+        self.count = 0
+        self.start: float | None = None
+        self.length = 0
+        self._x: List[np.ndarray] = []
+        self._y: List[np.ndarray] = []
+
+    def update(self, chunk) -> None:
+        arr = np.asarray(chunk, dtype=float).ravel()
+        n = arr.shape[0]
+        pos = 0
+        if self.start is not None and n:
+            # Сначала продолжаем цепочку из прошлой части
+            lo, hi = self.start * (1 - self.pct), self.start * (1 + self.pct)
+            j = _first_violation(arr, lo, hi, 0)
+            if j == n:
+                self.length += n
+                self.count += n
+                return
+            x, y = _duration_points(arr, np.array([-self.length]), np.array([j]), self.start)
+            self._x.append(self.count + x)
+            self._y.append(y)
+            # Элемент обрыва — старт следующей цепочки (длина открытой цепочки всегда > 0)
+            self.start, self.length, pos = None, 0, j
+        rest = arr[pos:]
+        starts, ends = _duration_runs(rest, self.pct)
+        closed = ends < rest.shape[0]
+        if closed.any():
+            x, y = _duration_points(rest, starts[closed], ends[closed])
+            self._x.append(self.count + pos + x)
+            self._y.append(y)
+        if ends.size and not closed[-1]:
+            # Дошедшая до конца части цепочка переносится в следующую
+            self.start = float(rest[starts[-1]])
+            self.length = rest.shape[0] - int(starts[-1])
+        self.count += n
+
+    def finish(self) -> Dict[str, np.ndarray]:
+        """{"x", "y"} массивами; незакрытая цепочка закрывается только в
+        результате, поэтому ряд можно продолжать подавать и после finish."""
+        x = np.concatenate(self._x) if self._x else np.empty(0, dtype=np.int64)
+        y = np.concatenate(self._y) if self._y else np.empty(0, dtype=np.int64)
+        self._x, self._y = [x], [y]
+        if self.start is not None:
+            x = np.append(x, self.count - 1)
+            y = np.append(y, 0)
+        return {"x": x, "y": y}
 
+    def snapshot(self) -> Dict[str, Any]:
+        self.finish()  # склеивает закрытые точки в один массив
+        return {"pct": self.pct, "count": self.count, "start": self.start, "length": self.length,
+                "x": self._x[0].tolist(), "y": self._y[0].tolist()}
+
+    @classmethod
+    def restore(cls, state: Dict[str, Any]) -> "ChangeDurationCurve":
+        curve = cls(state["pct"])
+        curve.count = int(state["count"])
+        curve.start = state.get("start")
+        curve.length = int(state.get("length", 0))
+        curve._x = [np.asarray(state.get("x", []), dtype=np.int64)]
+        curve._y = [np.asarray(state.get("y", []), dtype=np.int64)]
+        return curve
+
+
+def parse_pcts(value: Any) -> List[float]:
+    """Пороги кривой длительности из запроса: список долей в (0, 1], не больше MAX_PCTS."""
+    if value is None or value == "":
+        return []
+    items = value.split(",") if isinstance(value, str) else value
+    if not isinstance(items, (list, tuple)):
+        raise ValueError("pcts должен быть списком")
+    try:
+        pcts = [float(v) for v in items]
+    except (TypeError, ValueError):
+        raise ValueError("pcts должен содержать числа")
+    if len(pcts) > MAX_PCTS:
+        raise ValueError(f"Не больше {MAX_PCTS} порогов")
+    if any(not (0 < p <= 1) for p in pcts):
+        raise ValueError("Порог должен быть в (0, 1]")
+    return list(dict.fromkeys(pcts))
+
+
+def _curve_plot(full: Dict[str, np.ndarray], points: int) -> Dict[str, Any]:
+    keep = downsample_indices([full["y"]], points, method="minmax") if full["y"].size else np.empty(0, dtype=np.int64)
+    return {"x": full["x"][keep].tolist(), "y": full["y"][keep].tolist(), "points": int(full["y"].size)}
+
+
+class StreamingPreprocess:
+    """Предобработка ряда, читаемого частями (память — одна часть плюс
+    back_window строк); состояние переносится между частями.
+
+    Пропуски заполняются StreamingFill, CUSUM идёт по всему ряду с переносом
+    состояния, сегмент — от последней границы, если она в последних
+    back_window строках, иначе последние 200. Кривая длительности считается
+    по всему ряду; если заданы pcts, за тот же проход строятся кривые для
+    каждого порога.
+    snapshot()/restore() сохраняют состояние после прохода: после дописывания
+    строк в файл проход продолжается с них, история повторно не читается.
+    Начальное среднее CUSUM берётся по первой части ряда (см. CusumDetector).
+    """
+
+    def __init__(self, target: str, method: str = "cusum", back_window: int = 600,
+                 pct: float = 0.05, pcts: Sequence[float] = ()):
+        self.target = target
+        self.back_window = back_window
+        self.pcts = list(pcts)
+        self.filler = StreamingFill()
+        self.detector = CusumDetector() if method != "last" else None
+        self.curve = ChangeDurationCurve(pct)
+        self.extra = {p: ChangeDurationCurve(p) for p in self.pcts if p != self.curve.pct}
+        self.bounds: deque = deque(maxlen=MAX_BOUNDS)
+        self.bounds_count = 0
+        self.window_df: pd.DataFrame | None = None
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        for filled in self.filler.update(chunk):
+            self._consume(filled)
+
+    def _consume(self, chunk: pd.DataFrame) -> None:
+        if self.target not in chunk.columns:
+            raise ValueError(f"Колонка не найдена: {self.target}")
+        values = chunk[self.target].to_numpy(dtype=float)
+        self.curve.update(values)
+        for tracker in self.extra.values():
+            tracker.update(values)
+        if self.detector is not None:
+            found = self.detector.update(values)
+            self.bounds.extend(found)
+            self.bounds_count += len(found)
+        window_df = chunk if self.window_df is None else pd.concat([self.window_df, chunk])
+        self.window_df = window_df.iloc[-self.back_window:].reset_index(drop=True)
+
+    def _flush(self) -> None:
+        for filled in self.filler.finish():
+            self._consume(filled)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Состояние в виде JSON-совместимого словаря (для продолжения после дописывания строк)."""
+        self._flush()
+        window = self.window_df if self.window_df is not None else pd.DataFrame()
+        return {
+            "target": self.target,
+            "back_window": self.back_window,
+            "pcts": self.pcts,
+            "rows": self.curve.count,
+            "fill": self.filler.snapshot(),
+            "cusum": self.detector.snapshot() if self.detector is not None else None,
+            "curves": [c.snapshot() for c in (self.curve, *self.extra.values())],
+            "bounds": list(self.bounds),
+            "bounds_count": self.bounds_count,
+            "window": {c: window[c].astype(object).where(window[c].notna(), None).tolist() for c in window.columns},
+        }
+
+    @classmethod
+    def restore(cls, state: Dict[str, Any]) -> "StreamingPreprocess":
+        curves = [ChangeDurationCurve.restore(c) for c in state["curves"]]
+        stream = cls(state["target"], back_window=state["back_window"], pct=curves[0].pct, pcts=state.get("pcts", []))
+        stream.filler = StreamingFill.restore(state["fill"])
+        stream.detector = CusumDetector.restore(state["cusum"]) if state.get("cusum") is not None else None
+        stream.curve = curves[0]
+        stream.extra = {c.pct: c for c in curves[1:]}
+        stream.bounds.extend(state.get("bounds", []))
+        stream.bounds_count = int(state.get("bounds_count", 0))
+        window = state.get("window") or {}
+        stream.window_df = pd.DataFrame(window) if window else None
+        return stream
+
+    def result(self, curve_points: int = PLOT_POINTS) -> Dict[str, Any]:
+        """Сегмент, границы (глобальные номера строк: последние MAX_BOUNDS,
+        всего — bounds_count), число строк и кривые, прореженные для графика
+        до curve_points точек по минимумам/максимумам. Подавать части можно
+        и после result."""
+        self._flush()
+        if self.window_df is None:
+            raise ValueError("Нет данных для предобработки")
+        start = self.curve.count - len(self.window_df)
+        last_bound = self.detector.last_bound if self.detector is not None else None
+        if last_bound is not None and last_bound >= start:
+            seg = self.window_df.iloc[last_bound - start:].copy()
+        else:
+            seg = select_last_segment(self.window_df, 200)
+        out = {
+            "segment": seg,
+            "bounds": list(self.bounds),
+            "bounds_count": self.bounds_count,
+            "rows": self.curve.count,
+            "curve": _curve_plot(self.curve.finish(), curve_points),
+        }
+        if self.pcts:
+            curves = {**self.extra, self.curve.pct: self.curve}
+            out["curves"] = [{"pct": float(p), **_curve_plot(curves[p].finish(), curve_points)} for p in self.pcts]
+        return out
@@ -0,0 +1,163 @@
+"""Временная ось данных проекта.
+
+Колонка времени разбирается один раз на файл данных и способ разбора
+(kind/format из метаданных снапшота) и сохраняется в папке колоночного
+кэша: time_<ключ>.npy — int64, наносекунды от эпохи (NaT — пропуск), и
+time_<ключ>.json — хэш файла данных и шаг оси. Кэш пересобирается, когда
+меняется хэш файла (новая загрузка или дописанные строки).
+
+Если все соседние разности равны, ось равномерная и описывается парой
+(start, step). Подписи (ISO-строки) и продолжение оси за конец ряда
+строятся векторно, без цикла по строкам.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from modules.data.column_cache import (
+    _build_column_cache, _tmp_suffix, _write_json, cache_dir_for, cache_lock, ensure_column_cache, load_manifest,
+    read_column_array,
+)
+
+
+TIME_KINDS = ("timestamp_sec", "timestamp_ms", "datetime_format", "iso_date", "rfc_2822", "human_readable")
+NAT = np.iinfo(np.int64).min
+DEFAULT_STEP = 1_000_000_000  # 1 с — если разностей нет совсем
+_SECOND = 1_000_000_000
+
+
+def parse_time(values: Any, kind: str, fmt: Optional[str] = None) -> np.ndarray:
+    """Разбор колонки времени в int64 наносекунд от эпохи (NAT — пропуск).
+    Время с зоной переводится в наивное (локальное время записи).
+    ValueError — если способ разбора неизвестен или значения не приводятся к одной шкале.
+    """
+    s = pd.Series(values)
+    if s.dtype.kind in ("U", "O"):
+        s = s.where(s != "", np.nan)
+    if kind in ("timestamp_sec", "timestamp_ms"):
+        t = pd.to_datetime(s, unit="s" if kind == "timestamp_sec" else "ms", errors="coerce")
+    elif kind == "datetime_format" and fmt:
+        t = pd.to_datetime(s, format=fmt, errors="coerce")
+    elif kind in ("iso_date", "rfc_2822", "human_readable"):
+        t = pd.to_datetime(s, errors="coerce")
+    else:
+        raise ValueError(f"Неизвестный тип времени: {kind}")
+    if isinstance(t.dtype, pd.DatetimeTZDtype):
+        t = t.dt.tz_localize(None)
+    if t.dtype.kind != "M":
+        raise ValueError("Не удалось привести время к одной шкале (разные часовые пояса?)")
+    return t.to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+
+def iso_labels(values: np.ndarray) -> List[str]:
+    """ISO-строки как у Timestamp.isoformat(): без дробной части для целых
+    секунд, иначе микро- или наносекунды; пропуск — 'NaT'."""
+    values = np.asarray(values, dtype=np.int64)
+    dt = values.view("datetime64[ns]")
+    out = np.datetime_as_string(dt, unit="s").astype(object)
+    frac = (values % _SECOND != 0) & (values != NAT)
+    if frac.any():
+        idx = np.flatnonzero(frac)
+        ns = (values[idx] % 1000) != 0
+        out[idx[~ns]] = np.datetime_as_string(dt[idx[~ns]], unit="us")
+        out[idx[ns]] = np.datetime_as_string(dt[idx[ns]], unit="ns")
+    return out.tolist()
+
+
+def _axis_step(values: np.ndarray) -> tuple:
+    """(шаг, равномерна ли ось): шаг — медиана разностей соседних значений без пропусков."""
+    valid = values != NAT
+    both = valid[1:] & valid[:-1]
+    diffs = (values[1:] - values[:-1])[both]
+    if diffs.size == 0:
+        return DEFAULT_STEP, False
+    step = int(np.median(diffs))
+    return step, bool(valid.all() and (diffs == diffs[0]).all())
+
+
+@dataclass
+class TimeAxis:
+    """Ось времени файла данных: values — int64 нс (memmap из кэша)."""
+    values: np.ndarray
+    step: int
+    regular: bool
+
+    @property
+    def start(self) -> Optional[int]:
+        return int(self.values[0]) if self.values.shape[0] and self.values[0] != NAT else None
+
+    def labels(self, rows: Optional[np.ndarray] = None) -> List[str]:
+        """ISO-подписи для строк rows (по умолчанию — для всех)."""
+        if self.regular and self.start is not None:
+            # Равномерная ось — значения считаются по (start, step), файл не читается
+            idx = np.arange(self.values.shape[0], dtype=np.int64) if rows is None else np.asarray(rows, dtype=np.int64)
+            return iso_labels(self.start + idx * self.step)
+        return iso_labels(self.values if rows is None else self.values[np.asarray(rows, dtype=np.int64)])
+
+    def future(self, count: int) -> List[str]:
+        """count подписей после последнего значения с шагом step."""
+        valid = np.flatnonzero(self.values != NAT)
+        if count <= 0 or valid.size == 0:
+            return ["NaT"] * max(0, count)
+        last = int(self.values[valid[-1]])
+        return iso_labels(last + np.arange(1, count + 1, dtype=np.int64) * self.step)
+
+
+def _cache_paths(csv_path: str, column: str, kind: str, fmt: Optional[str]) -> tuple:
+    key = hashlib.sha1(json.dumps([column, kind, fmt], ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+    base = os.path.join(cache_dir_for(csv_path), f"time_{key}")
+    return f"{base}.npy", f"{base}.json"
+
+
+def _load_cached_axis(npy_path: str, meta_path: str, manifest: Dict[str, Any]) -> Optional[TimeAxis]:
+    """Ось из кэша, если он собран для текущего файла данных, иначе None."""
+    if not (os.path.exists(meta_path) and os.path.exists(npy_path)):
+        return None
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except Exception:
+        return None
+    if meta.get("hash") != manifest["hash"] or meta.get("rows") != manifest["rows"]:
+        return None
+    return TimeAxis(np.load(npy_path, mmap_mode="r"), int(meta["step"]), bool(meta["regular"]))
+
+
+def load_time_axis(csv_path: str, time_meta: Optional[Dict[str, Any]]) -> Optional[TimeAxis]:
+    """Ось времени по метаданным {"column", "kind", "format"}; None — если
+    колонка времени не задана или это просто индекс. Разбирается один раз
+    на файл данных, дальше читается из кэша."""
+    time_meta = time_meta or {}
+    column = time_meta.get("column")
+    kind = time_meta.get("kind", "index")
+    fmt = time_meta.get("format") or None
+    if not column or kind not in TIME_KINDS or (kind == "datetime_format" and not fmt):
+        return None
+    manifest = ensure_column_cache(csv_path)
+    npy_path, meta_path = _cache_paths(csv_path, column, kind, fmt)
+    axis = _load_cached_axis(npy_path, meta_path, manifest)
+    if axis is not None:
+        return axis
+    # Разбор под блокировкой кэша: параллельные запросы не разбирают колонку повторно
+    with cache_lock(csv_path):
+        # ensure_column_cache здесь нельзя: он сам берёт cache_lock
+        manifest = load_manifest(csv_path) or _build_column_cache(csv_path)
+        axis = _load_cached_axis(npy_path, meta_path, manifest)
+        if axis is not None:
+            return axis
+        values = parse_time(read_column_array(csv_path, column, manifest), kind, fmt)
+        step, regular = _axis_step(values)
+        tmp = f"{npy_path}.{_tmp_suffix()}.npy"
+        np.save(tmp, values, allow_pickle=False)
+        os.replace(tmp, npy_path)
+        _write_json(meta_path, {"hash": manifest["hash"], "rows": int(values.shape[0]), "column": column,
+                                "kind": kind, "format": fmt, "start": int(values[0]) if values.shape[0] else None,
+                                "step": step, "regular": regular})
+    return TimeAxis(values, step, regular)
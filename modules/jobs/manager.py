@@ -0,0 +1,490 @@
+"""Фоновые задачи: обучение, предобработка, дописывание данных и прогноз вне HTTP-воркеров.
+
+Таблица задач лежит на диске (data/jobs/<id>.json), поэтому статус виден
+из любого процесса gunicorn. В каждом процессе работает поток-диспетчер:
+он берёт задачи из очереди, пока число запущенных во всех процессах меньше
+бюджета ядер, и передаёт их долгоживущим рабочим процессам. Задача
+выполняется вне HTTP-воркера, и её можно прервать (рабочий процесс
+останавливается и при необходимости создаётся заново).
+У каждого файла задачи один писатель:
+  <id>.json          — запись задачи (диспетчер),
+  <id>.progress.json — последнее состояние хода выполнения (рабочий процесс),
+  <id>.events.jsonl  — лента событий хода выполнения для SSE (рабочий процесс),
+  <id>.result.json   — результат или ошибка (рабочий процесс),
+  <id>.cancel        — флаг отмены (обработчик запроса),
+  <id>.stop          — флаг досрочной остановки обучения (обработчик запроса).
+Файлы из params["temp_files"] удаляются при завершении задачи с любым статусом.
+by_project/<проект>/<маркер> — индекс задач проекта для list_jobs. Завершённые
+задачи хранятся KEEP_DAYS дней, не больше KEEP_PER_PROJECT на проект (prune_jobs).
+"""
+from __future__ import annotations
+
+import atexit
+import importlib
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from modules.storage.projects import DATA_DIR
+
+
+JOBS_DIR = os.path.join(DATA_DIR, "jobs")
+ACTIVE_DIR = os.path.join(JOBS_DIR, "active")
+# Индекс задач по проектам: пустые файлы <маркер задачи> в by_project/<проект>/
+INDEX_DIR = os.path.join(JOBS_DIR, "by_project")
+LOCK_FILE = os.path.join(JOBS_DIR, ".lock")
+
+# Бюджет ядер на все процессы и число ядер (потоков) на одну задачу
+CORE_BUDGET = max(1, int(os.environ.get("JOBS_CORE_BUDGET", os.cpu_count() or 1)))
+CORES_PER_JOB = max(1, int(os.environ.get("JOBS_CORES_PER_JOB", 1)))
+POLL_INTERVAL = 0.5
+STALE_AFTER = 30.0
+# Простаивающий рабочий процесс завершается, освобождая память
+WORKER_IDLE_TIMEOUT = float(os.environ.get("JOBS_WORKER_IDLE_TIMEOUT", 600))
+# Хранение завершённых задач: не старше KEEP_DAYS дней и не больше KEEP_PER_PROJECT на проект
+KEEP_DAYS = float(os.environ.get("JOBS_KEEP_DAYS", 7))
+KEEP_PER_PROJECT = max(1, int(os.environ.get("JOBS_KEEP_PER_PROJECT", 50)))
+PRUNE_INTERVAL = 600.0
+JOB_FILES = (".json", ".progress.json", ".events.jsonl", ".result.json", ".cancel", ".stop")
+
+TASKS = {
+    "preprocess": "modules.web.tasks:run_preprocess",
+    "train": "modules.web.tasks:run_train",
+    "append": "modules.web.tasks:run_append",
+    "forecast": "modules.web.tasks:run_forecast",
+    "sweep": "modules.web.tasks:run_sweep",
+    "forecast_batch": "modules.web.tasks:run_forecast_batch",
+}
+FINISHED = ("done", "failed", "cancelled")
+
+
+def _path(job_id: str, suffix: str = ".json") -> str:
+    return os.path.join(JOBS_DIR, f"{job_id}{suffix}")
+
+
+def _read_json(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def _write_json(path: str, data: Dict[str, Any]) -> None:
+    tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _index_dir(project_id: Optional[str]) -> str:
+    # Задачи без проекта (пакетный прогноз) — в "_"
+    return os.path.join(INDEX_DIR, re.sub(r"[^\w-]", "_", str(project_id)) if project_id else "_")
+
+
+def _marker(rec: Dict[str, Any]) -> str:
+    return rec.get("marker") or f"{int(rec.get('created', 0) * 1e9):020d}-{rec['id']}"
+
+
+def _delete_job(rec: Dict[str, Any]) -> None:
+    for suffix in JOB_FILES:
+        _remove(_path(rec["id"], suffix))
+    for path in (rec.get("params") or {}).get("temp_files") or []:
+        _remove(path)
+    _remove(os.path.join(_index_dir(rec.get("project_id")), _marker(rec)))
+
+
+def prune_jobs(now: Optional[float] = None) -> int:
+    """Удаляет файлы завершённых задач старше KEEP_DAYS и сверх последних
+    KEEP_PER_PROJECT на проект; задачам без записи в индексе (созданным до
+    него) добавляет её. Возвращает число удалённых задач.
+    Завершённые записи больше не меняются, поэтому блокировка не нужна.
+    """
+    now = time.time() if now is None else now
+    if not os.path.isdir(JOBS_DIR):
+        return 0
+    finished: Dict[str, List[Dict[str, Any]]] = {}
+    for name in os.listdir(JOBS_DIR):
+        if not (name.endswith(".json") and name.count(".") == 1):
+            continue
+        rec = _read_json(os.path.join(JOBS_DIR, name))
+        if not rec or "id" not in rec:
+            continue
+        index = os.path.join(_index_dir(rec.get("project_id")), _marker(rec))
+        if not os.path.exists(index):
+            os.makedirs(os.path.dirname(index), exist_ok=True)
+            with open(index, "w", encoding="utf-8"):
+                pass
+        if rec.get("status") in FINISHED:
+            finished.setdefault(str(rec.get("project_id")), []).append(rec)
+    removed = 0
+    for items in finished.values():
+        items.sort(key=lambda r: r.get("finished") or r.get("created", 0), reverse=True)
+        for pos, rec in enumerate(items):
+            age = now - (rec.get("finished") or rec.get("created", 0))
+            if pos >= KEEP_PER_PROJECT or age > KEEP_DAYS * 86400:
+                _delete_job(rec)
+                removed += 1
+    # Записи индекса, оставшиеся от удалённых задач
+    if os.path.isdir(INDEX_DIR):
+        for project in os.listdir(INDEX_DIR):
+            for name in os.listdir(os.path.join(INDEX_DIR, project)):
+                if not os.path.exists(_path(name.split("-", 1)[-1])):
+                    _remove(os.path.join(INDEX_DIR, project, name))
+    return removed
+
+
+@contextmanager
+def _locked(timeout: float = 10.0):
+    """Межпроцессная блокировка таблицы задач (файл, создаваемый с O_EXCL)."""
+    deadline = time.time() + timeout
+    while True:
+        try:
+            os.close(os.open(LOCK_FILE, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(LOCK_FILE) > STALE_AFTER:
+                    _remove(LOCK_FILE)
+                    continue
+            except OSError:
+                continue
+            if time.time() > deadline:
+                raise TimeoutError("Таблица задач заблокирована")
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        _remove(LOCK_FILE)
+
+
+class _Reporter:
+    """Канал хода выполнения задачи: передаётся функции задачи как progress."""
+
+    def __init__(self, job_id: str) -> None:
+        self.job_id = job_id
+        self._events = open(_path(job_id, ".events.jsonl"), "a", encoding="utf-8")
+
+    def __call__(self, value: float, message: Optional[str] = None, **extra: Any) -> None:
+        state = {"progress": float(value), "message": message, "time": time.time(), **extra}
+        _write_json(_path(self.job_id, ".progress.json"), state)
+        self._events.write(json.dumps(state, ensure_ascii=False) + "\n")
+        self._events.flush()
+
+    def stop_requested(self) -> bool:
+        return os.path.exists(_path(self.job_id, ".stop"))
+
+    def close(self) -> None:
+        self._events.close()
+
+
+def _run_job(job_id: str, kind: str, project_id: str, params: Dict[str, Any]) -> None:
+    progress = _Reporter(job_id)
+    try:
+        module_name, func_name = TASKS[kind].split(":")
+        func = getattr(importlib.import_module(module_name), func_name)
+        result = func(project_id, params, progress)
+        _write_json(_path(job_id, ".result.json"), {"ok": True, "result": result})
+    except Exception as exc:
+        _write_json(_path(job_id, ".result.json"), {"ok": False, "error": str(exc)})
+    finally:
+        progress.close()
+
+
+def _worker_main(conn, threads: int) -> None:
+    """Долгоживущий рабочий процесс: выполняет задачи по одной, пока открыт канал.
+    Процесс переиспользуется между задачами, поэтому кэши внутри него
+    (загруженные модели, TensorFlow) сохраняются.
+    """
+    # Ограничиваем потоки до импорта numpy/TensorFlow в рабочем процессе
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+    while True:
+        try:
+            job_id, kind, project_id, params = conn.recv()
+        except (EOFError, OSError):
+            return
+        _run_job(job_id, kind, project_id, params)
+        conn.send(job_id)
+
+
+class _Worker:
+    def __init__(self, ctx) -> None:
+        self.conn, child_conn = ctx.Pipe()
+        # Не daemon: задаче подбора гиперпараметров нужен собственный пул процессов.
+        # При выходе рабочие процессы останавливает _Dispatcher._shutdown.
+        self.proc = ctx.Process(target=_worker_main, args=(child_conn, CORES_PER_JOB), daemon=False)
+        self.proc.start()
+        child_conn.close()
+        self.job_id: Optional[str] = None
+        self.idle_since = time.time()
+
+    def run(self, rec: Dict[str, Any]) -> None:
+        self.job_id = rec["id"]
+        self.conn.send((rec["id"], rec["kind"], rec["project_id"], rec.get("params") or {}))
+
+    def poll_done(self) -> bool:
+        try:
+            if self.conn.poll():
+                self.conn.recv()
+                self.job_id = None
+                self.idle_since = time.time()
+                return True
+        except (EOFError, OSError):
+            pass
+        return False
+
+    def stop(self) -> None:
+        self.proc.terminate()
+        self.proc.join(5)
+        self.conn.close()
+
+
+class _Dispatcher:
+    def __init__(self) -> None:
+        self._workers: List[_Worker] = []
+        self._wake = threading.Event()
+        self._ctx = multiprocessing.get_context("spawn")
+        self._pruned = 0.0
+        self._thread = threading.Thread(target=self._loop, name="jobs-dispatcher", daemon=True)
+        self._thread.start()
+        atexit.register(self._shutdown)
+
+    def _shutdown(self) -> None:
+        # Выполняется раньше завершения multiprocessing, которое ждёт не-daemon процессы
+        for w in list(self._workers):
+            w.stop()
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def _loop(self) -> None:
+        while True:
+            busy = [w.conn for w in self._workers if w.job_id]
+            if busy:
+                # просыпаемся сразу, как только рабочий процесс сообщит о завершении
+                multiprocessing.connection.wait(busy, timeout=POLL_INTERVAL)
+            else:
+                self._wake.wait(POLL_INTERVAL)
+            self._wake.clear()
+            try:
+                self._tick()
+            except Exception:
+                # диспетчер не должен останавливаться из-за одной задачи
+                pass
+
+    def _owned(self) -> set:
+        return {w.job_id for w in self._workers if w.job_id}
+
+    def _tick(self) -> None:
+        now = time.time()
+        if now - self._pruned > PRUNE_INTERVAL:
+            self._pruned = now
+            prune_jobs(now)
+        for worker in list(self._workers):
+            job_id = worker.job_id
+            if job_id is None:
+                if not worker.proc.is_alive() or now - worker.idle_since > WORKER_IDLE_TIMEOUT:
+                    worker.stop()
+                    self._workers.remove(worker)
+                continue
+            rec = _read_json(_path(job_id)) or {"id": job_id}
+            if worker.poll_done():
+                self._finish(rec, 0)
+            elif not worker.proc.is_alive():
+                self._workers.remove(worker)
+                self._finish(rec, worker.proc.exitcode)
+            elif os.path.exists(_path(job_id, ".cancel")):
+                worker.stop()
+                self._workers.remove(worker)
+                self._close(rec, "cancelled")
+            else:
+                rec["heartbeat"] = now
+                _write_json(_path(job_id), rec)
+
+        markers = sorted(os.listdir(ACTIVE_DIR))
+        if not markers:
+            return
+        owned = self._owned()
+        with _locked():
+            running = 0
+            queued: List[Dict[str, Any]] = []
+            for name in markers:
+                job_id = name.split("-", 1)[-1]
+                rec = _read_json(_path(job_id))
+                if rec is None or rec.get("status") in FINISHED:
+                    _remove(os.path.join(ACTIVE_DIR, name))
+                elif rec["status"] == "running":
+                    if job_id not in owned and now - rec.get("heartbeat", 0) > STALE_AFTER:
+                        self._close(rec, "failed", "Процесс, выполнявший задачу, остановлен")
+                    else:
+                        running += 1
+                elif os.path.exists(_path(job_id, ".cancel")):
+                    self._close(rec, "cancelled")
+                else:
+                    queued.append(rec)
+            slots = max(1, CORE_BUDGET // CORES_PER_JOB) - running
+            for rec in queued[:max(0, slots)]:
+                self._start(rec)
+
+    def _start(self, rec: Dict[str, Any]) -> None:
+        worker = next((w for w in self._workers if w.job_id is None and w.proc.is_alive()), None)
+        if worker is None:
+            worker = _Worker(self._ctx)
+            self._workers.append(worker)
+        now = time.time()
+        rec.update({"status": "running", "started": now, "heartbeat": now, "owner": os.getpid(), "pid": worker.proc.pid})
+        _write_json(_path(rec["id"]), rec)
+        worker.run(rec)
+
+    def _finish(self, rec: Dict[str, Any], exitcode: Optional[int]) -> None:
+        out = _read_json(_path(rec["id"], ".result.json"))
+        if out is None:
+            self._close(rec, "failed", f"Процесс задачи завершился с кодом {exitcode}")
+        elif out.get("ok"):
+            self._close(rec, "done")
+        else:
+            self._close(rec, "failed", out.get("error") or "Ошибка выполнения")
+
+    def _close(self, rec: Dict[str, Any], status: str, error: Optional[str] = None) -> None:
+        rec.update({"status": status, "finished": time.time(), "error": error})
+        _write_json(_path(rec["id"]), rec)
+        if rec.get("marker"):
+            _remove(os.path.join(ACTIVE_DIR, rec["marker"]))
+        _remove(_path(rec["id"], ".cancel"))
+        _remove(_path(rec["id"], ".stop"))
+        # Временные файлы задачи (например, загруженные строки для append) удаляются
+        # при любом исходе, в том числе при отмене до запуска
+        for path in (rec.get("params") or {}).get("temp_files") or []:
+            _remove(path)
+
+
+_dispatcher: Optional[_Dispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def _ensure_dispatcher() -> _Dispatcher:
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            os.makedirs(ACTIVE_DIR, exist_ok=True)
+            _dispatcher = _Dispatcher()
+        return _dispatcher
+
+
+def submit(kind: str, project_id: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Ставит задачу в очередь и сразу возвращает её запись."""
+    if kind not in TASKS:
+        raise ValueError(f"Неизвестный тип задачи: {kind}")
+    dispatcher = _ensure_dispatcher()
+    job_id = str(uuid.uuid4())
+    rec = {
+        "id": job_id,
+        "kind": kind,
+        "project_id": project_id,
+        "params": params,
+        "status": "queued",
+        "created": time.time(),
+        "marker": f"{time.time_ns():020d}-{job_id}",
+        "error": None,
+    }
+    _write_json(_path(job_id), rec)
+    os.makedirs(_index_dir(project_id), exist_ok=True)
+    for marker in (os.path.join(_index_dir(project_id), rec["marker"]), os.path.join(ACTIVE_DIR, rec["marker"])):
+        with open(marker, "w", encoding="utf-8"):
+            pass
+    dispatcher.wake()
+    return rec
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Запись задачи вместе с последним сообщением о ходе выполнения."""
+    _ensure_dispatcher()
+    rec = _read_json(_path(job_id))
+    if rec is None:
+        return None
+    progress = _read_json(_path(job_id, ".progress.json")) or {}
+    rec["progress"] = 1.0 if rec["status"] == "done" else progress.get("progress", 0.0)
+    rec["message"] = progress.get("message")
+    rec["cancel_requested"] = os.path.exists(_path(job_id, ".cancel"))
+    rec["stop_requested"] = os.path.exists(_path(job_id, ".stop"))
+    return rec
+
+
+def read_events(job_id: str, offset: int = 0) -> Tuple[List[Tuple[int, Dict[str, Any]]], int]:
+    """События хода выполнения, записанные после байтового смещения offset.
+    Возвращает [(смещение после события, событие)] и новое смещение.
+    """
+    events: List[Tuple[int, Dict[str, Any]]] = []
+    try:
+        with open(_path(job_id, ".events.jsonl"), "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # строка ещё дописывается
+                offset += len(line)
+                try:
+                    events.append((offset, json.loads(line)))
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return events, offset
+
+
+def get_result(job_id: str) -> Optional[Dict[str, Any]]:
+    """Результат завершённой задачи (то, что вернула функция задачи)."""
+    out = _read_json(_path(job_id, ".result.json"))
+    if not out or not out.get("ok"):
+        return None
+    return out.get("result")
+
+
+def list_jobs(project_id: str) -> List[Dict[str, Any]]:
+    """Задачи проекта, новые первыми (по индексу by_project, без чтения чужих задач)."""
+    index = _index_dir(project_id)
+    if not os.path.isdir(index):
+        return []
+    items = []
+    for name in sorted(os.listdir(index), reverse=True):
+        rec = _read_json(_path(name.split("-", 1)[-1]))
+        if rec and rec.get("project_id") == project_id:
+            items.append(rec)
+    return items
+
+
+def cancel_job(job_id: str) -> bool:
+    """Запрашивает отмену; задачу останавливает диспетчер процесса-владельца."""
+    dispatcher = _ensure_dispatcher()
+    rec = _read_json(_path(job_id))
+    if rec is None or rec.get("status") in FINISHED:
+        return False
+    with open(_path(job_id, ".cancel"), "w", encoding="utf-8"):
+        pass
+    dispatcher.wake()
+    return True
+
+
+def request_stop(job_id: str) -> bool:
+    """Просит задачу обучения остановиться досрочно; обученная к этому моменту модель сохраняется."""
+    rec = _read_json(_path(job_id))
+    if rec is None or rec.get("status") != "running":
+        return False
+    with open(_path(job_id, ".stop"), "w", encoding="utf-8"):
+        pass
+    return True
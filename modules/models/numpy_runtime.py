@@ -0,0 +1,287 @@
+"""Инференс обученных моделей без TensorFlow.
+
+После обучения веса сохраняются в model.npz рядом с model.keras: массивы
+float32 и описание слоёв (JSON). Здесь эти слои повторены на NumPy —
+Flatten, Dense, Conv1D (causal/valid/same), GlobalAveragePooling1D и
+SimpleRNN, то есть всё, из чего собираются build_mlp/build_cnn/build_rnn.
+Рабочий процесс прогноза может обслуживать запросы, не импортируя TF.
+
+Экспорт (export_numpy_model) принимает Keras-модель, поэтому вызывается из
+tf_models; загрузка и прогноз TensorFlow не требуют.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+
+NPZ_NAME = "model.npz"
+FORMAT_VERSION = 1
+_ACTIVATIONS: Dict[str, Callable[[np.ndarray], np.ndarray]] = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0.0, out=x),
+    "tanh": np.tanh,
+    "sigmoid": lambda x: 1.0 / (1.0 + np.exp(-x)),
+}
+
+
+def npz_path_for(model_path: str) -> str:
+    return os.path.join(os.path.dirname(model_path), NPZ_NAME)
+
+
+def _stamp(path: str) -> Dict[str, int]:
+    st = os.stat(path)
+    return {"size": int(st.st_size), "mtime_ns": int(st.st_mtime_ns)}
+
+
+def export_numpy_model(model: Any, path: str, source_path: Optional[str] = None) -> str:
+    """Сохраняет веса и описание слоёв Keras-модели в .npz.
+    source_path — сохранённый .keras, от которого отсчитывается актуальность экспорта.
+    ValueError — если в модели есть слой, которого нет в NumPy-реализации.
+    """
+    layers: List[Dict[str, Any]] = []
+    arrays: Dict[str, np.ndarray] = {}
+    for layer in model.layers:
+        kind = type(layer).__name__
+        cfg = layer.get_config()
+        weights = [np.asarray(w, dtype=np.float32) for w in layer.get_weights()]
+        names = [f"w{len(arrays) + i}" for i in range(len(weights))]
+        spec: Dict[str, Any] = {"type": kind, "weights": names}
+        if kind == "InputLayer":
+            continue
+        if kind in ("Dense", "Conv1D", "SimpleRNN"):
+            if cfg.get("activation") not in _ACTIVATIONS:
+                raise ValueError(f"Активация не поддерживается: {cfg.get('activation')}")
+            spec["activation"] = cfg["activation"]
+            spec["use_bias"] = bool(cfg.get("use_bias", True))
+        if kind == "Conv1D":
+            if cfg.get("data_format", "channels_last") != "channels_last" or tuple(cfg["strides"]) != (1,) or cfg.get("groups", 1) != 1:
+                raise ValueError("Conv1D поддерживается только с channels_last, strides=1, groups=1")
+            spec["padding"] = cfg["padding"]
+            spec["dilation"] = int(cfg["dilation_rate"][0])
+        elif kind == "SimpleRNN":
+            if cfg.get("return_sequences") or cfg.get("go_backwards") or cfg.get("stateful"):
+                raise ValueError("SimpleRNN поддерживается только с последним состоянием на выходе")
+        elif kind == "GlobalAveragePooling1D":
+            if cfg.get("data_format", "channels_last") != "channels_last" or cfg.get("keepdims"):
+                raise ValueError("GlobalAveragePooling1D поддерживается только channels_last без keepdims")
+        elif kind not in ("Dense", "Flatten"):
+            raise ValueError(f"Слой не поддерживается: {kind}")
+        arrays.update(zip(names, weights))
+        layers.append(spec)
+
+    input_shape = model.input_shape[0] if isinstance(model.input_shape, list) else model.input_shape
+    meta = {
+        "version": FORMAT_VERSION,
+        "window": int(input_shape[1]),
+        "layers": layers,
+        "source": _stamp(source_path) if source_path and os.path.exists(source_path) else None,
+    }
+    tmp = f"{path}.tmp-{os.getpid()}.npz"
+    np.savez(tmp, meta=np.array(json.dumps(meta)), **arrays)
+    os.replace(tmp, path)
+    return path
+
+
+def _dense(w: List[np.ndarray], spec: Dict[str, Any]):
+    kernel, bias = w[0], (w[1] if spec["use_bias"] else None)
+    act = _ACTIVATIONS[spec["activation"]]
+
+    def op(x):
+        y = x @ kernel
+        if bias is not None:
+            y += bias
+        return act(y)
+    return op
+
+
+def _conv1d(w: List[np.ndarray], spec: Dict[str, Any]):
+    kernel, bias = w[0], (w[1] if spec["use_bias"] else None)  # kernel: [k, in, out]
+    k, d = kernel.shape[0], spec["dilation"]
+    span = (k - 1) * d
+    act = _ACTIVATIONS[spec["activation"]]
+    padding = spec["padding"]
+
+    def op(x):  # x: [batch, time, in]
+        if padding == "causal":
+            # Без копирования входа: вклад j-го элемента ядра сдвинут вправо на (k-1-j)*d,
+            # нули слева (causal-паддинг) просто не добавляются
+            y = x @ kernel[k - 1]
+            for j in range(k - 1):
+                shift = (k - 1 - j) * d
+                if shift < x.shape[1]:
+                    y[:, shift:, :] += x[:, :x.shape[1] - shift, :] @ kernel[j]
+        else:
+            if padding == "same":
+                x = np.pad(x, ((0, 0), (span // 2, span - span // 2), (0, 0)))
+            steps = x.shape[1] - span
+            y = x[:, 0:steps, :] @ kernel[0]
+            for j in range(1, k):
+                y += x[:, j * d:j * d + steps, :] @ kernel[j]
+        if bias is not None:
+            y += bias
+        return act(y)
+    return op
+
+
+def _simple_rnn(w: List[np.ndarray], spec: Dict[str, Any]):
+    kernel, recurrent = w[0], w[1]
+    bias = w[2] if spec["use_bias"] else None
+    act = _ACTIVATIONS[spec["activation"]]
+
+    def op(x):  # x: [batch, time, in]
+        # Входную проекцию считаем сразу для всех шагов, в цикле — только рекуррентная часть
+        xw = x @ kernel
+        if bias is not None:
+            xw += bias
+        h = np.zeros((x.shape[0], recurrent.shape[0]), dtype=np.float32)
+        for t in range(x.shape[1]):
+            h = act(xw[:, t, :] + h @ recurrent)
+        return h
+    return op
+
+
+_BUILDERS = {
+    "Dense": _dense,
+    "Conv1D": _conv1d,
+    "SimpleRNN": _simple_rnn,
+    "Flatten": lambda w, spec: (lambda x: x.reshape(x.shape[0], -1)),
+    "GlobalAveragePooling1D": lambda w, spec: (lambda x: x.mean(axis=1)),
+}
+
+
+class NumpyModel:
+    """Модель из model.npz: predict(windows[batch, window]) -> [batch, horizon]."""
+
+    def __init__(self, meta: Dict[str, Any], arrays: Dict[str, np.ndarray]):
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError("Неподдерживаемая версия экспорта модели")
+        self.window = int(meta["window"])
+        self.source = meta.get("source")
+        self._ops = [_BUILDERS[spec["type"]]([arrays[n] for n in spec["weights"]], spec) for spec in meta["layers"]]
+
+    @classmethod
+    def load(cls, path: str) -> "NumpyModel":
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            arrays = {k: data[k] for k in data.files if k != "meta"}
+        return cls(meta, arrays)
+
+    def predict(self, windows: np.ndarray) -> np.ndarray:
+        x = np.asarray(windows, dtype=np.float32).reshape(-1, self.window, 1)
+        for op in self._ops:
+            x = op(x)
+        return x
+
+    def forecast(self, windows: np.ndarray, steps: int, horizon: int) -> np.ndarray:
+        """Авторегрессионный прогноз для пачки окон [batch, window]: steps вызовов,
+        каждый добавляет horizon точек. Возвращает [batch, steps * horizon]."""
+        win = np.asarray(windows, dtype=np.float32).reshape(-1, self.window)
+        batch = win.shape[0]
+        # Кольцевой буфер двойной длины: текущее окно — непрерывный срез ring[:, head:head + window]
+        ring = np.concatenate([win, win], axis=1)
+        head = 0
+        out = np.empty((batch, steps * horizon), dtype=np.float32)
+        for step in range(steps):
+            pred = self.predict(ring[:, head:head + self.window])[:, :horizon]
+            out[:, step * horizon:(step + 1) * horizon] = pred
+            for j in range(horizon):
+                ring[:, head] = pred[:, j]
+                ring[:, head + self.window] = pred[:, j]
+                head = (head + 1) % self.window
+        return out
+
+
+_CACHE: "OrderedDict[str, tuple]" = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+CACHE_ITEMS = int(os.environ.get("MODEL_CACHE_ITEMS", 8))
+
+
+def load_exported(model_path: str) -> Optional[NumpyModel]:
+    """NumPy-модель для model.keras, если экспорт есть и сделан из текущей версии файла."""
+    npz = npz_path_for(model_path)
+    if not os.path.exists(npz):
+        return None
+    key = os.path.abspath(npz)
+    st = _stamp(npz)
+    stamp = (st["mtime_ns"], st["size"])
+    with _CACHE_LOCK:
+        entry = _CACHE.get(key)
+        if entry is not None and entry[0] == stamp:
+            _CACHE.move_to_end(key)
+            model = entry[1]
+        else:
+            model = None
+    if model is None:
+        try:
+            model = NumpyModel.load(npz)
+        except (ValueError, KeyError, OSError):
+            return None
+        with _CACHE_LOCK:
+            _CACHE[key] = (stamp, model)
+            while len(_CACHE) > CACHE_ITEMS:
+                _CACHE.popitem(last=False)
+    if model.source is not None and os.path.exists(model_path) and _stamp(model_path) != model.source:
+        return None  # model.keras новее экспорта
+    return model
+
+
+def numpy_forecast(series: np.ndarray, model: NumpyModel, steps: int, horizon: int,
+                   context: Optional[int] = None) -> np.ndarray:
+    """То же, что tf_models.iterative_forecast, но на NumPy-модели."""
+    if steps <= 0:
+        return np.array([], dtype=float)
+    buffer = np.asarray(series, dtype=float)
+    if context is not None and context > 0 and context <= buffer.shape[0]:
+        buffer = buffer[-context:]
+    last = buffer[-model.window:]
+    if last.shape[0] < model.window:
+        raise ValueError("Недостаточно точек контекста для окна модели")
+    return model.forecast(last[np.newaxis, :], steps, horizon)[0].astype(float)
+
+
+def numpy_batch_forecast(requests: List[Dict[str, Any]]) -> List[Any]:
+    """Аналог tf_models.batch_forecast: те же элементы запросов, окна одной
+    модели считаются пачкой. Для запросов без актуального model.npz — None;
+    если запрос или группу посчитать не удалось, на его месте — исключение.
+    """
+    results: List[Any] = [None] * len(requests)
+    groups: Dict[tuple, List[int]] = {}
+    for i, req in enumerate(requests):
+        groups.setdefault((os.path.abspath(req["model_path"]), int(req["horizon"])), []).append(i)
+    for (model_path, horizon), idx in groups.items():
+        try:
+            model = load_exported(model_path)
+            if model is None:
+                continue
+            live = []
+            windows = []
+            for i in idx:
+                results[i] = np.array([], dtype=float)
+                if int(requests[i]["steps"]) <= 0:
+                    continue
+                buffer = np.asarray(requests[i]["series"], dtype=float)
+                context = requests[i].get("context")
+                if context is not None and 0 < context <= buffer.shape[0]:
+                    buffer = buffer[-context:]
+                if buffer.shape[0] < model.window:
+                    results[i] = ValueError(f"Запрос {i}: недостаточно точек контекста для окна модели")
+                    continue
+                live.append(i)
+                windows.append(buffer[-model.window:])
+            if not live:
+                continue
+            steps = max(int(requests[i]["steps"]) for i in live)
+            out = model.forecast(np.stack(windows), steps, horizon).astype(float)
+            for row, i in enumerate(live):
+                results[i] = out[row, :int(requests[i]["steps"]) * horizon]
+        except Exception as exc:
+            # Ошибка группы (model.npz не читается и т. п.) — только у её запросов
+            for i in idx:
+                results[i] = exc
+    return results
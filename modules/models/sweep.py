@@ -0,0 +1,308 @@
+"""Подбор гиперпараметров ModelConfig.
+
+Пространство поиска — сетка или случайная выборка по model_type, window,
+horizon, batch_size и learning_rate. Испытания идут параллельно в пуле
+процессов, у каждого — свой лимит потоков. Отбор — successive halving:
+все конфигурации обучаются несколько эпох, дальше продолжают обучение
+только лучшие 1/eta, и так до max_epochs. Таблица результатов пишется
+в <save_dir>/sweep/leaderboard.json после каждого раунда.
+
+TensorFlow в этом модуле импортируется только внутри испытаний, чтобы
+лимиты потоков успели попасть в окружение процесса пула.
+"""
+from __future__ import annotations
+
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+
+SWEEP_PARAMS = ("model_type", "window", "horizon", "batch_size", "learning_rate")
+# Поля ModelConfig (tf_models здесь не импортируется, см. описание модуля); epochs в base игнорируется
+BASE_PARAMS = SWEEP_PARAMS + ("epochs", "val_split")
+MODEL_TYPES = ("mlp", "cnn", "rnn")
+SWEEP_DIRNAME = "sweep"
+LEADERBOARD_NAME = "leaderboard.json"
+
+
+def _check_value(name: str, value: Any) -> None:
+    """ValueError, если значение поля ModelConfig недопустимо."""
+    if name == "model_type":
+        if value not in MODEL_TYPES:
+            raise ValueError(f"Неизвестный тип модели: {value}")
+        return
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{name}: ожидается число, получено {value!r}")
+    if name in ("window", "horizon", "batch_size", "epochs"):
+        if not isinstance(value, int) or value < 1:
+            raise ValueError(f"{name}: ожидается целое число >= 1, получено {value!r}")
+    elif name == "learning_rate":
+        if not value > 0:
+            raise ValueError(f"learning_rate должен быть больше 0, получено {value!r}")
+    elif name == "val_split":
+        if not 0 <= value < 1:
+            raise ValueError(f"val_split должен быть в [0, 1), получено {value!r}")
+
+
+def _check_params(space: Dict[str, Any]) -> None:
+    unknown = set(space) - set(SWEEP_PARAMS)
+    if unknown:
+        raise ValueError(f"Неизвестные параметры поиска: {sorted(unknown)}")
+    for name, spec in space.items():
+        if isinstance(spec, dict):
+            values = [spec["min"], spec["max"]]
+        else:
+            values = spec if isinstance(spec, list) else [spec]
+        for value in values:
+            _check_value(name, value)
+
+
+def check_base(base: Any) -> Dict[str, Any]:
+    """Общие поля ModelConfig для всех испытаний: известные ключи и те же
+    правила значений, что и в пространстве поиска. ValueError — иначе."""
+    if base is None:
+        return {}
+    if not isinstance(base, dict):
+        raise ValueError("base должен быть объектом")
+    unknown = set(base) - set(BASE_PARAMS)
+    if unknown:
+        raise ValueError(f"Неизвестные поля base: {sorted(unknown)}")
+    for name, value in base.items():
+        _check_value(name, value)
+    return dict(base)
+
+
+def _sample(spec: Any, rng: random.Random) -> Any:
+    if isinstance(spec, list):
+        return rng.choice(spec)
+    if isinstance(spec, dict):
+        lo, hi = spec["min"], spec["max"]
+        if spec.get("log"):
+            value = math.exp(rng.uniform(math.log(lo), math.log(hi)))
+        else:
+            value = rng.uniform(lo, hi)
+        if isinstance(lo, int) and isinstance(hi, int):
+            return int(round(value))
+        return float(value)
+    return spec
+
+
+def expand_space(space: Dict[str, Any], mode: str = "grid", n_trials: Optional[int] = None, seed: int = 0) -> List[Dict[str, Any]]:
+    """Список конфигураций испытаний.
+    grid   — декартово произведение списков значений (не больше n_trials, если задано);
+    random — n_trials случайных точек: список — выбор из значений,
+             {"min", "max", "log"} — отрезок (целый, если границы целые).
+    """
+    _check_params(space)
+    names = [p for p in SWEEP_PARAMS if p in space]
+    if mode == "grid":
+        values = []
+        for name in names:
+            spec = space[name]
+            if isinstance(spec, dict):
+                raise ValueError(f"Для сетки нужен список значений: {name}")
+            values.append(spec if isinstance(spec, list) else [spec])
+        trials = [dict(zip(names, combo)) for combo in itertools.product(*values)]
+        return trials[:n_trials] if n_trials else trials
+    if mode == "random":
+        if not n_trials:
+            raise ValueError("Для случайного поиска нужен n_trials")
+        rng = random.Random(seed)
+        trials, seen = [], set()
+        # Повторы отбрасываем; попыток ограниченное число, если пространство мало
+        for _ in range(n_trials * 20):
+            trial = {name: _sample(space[name], rng) for name in names}
+            key = tuple(trial[n] for n in names)
+            if key not in seen:
+                seen.add(key)
+                trials.append(trial)
+            if len(trials) == n_trials:
+                break
+        return trials
+    raise ValueError(f"Неизвестный режим поиска: {mode}")
+
+
+def _watch_parent(parent_pid: int) -> None:
+    # Процесс пула завершается вместе с родителем (например, при отмене задачи)
+    while os.getppid() == parent_pid:
+        time.sleep(1.0)
+    os._exit(1)
+
+
+def _init_trial_worker(threads: int, parent_pid: int) -> None:
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+    threading.Thread(target=_watch_parent, args=(parent_pid,), daemon=True).start()
+
+
+def _finite_or_none(v: Any) -> Optional[float]:
+    # NaN/inf (разошедшееся обучение) в таблицу не пишем
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return None
+    return f if math.isfinite(f) else None
+
+
+def _run_trial(trial_id: str, params: Dict[str, Any], base: Dict[str, Any], series_path: str,
+               trial_dir: str, epochs_done: int, epochs_target: int) -> Dict[str, Any]:
+    """Дообучает модель испытания до epochs_target эпох (модель и состояние
+    оптимизатора хранятся в trial_dir между раундами)."""
+    import tensorflow as tf
+    from modules.models.tf_models import ModelConfig, build_model, _fit, _window_count
+
+    cfg = ModelConfig(**{**base, **params, "epochs": epochs_target - epochs_done})
+    series = np.load(series_path, mmap_mode="r")
+    if _window_count(len(series), cfg.window, cfg.horizon) < 2:
+        raise ValueError("Недостаточно данных для обучения")
+    path = os.path.join(trial_dir, "model.keras")
+    model = tf.keras.models.load_model(path) if epochs_done and os.path.exists(path) else build_model(cfg)
+    t0 = time.perf_counter()
+    history = _fit(model, np.asarray(series, dtype=float), cfg, val_split=max(0.01, min(0.5, float(cfg.val_split))))
+    os.makedirs(trial_dir, exist_ok=True)
+    model.save(path)
+    h = history.history
+    return {
+        "trial": trial_id,
+        "loss": _finite_or_none(h["loss"][-1]),
+        "val_loss": _finite_or_none(h.get("val_loss", h["loss"])[-1]),
+        "val_mae": _finite_or_none(h.get("val_mae", [None])[-1]),
+        "epochs": epochs_target,
+        "seconds": time.perf_counter() - t0,
+    }
+
+
+def _rungs(min_epochs: int, max_epochs: int, eta: int) -> List[int]:
+    budgets = [max(1, min_epochs)]
+    while budgets[-1] < max_epochs:
+        budgets.append(min(max_epochs, budgets[-1] * eta))
+    return budgets
+
+
+def _score(row: Dict[str, Any]) -> float:
+    v = row.get("val_loss")
+    return v if v is not None else math.inf
+
+
+def _write_leaderboard(path: str, board: Dict[str, Any]) -> None:
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(board, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def sweep_workers(workers: Any, threads_per_trial: Any = 1, core_budget: Optional[int] = None) -> int:
+    """Число процессов пула: workers, но не больше core_budget // threads_per_trial
+    (по умолчанию — ровно столько). core_budget по умолчанию — число ядер.
+    ValueError — если workers или threads_per_trial не целые."""
+    try:
+        threads = max(1, int(threads_per_trial))
+        requested = None if workers in (None, "") else int(workers)
+    except (TypeError, ValueError):
+        raise ValueError("workers и threads_per_trial должны быть целыми числами")
+    limit = max(1, int(core_budget or os.cpu_count() or 1) // threads)
+    return limit if requested is None else min(max(1, requested), limit)
+
+
+def run_sweep(series: np.ndarray, space: Dict[str, Any], save_dir: str, mode: str = "grid",
+              n_trials: Optional[int] = None, base: Optional[Dict[str, Any]] = None,
+              min_epochs: int = 2, max_epochs: int = 18, eta: int = 3,
+              workers: Optional[int] = None, threads_per_trial: int = 1, seed: int = 0,
+              progress: Optional[Callable[..., None]] = None,
+              should_stop: Optional[Callable[[], bool]] = None,
+              core_budget: Optional[int] = None) -> Dict[str, Any]:
+    """Запускает поиск и возвращает таблицу результатов (лучшие — первыми).
+    base — общие поля ModelConfig (например, val_split); метрика отбора — val_loss
+    на хвосте окон, поэтому сравнение разных horizon/window приблизительное.
+    Пул — не больше core_budget ядер (sweep_workers).
+    """
+    trials = expand_space(space, mode=mode, n_trials=n_trials, seed=seed)
+    if not trials:
+        raise ValueError("Пустое пространство поиска")
+    eta = max(2, int(eta))
+    workers = sweep_workers(workers, threads_per_trial, core_budget)
+    threads_per_trial = max(1, int(threads_per_trial))
+    base = {"model_type": "mlp", "window": 32, "horizon": 12, "val_split": 0.2, **check_base(base)}
+    base.pop("epochs", None)
+
+    sweep_dir = os.path.join(save_dir, SWEEP_DIRNAME)
+    # Новый поиск заменяет результаты предыдущего
+    shutil.rmtree(sweep_dir, ignore_errors=True)
+    os.makedirs(sweep_dir, exist_ok=True)
+    series_path = os.path.join(sweep_dir, "series.npy")
+    np.save(series_path, np.asarray(series, dtype=float), allow_pickle=False)
+    board_path = os.path.join(sweep_dir, LEADERBOARD_NAME)
+
+    rows = {f"t{i:03d}": {"trial": f"t{i:03d}", "params": params, "status": "pending", "epochs": 0, "rung": 0}
+            for i, params in enumerate(trials)}
+    budgets = _rungs(min_epochs, max_epochs, eta)
+    board = {"mode": mode, "space": space, "base": base, "rungs": budgets, "eta": eta, "status": "running", "trials": []}
+    alive = list(rows)
+    total_units = sum(len(trials) // eta ** k or 1 for k in range(len(budgets)))
+    done_units = 0
+
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, len(trials)), mp_context=ctx,
+                             initializer=_init_trial_worker, initargs=(threads_per_trial, os.getpid())) as pool:
+        for rung, budget in enumerate(budgets):
+            if should_stop and should_stop():
+                board["status"] = "stopped"
+                break
+            futures = {
+                pool.submit(_run_trial, tid, rows[tid]["params"], base, series_path,
+                            os.path.join(sweep_dir, tid), rows[tid]["epochs"], budget): tid
+                for tid in alive
+            }
+            for fut in as_completed(futures):
+                tid = futures[fut]
+                row = rows[tid]
+                try:
+                    row.update(fut.result(), status="running", rung=rung)
+                except Exception as exc:
+                    row.update(status="failed", error=str(exc), rung=rung)
+                done_units += 1
+                if progress:
+                    progress(min(1.0, done_units / max(1, total_units)), f"Раунд {rung + 1}/{len(budgets)}: {tid}",
+                             event="trial", rung=rung, trial=tid, val_loss=row.get("val_loss"))
+            ranked = sorted((t for t in alive if rows[t]["status"] != "failed"), key=lambda t: _score(rows[t]))
+            if rung + 1 < len(budgets):
+                keep = max(1, len(ranked) // eta)
+                for tid in ranked[keep:]:
+                    rows[tid]["status"] = "pruned"
+                alive = ranked[:keep]
+            else:
+                alive = ranked
+            board["trials"] = sorted(rows.values(), key=lambda r: (_score(r), -r["epochs"]))
+            _write_leaderboard(board_path, board)
+            if not alive:
+                break
+
+    for tid in alive:
+        if rows[tid]["status"] == "running":
+            rows[tid]["status"] = "finished"
+    board["trials"] = sorted(rows.values(), key=lambda r: (r["status"] != "finished", _score(r), -r["epochs"]))
+    if board["status"] == "running":
+        board["status"] = "done"
+    best = next((r for r in board["trials"] if r["status"] == "finished"), None)
+    board["best"] = {**best, "model_file": os.path.join(SWEEP_DIRNAME, best["trial"], "model.keras")} if best else None
+    _write_leaderboard(board_path, board)
+    return board
+
+
+def load_leaderboard(save_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(save_dir, SWEEP_DIRNAME, LEADERBOARD_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
@@ -1,11 +1,17 @@
 from __future__ import annotations
 
+import math
 import os
+import threading
+import warnings
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, List, Tuple
 import numpy as np
 import tensorflow as tf
 
+from modules.models.numpy_runtime import NPZ_NAME, export_numpy_model
+
 
 @dataclass
 class ModelConfig:
@@ -18,56 +24,329 @@ class ModelConfig:
     val_split: float = 0.2
 
 
+def _env_flag(name: str) -> bool | None:
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return None
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _env_threads(name: str) -> int:
+    """Число потоков из окружения; неверное значение — предупреждение и 0 (решает TensorFlow)."""
+    value = (os.environ.get(name) or '').strip()
+    if not value:
+        return 0
+    try:
+        threads = int(value)
+    except ValueError:
+        threads = -1
+    if threads < 0:
+        warnings.warn(f'{name}={value!r}: ожидается целое число >= 0, используется 0')
+        return 0
+    return threads
+
+
+@dataclass
+class RuntimeProfile:
+    """Настройки исполнения TensorFlow на CPU.
+    Потоки задаются до первой операции TF в процессе; oneDNN читается
+    TensorFlow только при импорте (TF_ENABLE_ONEDNN_OPTS), поэтому здесь
+    лишь отражается. jit_compile и mixed_precision применяются при сборке модели.
+    """
+    intra_op_threads: int = 0  # 0 — решает TensorFlow
+    inter_op_threads: int = 0
+    onednn: bool | None = None
+    jit_compile: bool = False
+    mixed_precision: str | None = None  # None|mixed_bfloat16|mixed_float16
+
+    @classmethod
+    def from_env(cls) -> 'RuntimeProfile':
+        # Профиль читается при импорте: неверные значения не роняют приложение,
+        # а заменяются значениями по умолчанию с предупреждением
+        policy = (os.environ.get('TF_MIXED_PRECISION') or '').strip() or None
+        if policy not in (None, 'mixed_bfloat16', 'mixed_float16'):
+            warnings.warn(f'TF_MIXED_PRECISION={policy!r}: неизвестная политика, используется float32')
+            policy = None
+        return cls(
+            intra_op_threads=_env_threads('TF_NUM_INTRAOP_THREADS'),
+            inter_op_threads=_env_threads('TF_NUM_INTEROP_THREADS'),
+            onednn=_env_flag('TF_ENABLE_ONEDNN_OPTS'),
+            jit_compile=bool(_env_flag('TF_JIT_COMPILE')),
+            mixed_precision=policy,
+        )
+
+    def layer_dtype(self, model_type: str) -> str | None:
+        # Рекуррентные слои оставляем в float32: в bf16/fp16 накапливается ошибка по шагам
+        if self.mixed_precision and model_type in ('mlp', 'cnn'):
+            return self.mixed_precision
+        return None
+
+
+RUNTIME_PROFILE = RuntimeProfile.from_env()
+_threads_applied = False
+
+
+def apply_runtime_profile(profile: RuntimeProfile | None = None) -> bool:
+    """Один раз на процесс задаёт пулы потоков TF. False — если рантайм уже
+    инициализирован и потоки изменить нельзя."""
+    global _threads_applied
+    profile = profile or RUNTIME_PROFILE
+    if _threads_applied:
+        return True
+    try:
+        if profile.intra_op_threads:
+            tf.config.threading.set_intra_op_parallelism_threads(profile.intra_op_threads)
+        if profile.inter_op_threads:
+            tf.config.threading.set_inter_op_parallelism_threads(profile.inter_op_threads)
+    except RuntimeError:
+        return False
+    _threads_applied = True
+    return True
+
+
+class ModelCache:
+    """Потокобезопасный LRU-кэш загруженных моделей для прогноза.
+    Ключ — путь к файлу; запись действительна, пока у файла те же mtime и
+    размер. Вытеснение — по числу моделей и суммарному объёму весов.
+    Скомпилированные для модели функции (compiled) хранятся в той же записи
+    и освобождаются вместе с ней.
+    """
+
+    def __init__(self, max_items: int = 8, max_bytes: int = 512 * 1024 * 1024):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._items: OrderedDict = OrderedDict()  # path -> (stamp, model, nbytes, {имя: функция})
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _stamp(path: str) -> tuple:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+
+    def get(self, path: str) -> tf.keras.Model:
+        path = os.path.abspath(path)
+        stamp = self._stamp(path)
+        with self._lock:
+            entry = self._items.get(path)
+            if entry is not None and entry[0] == stamp:
+                self._items.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        model = tf.keras.models.load_model(path)
+        nbytes = int(sum(w.nbytes for w in model.get_weights()))
+        with self._lock:
+            self._items[path] = (stamp, model, nbytes, {})
+            self._items.move_to_end(path)
+            self._evict()
+        return model
+
+    def compiled(self, path: str, name: str, build) -> tuple:
+        """(модель, build(модель)): функция строится один раз на запись кэша.
+        Замыкание функции держит модель, поэтому хранить её можно только здесь:
+        при вытеснении или смене файла запись уходит вместе с моделью."""
+        model = self.get(path)
+        path = os.path.abspath(path)
+        with self._lock:
+            entry = self._items.get(path)
+            fns = entry[3] if entry is not None and entry[1] is model else None
+            fn = fns.get(name) if fns is not None else None
+        if fn is None:
+            fn = build(model)
+            if fns is not None:
+                with self._lock:
+                    fn = fns.setdefault(name, fn)
+        return model, fn
+
+    def invalidate(self, path: str | None = None) -> None:
+        with self._lock:
+            if path is None:
+                self._items.clear()
+            else:
+                self._items.pop(os.path.abspath(path), None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'items': len(self._items),
+                'bytes': sum(e[2] for e in self._items.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def _evict(self) -> None:
+        total = sum(e[2] for e in self._items.values())
+        while len(self._items) > 1 and (len(self._items) > self.max_items or total > self.max_bytes):
+            _, entry = self._items.popitem(last=False)
+            total -= entry[2]
+
+
+MODEL_CACHE = ModelCache(
+    max_items=int(os.environ.get('MODEL_CACHE_ITEMS', 8)),
+    max_bytes=int(float(os.environ.get('MODEL_CACHE_MB', 512)) * 1024 * 1024),
+)
+
+
+def _window_count(length: int, window: int, horizon: int) -> int:
+    return max(0, length - window - horizon + 1)
+
+
 def make_dataset(series: np.ndarray, window: int, horizon: int) -> Tuple[np.ndarray, np.ndarray]:
-    X, y = [], []
-    for i in range(0, len(series) - window - horizon + 1):
-        X.append(series[i:i+window])
-        y.append(series[i+window:i+window+horizon])
-    X = np.array(X)[..., np.newaxis]
-    y = np.array(y)
+    """Окна X и цели y как представления ряда (sliding_window_view), без копирования."""
+    series = np.asarray(series)
+    count = _window_count(len(series), window, horizon)
+    if count == 0:
+        return np.empty((0, window, 1), dtype=series.dtype), np.empty((0, horizon), dtype=series.dtype)
+    X = np.lib.stride_tricks.sliding_window_view(series, window)[:count][..., np.newaxis]
+    y = np.lib.stride_tricks.sliding_window_view(series[window:], horizon)[:count]
     return X, y
 
 
-def build_mlp(window: int, horizon: int, lr: float) -> tf.keras.Model:
+def make_tf_dataset(series: np.ndarray, window: int, horizon: int, batch_size: int,
+                    start: int = 0, stop: int | None = None, shuffle: bool = False,
+                    indices: np.ndarray | None = None) -> tf.data.Dataset:
+    """tf.data-конвейер окон [start, stop): в памяти лежит только сам ряд (float32),
+    окна собираются пачками через tf.gather по индексам начала окна.
+    indices — явный набор начал окон вместо диапазона.
+    """
+    values = tf.constant(np.asarray(series, dtype=np.float32))
+    if stop is None:
+        stop = _window_count(len(series), window, horizon)
+    x_offsets = tf.range(window, dtype=tf.int64)
+    y_offsets = tf.range(window, window + horizon, dtype=tf.int64)
+
+    def gather(idx):
+        idx = idx[:, tf.newaxis]
+        return tf.gather(values, idx + x_offsets)[..., tf.newaxis], tf.gather(values, idx + y_offsets)
+
+    if indices is not None:
+        ds = tf.data.Dataset.from_tensor_slices(np.asarray(indices, dtype=np.int64))
+        size = len(indices)
+    else:
+        ds = tf.data.Dataset.range(start, stop)
+        size = stop - start
+    if shuffle:
+        ds = ds.shuffle(max(1, size), reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size).map(gather, num_parallel_calls=tf.data.AUTOTUNE)
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+
+class ProgressCallback(tf.keras.callbacks.Callback):
+    """Публикует метрики обучения: после каждой эпохи и, если задано
+    every_n_batches, каждые N батчей. publish получает словарь события;
+    should_stop() позволяет досрочно остановить обучение.
+    """
+
+    def __init__(self, publish, every_n_batches: int = 0, should_stop=None):
+        super().__init__()
+        self.publish = publish
+        self.every_n_batches = max(0, int(every_n_batches))
+        self.should_stop = should_stop
+        self._epoch = 0
+
+    @staticmethod
+    def _metrics(logs) -> Dict[str, Any]:
+        out = {}
+        for key, value in (logs or {}).items():
+            try:
+                v = float(value)
+            except (TypeError, ValueError):
+                continue
+            out[key] = v if math.isfinite(v) else None
+        return out
+
+    def _fraction(self, epoch: float) -> float:
+        return min(1.0, epoch / max(1, self.params.get('epochs') or 1))
+
+    def _check_stop(self) -> None:
+        if self.should_stop is not None and self.should_stop():
+            self.model.stop_training = True
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch = epoch
+
+    def on_train_batch_end(self, batch, logs=None):
+        if self.every_n_batches and (batch + 1) % self.every_n_batches == 0:
+            steps = self.params.get('steps') or 0
+            part = (batch + 1) / steps if steps else 0.0
+            self.publish({'event': 'batch', 'epoch': self._epoch + 1, 'batch': batch + 1,
+                          'fraction': self._fraction(self._epoch + part), 'metrics': self._metrics(logs)})
+            self._check_stop()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.publish({'event': 'epoch', 'epoch': epoch + 1, 'epochs': self.params.get('epochs'),
+                      'fraction': self._fraction(epoch + 1), 'metrics': self._metrics(logs)})
+        self._check_stop()
+
+
+def _fit(model: tf.keras.Model, series: np.ndarray, cfg: ModelConfig, val_split: float = 0.0, callbacks: list | None = None):
+    """model.fit по конвейеру окон; валидация — хвост окон, как у validation_split в Keras."""
+    count = _window_count(len(series), cfg.window, cfg.horizon)
+    split_at = int(math.ceil(count * (1.0 - val_split))) if val_split > 0 else count
+    train_ds = make_tf_dataset(series, cfg.window, cfg.horizon, cfg.batch_size, 0, split_at, shuffle=True)
+    val_ds = None
+    if split_at < count:
+        val_ds = make_tf_dataset(series, cfg.window, cfg.horizon, cfg.batch_size, split_at, count)
+    return model.fit(train_ds, validation_data=val_ds, epochs=cfg.epochs, callbacks=callbacks, verbose=0)
+
+
+def _compile(model: tf.keras.Model, lr: float, profile: RuntimeProfile, dtype: str | None = None) -> tf.keras.Model:
+    optimizer = tf.keras.optimizers.Adam(lr)
+    if dtype == 'mixed_float16':
+        # Глобальная политика не задаётся, поэтому масштабирование loss включаем сами:
+        # без него малые градиенты в float16 обнуляются
+        optimizer = tf.keras.mixed_precision.LossScaleOptimizer(optimizer)
+    model.compile(optimizer=optimizer, loss='mse', metrics=['mae'], jit_compile=profile.jit_compile)
+    return model
+
+
+def build_mlp(window: int, horizon: int, lr: float, profile: RuntimeProfile | None = None) -> tf.keras.Model:
+    profile = profile or RUNTIME_PROFILE
+    dt = profile.layer_dtype('mlp')
     inp = tf.keras.Input(shape=(window, 1))
-    x = tf.keras.layers.Flatten()(inp)
-    x = tf.keras.layers.Dense(128, activation='relu')(x)
-    x = tf.keras.layers.Dense(64, activation='relu')(x)
-    out = tf.keras.layers.Dense(horizon)(x)
+    x = tf.keras.layers.Flatten(dtype=dt)(inp)
+    x = tf.keras.layers.Dense(128, activation='relu', dtype=dt)(x)
+    x = tf.keras.layers.Dense(64, activation='relu', dtype=dt)(x)
+    # Выход всегда float32: loss и прогноз считаются в полной точности
+    out = tf.keras.layers.Dense(horizon, dtype='float32')(x)
     model = tf.keras.Model(inp, out)
-    model.compile(optimizer=tf.keras.optimizers.Adam(lr), loss='mse', metrics=['mae'])
-    return model
+    return _compile(model, lr, profile, dt)
 
 
-def build_cnn(window: int, horizon: int, lr: float) -> tf.keras.Model:
+def build_cnn(window: int, horizon: int, lr: float, profile: RuntimeProfile | None = None) -> tf.keras.Model:
+    profile = profile or RUNTIME_PROFILE
+    dt = profile.layer_dtype('cnn')
     inp = tf.keras.Input(shape=(window, 1))
-    x = tf.keras.layers.Conv1D(32, 3, activation='relu', padding='causal')(inp)
-    x = tf.keras.layers.Conv1D(32, 3, activation='relu', padding='causal')(x)
-    x = tf.keras.layers.GlobalAveragePooling1D()(x)
-    x = tf.keras.layers.Dense(64, activation='relu')(x)
-    out = tf.keras.layers.Dense(horizon)(x)
+    x = tf.keras.layers.Conv1D(32, 3, activation='relu', padding='causal', dtype=dt)(inp)
+    x = tf.keras.layers.Conv1D(32, 3, activation='relu', padding='causal', dtype=dt)(x)
+    x = tf.keras.layers.GlobalAveragePooling1D(dtype=dt)(x)
+    x = tf.keras.layers.Dense(64, activation='relu', dtype=dt)(x)
+    out = tf.keras.layers.Dense(horizon, dtype='float32')(x)
     model = tf.keras.Model(inp, out)
-    model.compile(optimizer=tf.keras.optimizers.Adam(lr), loss='mse', metrics=['mae'])
-    return model
+    return _compile(model, lr, profile, dt)
 
 
-def build_rnn(window: int, horizon: int, lr: float) -> tf.keras.Model:
+def build_rnn(window: int, horizon: int, lr: float, profile: RuntimeProfile | None = None) -> tf.keras.Model:
+    profile = profile or RUNTIME_PROFILE
     inp = tf.keras.Input(shape=(window, 1))
     x = tf.keras.layers.SimpleRNN(64, return_sequences=False)(inp)
     x = tf.keras.layers.Dense(64, activation='relu')(x)
     out = tf.keras.layers.Dense(horizon)(x)
     model = tf.keras.Model(inp, out)
-    model.compile(optimizer=tf.keras.optimizers.Adam(lr), loss='mse', metrics=['mae'])
-    return model
+    return _compile(model, lr, profile)
 
 
-def build_model(cfg: ModelConfig) -> tf.keras.Model:
+def build_model(cfg: ModelConfig, profile: RuntimeProfile | None = None) -> tf.keras.Model:
+    profile = profile or RUNTIME_PROFILE
+    apply_runtime_profile(profile)
     if cfg.model_type == 'mlp':
-        return build_mlp(cfg.window, cfg.horizon, cfg.learning_rate)
+        return build_mlp(cfg.window, cfg.horizon, cfg.learning_rate, profile)
     if cfg.model_type == 'cnn':
-        return build_cnn(cfg.window, cfg.horizon, cfg.learning_rate)
+        return build_cnn(cfg.window, cfg.horizon, cfg.learning_rate, profile)
     if cfg.model_type == 'rnn':
-        return build_rnn(cfg.window, cfg.horizon, cfg.learning_rate)
+        return build_rnn(cfg.window, cfg.horizon, cfg.learning_rate, profile)
     raise ValueError('unknown model_type')
 
 
@@ -103,12 +382,21 @@ def _load_or_build_model(cfg: ModelConfig, save_dir: str | None) -> tuple[tf.ker
     return build_model(cfg), continued
 
 
+def _export_numpy(model: tf.keras.Model, save_dir: str) -> None:
+    """model.npz для прогноза без TensorFlow; если слой не поддержан — экспорта нет."""
+    path = os.path.join(save_dir, NPZ_NAME)
+    try:
+        export_numpy_model(model, path, source_path=os.path.join(save_dir, 'model.keras'))
+    except ValueError:
+        if os.path.exists(path):
+            os.remove(path)
+
+
 def train_and_predict(series: np.ndarray, cfg: ModelConfig, save_dir: str | None = None) -> Dict[str, Any]:
-    X, y = make_dataset(series, cfg.window, cfg.horizon)
-    if len(X) < 2:
+    if _window_count(len(series), cfg.window, cfg.horizon) < 2:
         raise ValueError('Недостаточно данных для обучения')
     model = build_model(cfg)
-    history = model.fit(X, y, epochs=cfg.epochs, batch_size=cfg.batch_size, verbose=0)
+    history = _fit(model, series, cfg)
     last_window = series[-cfg.window:][np.newaxis, ..., np.newaxis]
     pred = model.predict(last_window, verbose=0)[0]
     result = {
@@ -118,76 +406,227 @@ def train_and_predict(series: np.ndarray, cfg: ModelConfig, save_dir: str | None
     if save_dir:
         os.makedirs(save_dir, exist_ok=True)
         model.save(os.path.join(save_dir, 'model.keras'))
+        MODEL_CACHE.invalidate(os.path.join(save_dir, 'model.keras'))
+        _export_numpy(model, save_dir)
         with open(os.path.join(save_dir, 'train_meta.txt'), 'w', encoding='utf-8') as f:
             f.write(str(cfg))
     return result
 
 
-def train_model(series: np.ndarray, cfg: ModelConfig, save_dir: str | None = None) -> Dict[str, Any]:
+def _history_result(history) -> Dict[str, Any]:
+    h = history.history
+    train_loss = float(h['loss'][-1])
+    return {
+        'loss': train_loss,
+        'val_loss': float(h.get('val_loss', [train_loss])[-1]),
+        'val_mae': float(h.get('val_mae', [0.0])[-1]),
+        'loss_curve': [float(v) for v in h.get('loss', [])],
+        'val_loss_curve': [float(v) for v in h.get('val_loss', [])],
+        'mae_curve': [float(v) for v in h.get('mae', [])],
+        'val_mae_curve': [float(v) for v in h.get('val_mae', [])],
+        'epochs_done': len(h.get('loss', [])),
+    }
+
+
+def _save_trained(model: tf.keras.Model, cfg: ModelConfig, save_dir: str, train_loss: float) -> str:
+    os.makedirs(save_dir, exist_ok=True)
+    # Информативное имя файла (повышенная точность и train loss вместо val_loss)
+    safe_lr = f"{cfg.learning_rate:.6f}".rstrip('0').rstrip('.')
+    safe_loss = f"{train_loss:.6f}"
+    filename = f"model_{cfg.model_type}_win{cfg.window}_hor{cfg.horizon}_ep{cfg.epochs}_bs{cfg.batch_size}_lr{safe_lr}_loss{safe_loss}.keras"
+    model.save(os.path.join(save_dir, filename))
+    # Копия по умолчанию для прогнозатора
+    model.save(os.path.join(save_dir, 'model.keras'))
+    MODEL_CACHE.invalidate(os.path.join(save_dir, 'model.keras'))
+    _export_numpy(model, save_dir)
+    with open(os.path.join(save_dir, 'train_meta.txt'), 'w', encoding='utf-8') as f:
+        f.write(str(cfg))
+    return filename
+
+
+def train_model(series: np.ndarray, cfg: ModelConfig, save_dir: str | None = None, callbacks: list | None = None) -> Dict[str, Any]:
     """Только обучение и сохранение модели.
-    Возвращает финальный loss.
+    Возвращает финальный loss. callbacks — дополнительные Keras-колбэки
+    (например, ProgressCallback для трансляции хода обучения).
     """
-    X, y = make_dataset(series, cfg.window, cfg.horizon)
-    if len(X) < 2:
+    if _window_count(len(series), cfg.window, cfg.horizon) < 2:
         raise ValueError('Недостаточно данных для обучения')
     model, continued = _load_or_build_model(cfg, save_dir)
-    history = model.fit(
-        X, y,
-        epochs=cfg.epochs,
-        batch_size=cfg.batch_size,
-        validation_split=max(0.0, min(0.5, float(cfg.val_split))),
-        verbose=0
-    )
-    train_loss = float(history.history['loss'][-1])
-    val_loss = float(history.history.get('val_loss', [train_loss])[-1])
-    val_mae = float(history.history.get('val_mae', [0.0])[-1])
-    loss_curve = [float(v) for v in history.history.get('loss', [])]
-    val_loss_curve = [float(v) for v in history.history.get('val_loss', [])]
-    mae_curve = [float(v) for v in history.history.get('mae', [])]
-    val_mae_curve = [float(v) for v in history.history.get('val_mae', [])]
-    saved_name = None
-    if save_dir:
-        os.makedirs(save_dir, exist_ok=True)
-        # Информативное имя файла (повышенная точность и train loss вместо val_loss)
-        safe_lr = f"{cfg.learning_rate:.6f}".rstrip('0').rstrip('.')
-        safe_loss = f"{train_loss:.6f}"
-        filename = f"model_{cfg.model_type}_win{cfg.window}_hor{cfg.horizon}_ep{cfg.epochs}_bs{cfg.batch_size}_lr{safe_lr}_loss{safe_loss}.keras"
-        model.save(os.path.join(save_dir, filename))
-        # Копия по умолчанию для прогнозатора
-        model.save(os.path.join(save_dir, 'model.keras'))
-        with open(os.path.join(save_dir, 'train_meta.txt'), 'w', encoding='utf-8') as f:
-            f.write(str(cfg))
-        saved_name = filename
-    return {
-        'loss': train_loss,
-        'val_loss': val_loss,
-        'val_mae': val_mae,
-        'model_file': saved_name,
-        'loss_curve': loss_curve,
-        'val_loss_curve': val_loss_curve,
-        'mae_curve': mae_curve,
-        'val_mae_curve': val_mae_curve,
-        'continued': continued,
-    }
+    history = _fit(model, series, cfg, val_split=max(0.0, min(0.5, float(cfg.val_split))), callbacks=callbacks)
+    result = _history_result(history)
+    saved_name = _save_trained(model, cfg, save_dir, result['loss']) if save_dir else None
+    return {**result, 'model_file': saved_name, 'continued': continued}
 
 
-def iterative_forecast(series: np.ndarray, model_path: str, window: int, steps: int, horizon: int, context: int | None = None) -> np.ndarray:
+def finetune_model(series: np.ndarray, cfg: ModelConfig, save_dir: str, since: int, replay: float = 0.0,
+                   seed: int | None = None, callbacks: list | None = None) -> Dict[str, Any]:
+    """Дообучение сохранённой модели на дописанных данных.
+    since — длина ряда при прошлом обучении: берутся только окна, цель которых
+    задевает точки от since и дальше, плюс replay * (число новых окон)
+    случайных старых окон, чтобы модель не забывала прежний режим ряда.
+    Валидация — хвост новых окон (доля cfg.val_split).
+    """
+    count = _window_count(len(series), cfg.window, cfg.horizon)
+    first_new = min(count, max(0, since - cfg.window - cfg.horizon + 1))
+    new_idx = np.arange(first_new, count, dtype=np.int64)
+    if new_idx.size == 0:
+        raise ValueError('Нет новых окон для дообучения')
+    model, continued = _load_or_build_model(cfg, save_dir)
+    if not continued:
+        raise ValueError('Нет сохранённой модели с таким окном и горизонтом для дообучения')
+
+    val_split = max(0.0, min(0.5, float(cfg.val_split)))
+    split_at = int(math.ceil(new_idx.size * (1.0 - val_split))) if new_idx.size > 1 else new_idx.size
+    train_idx, val_idx = new_idx[:split_at], new_idx[split_at:]
+    n_replay = min(first_new, int(round(max(0.0, replay) * train_idx.size)))
+    if n_replay:
+        old_idx = np.random.default_rng(seed).choice(first_new, size=n_replay, replace=False)
+        train_idx = np.concatenate([train_idx, old_idx])
+    train_ds = make_tf_dataset(series, cfg.window, cfg.horizon, cfg.batch_size, shuffle=True, indices=train_idx)
+    val_ds = make_tf_dataset(series, cfg.window, cfg.horizon, cfg.batch_size, indices=val_idx) if val_idx.size else None
+    history = model.fit(train_ds, validation_data=val_ds, epochs=cfg.epochs, callbacks=callbacks, verbose=0)
+    result = _history_result(history)
+    saved_name = _save_trained(model, cfg, save_dir, result['loss'])
+    return {**result, 'model_file': saved_name, 'continued': True,
+            'new_windows': int(new_idx.size), 'replay_windows': n_replay}
+
+
+def _forecast_fn(model: tf.keras.Model):
+    """Авторегрессионный цикл целиком в графе TensorFlow (tf.function + tf.while_loop):
+    один вызов на весь прогноз вместо model.predict на каждом шаге.
+    Окно — тензор фиксированной длины, сдвигается внутри графа.
+    Кэшируется в записи MODEL_CACHE (MODEL_CACHE.compiled).
+    """
+    @tf.function
+    def fn(window_values, calls, horizon: int):
+        width = window_values.shape[0]
+        out = tf.TensorArray(tf.float32, size=calls)
+
+        def body(i, win, out):
+            pred = model(win[tf.newaxis, :, tf.newaxis], training=False)[0][:horizon]
+            out = out.write(i, pred)
+            win = tf.ensure_shape(tf.concat([win, pred], axis=0)[-width:], [width])
+            return i + 1, win, out
+
+        _, _, out = tf.while_loop(lambda i, win, out: i < calls, body, (tf.constant(0), window_values, out))
+        return tf.reshape(out.stack(), [-1])
+
+    return fn
+
+
+def _forecast_predict(model: tf.keras.Model, last: np.ndarray, steps: int, horizon: int) -> np.ndarray:
+    """Исходный путь через model.predict; окно — кольцевой буфер двойной длины,
+    так что текущее окно всегда непрерывный срез без копирования ряда."""
+    window = last.shape[0]
+    ring = np.concatenate([last, last])
+    head = 0  # ring[head:head + window] — текущее окно
+    out = np.empty(steps * horizon, dtype=float)
+    for step in range(steps):
+        pred = model.predict(ring[head:head + window][np.newaxis, ..., np.newaxis], verbose=0)[0][:horizon]
+        out[step * horizon: step * horizon + len(pred)] = pred
+        for v in pred:
+            ring[head] = v
+            ring[head + window] = v
+            head = (head + 1) % window
+    return out
+
+
+def iterative_forecast(series: np.ndarray, model_path: str, window: int, steps: int, horizon: int,
+                       context: int | None = None, mode: str = 'compiled') -> np.ndarray:
     """Итеративный прогноз: модель предсказывает horizon точек, которые
     по мере необходимости добавляются в хвост ряда, пока не наберём steps.
+    mode='compiled' — цикл в tf.function, mode='predict' — model.predict на каждом шаге.
     """
     if steps <= 0:
         return np.array([], dtype=float)
-    model = tf.keras.models.load_model(model_path)
-    buffer = np.array(series, dtype=float).copy()
+    buffer = np.asarray(series, dtype=float)
     # если задано количество точек контекста для первого прогноза — обрежем
     if context is not None and context > 0 and context <= buffer.shape[0]:
         buffer = buffer[-context:]
-    out: list[float] = []
-    while len(out) < steps*horizon:
-        last_window = buffer[-window:][np.newaxis, ..., np.newaxis]
-        pred = model.predict(last_window, verbose=0)[0]
-        # добираем столько, сколько нужно
-        need = min(horizon, steps*horizon - len(out))
-        out.extend(pred[:need].tolist())
-        buffer = np.concatenate([buffer, pred[:need]])
-    return np.array(out, dtype=float)
+    last = buffer[-window:]
+    if last.shape[0] < window:
+        raise ValueError('Недостаточно точек контекста для окна модели')
+    if mode == 'predict':
+        return _forecast_predict(MODEL_CACHE.get(model_path), last.copy(), steps, horizon)
+    if mode != 'compiled':
+        raise ValueError('unknown forecast mode')
+    _, fn = MODEL_CACHE.compiled(model_path, 'forecast', _forecast_fn)
+    out = fn(tf.constant(last, dtype=tf.float32), tf.constant(steps), horizon)
+    return out.numpy().astype(float)
+
+
+def _batch_forecast_fn(model: tf.keras.Model):
+    """Тот же цикл, что в _forecast_fn, но для пачки окон [batch, window]:
+    на каждом шаге один вызов модели на все ряды сразу."""
+    @tf.function
+    def fn(windows, calls, horizon: int):
+        out = tf.TensorArray(tf.float32, size=calls)
+
+        def body(i, win, out):
+            pred = model(win[:, :, tf.newaxis], training=False)[:, :horizon]
+            out = out.write(i, pred)
+            win = tf.ensure_shape(tf.concat([win, pred], axis=1)[:, -windows.shape[1]:], windows.shape)
+            return i + 1, win, out
+
+        _, _, out = tf.while_loop(lambda i, win, out: i < calls, body, (tf.constant(0), windows, out))
+        # [calls, batch, horizon] -> [batch, calls * horizon]
+        return tf.reshape(tf.transpose(out.stack(), [1, 0, 2]), [windows.shape[0], -1])
+
+    return fn
+
+
+def _bucket(n: int, max_batch: int) -> int:
+    # Размер пачки округляется до степени двойки: число трассировок tf.function ограничено
+    size = 1
+    while size < n:
+        size *= 2
+    return min(size, max_batch)
+
+
+def batch_forecast(requests: List[Dict[str, Any]], max_batch: int = 256) -> List[Any]:
+    """Итеративный прогноз для многих рядов за раз.
+    Элемент requests: {'series', 'model_path', 'window', 'horizon', 'steps', 'context'?}.
+    Запросы к одной модели с одинаковыми window/horizon складываются в одну
+    пачку; прогноз каждого ряда — как у iterative_forecast(mode='compiled').
+    Возвращает массивы в порядке запросов; если запрос или его пачку посчитать
+    не удалось (короткий ряд, модель не загрузилась), на его месте — исключение,
+    остальные запросы считаются.
+    """
+    results: List[Any] = [np.array([], dtype=float) for _ in requests]
+    groups: Dict[tuple, List[int]] = {}
+    windows: Dict[int, np.ndarray] = {}
+    for i, req in enumerate(requests):
+        window, steps = int(req['window']), int(req['steps'])
+        if steps <= 0:
+            continue
+        buffer = np.asarray(req['series'], dtype=float)
+        context = req.get('context')
+        if context is not None and 0 < context <= buffer.shape[0]:
+            buffer = buffer[-context:]
+        if buffer.shape[0] < window:
+            results[i] = ValueError(f'Запрос {i}: недостаточно точек контекста для окна модели')
+            continue
+        windows[i] = buffer[-window:]
+        key = (os.path.abspath(req['model_path']), window, int(req['horizon']))
+        groups.setdefault(key, []).append(i)
+
+    for (model_path, window, horizon), idx in groups.items():
+        try:
+            _, fn = MODEL_CACHE.compiled(model_path, 'batch_forecast', _batch_forecast_fn)
+            for start in range(0, len(idx), max_batch):
+                chunk = idx[start:start + max_batch]
+                size = _bucket(len(chunk), max_batch)
+                batch = np.empty((size, window), dtype=np.float32)
+                batch[:len(chunk)] = [windows[i] for i in chunk]
+                batch[len(chunk):] = batch[0]  # дополнение до размера пачки, результат отбрасывается
+                # Короткий прогноз — префикс длинного, поэтому считаем до максимума по пачке
+                calls = max(int(requests[i]['steps']) for i in chunk)
+                out = fn(tf.constant(batch), tf.constant(calls), horizon).numpy().astype(float)
+                for row, i in enumerate(chunk):
+                    results[i] = out[row, :int(requests[i]['steps']) * horizon]
+        except Exception as exc:
+            # Ошибка модели (файл не читается, ширина входа не совпадает с window)
+            # относится только к запросам этой пачки
+            for i in idx:
+                results[i] = exc
+    return results
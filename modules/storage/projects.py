@@ -1,12 +1,46 @@
+import hashlib
 import json
 import os
+import re
+import sqlite3
+import threading
+import time
 import uuid
 import shutil
-from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
 
 
 DATA_DIR = os.path.abspath(os.path.join(os.getcwd(), "data"))
 PROJECTS_FILE = os.path.join(DATA_DIR, "projects.json")
+PROJECTS_DB = os.path.join(DATA_DIR, "projects.db")
+
+# Проекты хранятся в SQLite (WAL): поиск по первичному ключу, атомарные
+# обновления и безопасная работа нескольких процессов gunicorn.
+# projects.json переносится в базу один раз при первом подключении.
+_local = threading.local()
+
+# Кэш чтения в памяти процесса. Проекты — по потокам, актуальность сверяется
+# с PRAGMA data_version соединения (меняется при записи из других соединений),
+# свои записи сбрасывают кэш явно. JSON-файлы снапшотов — общий LRU, ключ —
+# (inode, mtime_ns, size); запись идёт через os.replace, поэтому inode меняется.
+# Возвращаются поверхностные копии: вложенные значения общие, их не изменяем.
+FILE_CACHE_ITEMS = int(os.environ.get("SNAPSHOT_CACHE_ITEMS", "64"))
+_files: "OrderedDict[str, tuple]" = OrderedDict()
+_files_lock = threading.Lock()
+_stats = {"project_hits": 0, "project_misses": 0, "file_hits": 0, "file_misses": 0}
+
+# Снапшот хранится по этапам: snapshot/<stage>.json (компактный JSON) и
+# snapshot/blobs/<sha1>.npy — числовые и строковые ряды, адресуемые по содержимому.
+# Обновление одного этапа не переписывает остальные, чтение — только нужных этапов.
+SNAPSHOT_DIRNAME = "snapshot"
+BLOBS_DIRNAME = "blobs"
+BLOB_MIN_ITEMS = 32
+BLOB_GRACE_SEC = 60
+_STAGE_RE = re.compile(r"^[a-z_]+$")
 
 
 def ensure_data_dir() -> None:
@@ -14,36 +48,109 @@ def ensure_data_dir() -> None:
         os.makedirs(DATA_DIR, exist_ok=True)
 
 
-def _read_all() -> List[Dict[str, Any]]:
+def _connect() -> sqlite3.Connection:
+    # Отдельное соединение на поток (и на процесс — после fork не переиспользуем)
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
     ensure_data_dir()
-    if not os.path.exists(PROJECTS_FILE):
-        return []
+    conn = sqlite3.connect(PROJECTS_DB, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.execute("CREATE TABLE IF NOT EXISTS projects (id TEXT PRIMARY KEY, seq INTEGER NOT NULL, data TEXT NOT NULL)")
+    conn.execute("CREATE INDEX IF NOT EXISTS projects_seq ON projects (seq)")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    _migrate_json(conn)
+    _local.conn = conn
+    _local.pid = os.getpid()
+    return conn
+
+
+@contextmanager
+def _transaction(conn: sqlite3.Connection):
+    conn.execute("BEGIN IMMEDIATE")
     try:
-        with open(PROJECTS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return []
-
-
-def _write_all(items: List[Dict[str, Any]]) -> None:
-    ensure_data_dir()
-    with open(PROJECTS_FILE, "w", encoding="utf-8") as f:
-        json.dump(items, f, ensure_ascii=False, indent=2)
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _migrate_json(conn: sqlite3.Connection) -> None:
+    """Однократный перенос projects.json в базу."""
+    with _transaction(conn):
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return
+        items: List[Dict[str, Any]] = []
+        if os.path.exists(PROJECTS_FILE):
+            try:
+                with open(PROJECTS_FILE, "r", encoding="utf-8") as f:
+                    items = json.load(f)
+            except Exception:
+                items = []
+        # В JSON новые проекты идут первыми — сохраняем этот порядок через seq
+        conn.executemany(
+            "INSERT OR IGNORE INTO projects (id, seq, data) VALUES (?, ?, ?)",
+            [(p["id"], len(items) - i, json.dumps(p, ensure_ascii=False)) for i, p in enumerate(items) if p.get("id")],
+        )
+        conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', '1')")
+
+
+def _count(key: str) -> None:
+    with _files_lock:
+        _stats[key] += 1
+
+
+def cache_stats() -> Dict[str, int]:
+    """Счётчики попаданий/промахов кэша чтения (для мониторинга)."""
+    with _files_lock:
+        return {**_stats, "file_entries": len(_files)}
+
+
+def _project_cache(conn: sqlite3.Connection) -> Dict[str, Any]:
+    version = conn.execute("PRAGMA data_version").fetchone()[0]
+    cache = getattr(_local, "projects", None)
+    if cache is None or _local.projects_version != version:
+        cache = {}
+        _local.projects = cache
+        _local.projects_version = version
+    return cache
+
+
+def _drop_project_cache() -> None:
+    _local.projects = None
 
 
 def list_projects() -> List[Dict[str, Any]]:
-    return _read_all()
+    conn = _connect()
+    cache = _project_cache(conn)
+    items = cache.get("__list__")
+    if items is None:
+        _count("project_misses")
+        items = [json.loads(r[0]) for r in conn.execute("SELECT data FROM projects ORDER BY seq DESC").fetchall()]
+        cache["__list__"] = items
+    else:
+        _count("project_hits")
+    return [dict(p) for p in items]
 
 
 def get_project(project_id: str) -> Optional[Dict[str, Any]]:
-    for p in _read_all():
-        if p.get("id") == project_id:
-            return p
-    return None
+    conn = _connect()
+    cache = _project_cache(conn)
+    if project_id in cache:
+        _count("project_hits")
+        p = cache[project_id]
+    else:
+        _count("project_misses")
+        row = conn.execute("SELECT data FROM projects WHERE id = ?", (project_id,)).fetchone()
+        p = json.loads(row[0]) if row else None
+        cache[project_id] = p
+    return dict(p) if p is not None else None
 
 
 def create_project(name: str, description: str = "") -> Dict[str, Any]:
-    items = _read_all()
     project = {
         "id": str(uuid.uuid4()),
         "name": name.strip() or "Новый проект",
@@ -51,31 +158,42 @@ def create_project(name: str, description: str = "") -> Dict[str, Any]:
         "thumb": None,
         "status": "new",
     }
-    items.insert(0, project)
-    _write_all(items)
+    conn = _connect()
+    with _transaction(conn):
+        conn.execute(
+            "INSERT INTO projects (id, seq, data) VALUES (?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM projects), ?)",
+            (project["id"], json.dumps(project, ensure_ascii=False)),
+        )
+    _drop_project_cache()
     return project
 
 
 def update_project(project_id: str, **fields: Any) -> Optional[Dict[str, Any]]:
-    items = _read_all()
-    for idx, p in enumerate(items):
-        if p.get("id") == project_id:
-            p.update(fields)
-            items[idx] = p
-            _write_all(items)
-            return p
-    return None
+    conn = _connect()
+    with _transaction(conn):
+        row = conn.execute("SELECT data FROM projects WHERE id = ?", (project_id,)).fetchone()
+        if not row:
+            return None
+        p = json.loads(row[0])
+        p.update(fields)
+        conn.execute("UPDATE projects SET data = ? WHERE id = ?", (json.dumps(p, ensure_ascii=False), project_id))
+    _drop_project_cache()
+    return p
 
 
 def delete_project(project_id: str) -> bool:
-    items = _read_all()
-    new_items = [p for p in items if p.get("id") != project_id]
-    if len(new_items) != len(items):
-        _write_all(new_items)
+    conn = _connect()
+    with _transaction(conn):
+        deleted = conn.execute("DELETE FROM projects WHERE id = ?", (project_id,)).rowcount
+    _drop_project_cache()
+    if deleted:
         # Удаляем папку проекта и все файлы
         project_path = os.path.join(DATA_DIR, "projects", project_id)
         if os.path.exists(project_path):
             shutil.rmtree(project_path)
+        with _files_lock:
+            for key in [k for k in _files if k.startswith(project_path + os.sep)]:
+                del _files[key]
         return True
     return False
 
@@ -87,36 +205,252 @@ def project_dir(project_id: str) -> str:
     return path
 
 
-def save_snapshot(project_id: str, data: Dict[str, any]) -> str:
-    path = os.path.join(project_dir(project_id), "snapshot.json")
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+def _stamp(st: os.stat_result) -> tuple:
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _remember(path: str, stamp: tuple, data: Any) -> None:
+    with _files_lock:
+        _files[path] = (stamp, data)
+        _files.move_to_end(path)
+        while len(_files) > FILE_CACHE_ITEMS:
+            _files.popitem(last=False)
+
+
+def _read_json_cached(path: str, decode: Optional[Callable[[Any], Any]] = None) -> Optional[Any]:
+    try:
+        stamp = _stamp(os.stat(path))
+    except FileNotFoundError:
+        return None
+    with _files_lock:
+        entry = _files.get(path)
+        if entry is not None and entry[0] == stamp:
+            _files.move_to_end(path)
+            _stats["file_hits"] += 1
+            data = entry[1]
+        else:
+            _stats["file_misses"] += 1
+            data = None
+    if data is None:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if decode is not None:
+            data = decode(data)
+        _remember(path, stamp, data)
+    return dict(data) if isinstance(data, dict) else data
+
+
+def _write_json_cached(path: str, data: Any, cached: Any = None, **dump_kwargs: Any) -> str:
+    # Пишем во временный файл и подменяем атомарно: читатели не видят недописанный JSON
+    tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, **dump_kwargs)
+    os.replace(tmp, path)
+    value = data if cached is None else cached
+    _remember(path, _stamp(os.stat(path)), dict(value) if isinstance(value, dict) else value)
     return path
 
 
-def load_snapshot(project_id: str) -> Optional[Dict[str, any]]:
-    path = os.path.join(project_dir(project_id), "snapshot.json")
-    if not os.path.exists(path):
+def _snapshot_dir(project_id: str) -> str:
+    return os.path.join(project_dir(project_id), SNAPSHOT_DIRNAME)
+
+
+def _stage_path(project_id: str, stage: str) -> str:
+    if not _STAGE_RE.match(stage):
+        raise ValueError(f"Недопустимое имя этапа снапшота: {stage}")
+    return os.path.join(_snapshot_dir(project_id), f"{stage}.json")
+
+
+def _blob_array(values: list) -> Optional[np.ndarray]:
+    # В бинарный вид уходят только однородные списки, которые восстанавливаются без потерь
+    if len(values) < BLOB_MIN_ITEMS:
         return None
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    kinds = {type(v) for v in values}
+    if kinds == {float}:
+        return np.asarray(values, dtype=np.float64)
+    if kinds == {int}:
+        arr = np.asarray(values, dtype=object)
+        try:
+            return arr.astype(np.int64)
+        except OverflowError:
+            return None
+    if kinds == {str} and all(v.isascii() and not v.endswith("\0") for v in values):
+        # ASCII-строки (метки времени и т.п.) — по байту на символ
+        return np.asarray(values, dtype=bytes)
+    return None
+
+
+def _encode(value: Any, blobs: Dict[str, np.ndarray]) -> Any:
+    if isinstance(value, dict):
+        return {k: _encode(v, blobs) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        value = list(value)
+        arr = _blob_array(value)
+        if arr is not None:
+            key = hashlib.sha1(arr.dtype.str.encode() + arr.tobytes()).hexdigest()
+            blobs[key] = arr
+            return {"$npy": key}
+        # Записи (список словарей с одинаковыми ключами) храним по колонкам
+        if len(value) >= BLOB_MIN_ITEMS and all(isinstance(r, dict) for r in value):
+            keys = list(value[0].keys())
+            if all(list(r.keys()) == keys for r in value):
+                return {"$records": keys, "columns": [_encode([r[k] for r in value], blobs) for k in keys]}
+        return [_encode(v, blobs) for v in value]
+    return value
+
+
+def _decode(value: Any, blobs_dir: str) -> Any:
+    if isinstance(value, dict):
+        if len(value) == 1 and "$npy" in value:
+            arr = np.load(os.path.join(blobs_dir, f"{value['$npy']}.npy"), allow_pickle=False)
+            return (arr.astype(str) if arr.dtype.kind == "S" else arr).tolist()
+        if len(value) == 2 and "$records" in value:
+            keys = value["$records"]
+            columns = [_decode(c, blobs_dir) for c in value["columns"]]
+            return [dict(zip(keys, row)) for row in zip(*columns)]
+        return {k: _decode(v, blobs_dir) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v, blobs_dir) for v in value]
+    return value
+
+
+def _blob_refs(value: Any, out: set) -> set:
+    if isinstance(value, dict):
+        if len(value) == 1 and "$npy" in value:
+            out.add(value["$npy"])
+        else:
+            for v in value.values():
+                _blob_refs(v, out)
+    elif isinstance(value, list):
+        for v in value:
+            _blob_refs(v, out)
+    return out
+
+
+def _collect_blobs(project_id: str) -> None:
+    """Удаляет блобы, на которые не ссылается ни один этап."""
+    snap_dir = _snapshot_dir(project_id)
+    blobs_dir = os.path.join(snap_dir, BLOBS_DIRNAME)
+    if not os.path.isdir(blobs_dir):
+        return
+    refs: set = set()
+    for stage in snapshot_stages(project_id):
+        try:
+            with open(_stage_path(project_id, stage), "r", encoding="utf-8") as f:
+                _blob_refs(json.load(f), refs)
+        except FileNotFoundError:
+            continue
+    # Свежие блобы не трогаем: их этап может ещё записываться другим процессом
+    deadline = time.time() - BLOB_GRACE_SEC
+    for name in os.listdir(blobs_dir):
+        path = os.path.join(blobs_dir, name)
+        if name.endswith(".npy") and name[:-4] not in refs and os.path.getmtime(path) < deadline:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def _migrate_snapshot(project_id: str) -> None:
+    """Однократно раскладывает прежний snapshot.json по этапам."""
+    legacy = os.path.join(project_dir(project_id), "snapshot.json")
+    if not os.path.exists(legacy):
+        return
+    try:
+        with open(legacy, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = None
+    if isinstance(data, dict):
+        for stage, value in data.items():
+            if _STAGE_RE.match(stage):
+                save_snapshot_stage(project_id, stage, value, collect=False)
+    try:
+        os.remove(legacy)
+    except FileNotFoundError:
+        pass
+
+
+def snapshot_stages(project_id: str) -> List[str]:
+    """Имена сохранённых этапов снапшота."""
+    snap_dir = _snapshot_dir(project_id)
+    if not os.path.isdir(snap_dir):
+        return []
+    return sorted(name[:-5] for name in os.listdir(snap_dir) if name.endswith(".json") and _STAGE_RE.match(name[:-5]))
+
+
+def save_snapshot_stage(project_id: str, stage: str, data: Any, collect: bool = True) -> str:
+    """Атомарно сохраняет один этап снапшота (None — удалить этап)."""
+    path = _stage_path(project_id, stage)
+    if data is None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    else:
+        blobs_dir = os.path.join(_snapshot_dir(project_id), BLOBS_DIRNAME)
+        os.makedirs(blobs_dir, exist_ok=True)
+        blobs: Dict[str, np.ndarray] = {}
+        encoded = _encode(data, blobs)
+        for key, arr in blobs.items():
+            blob = os.path.join(blobs_dir, f"{key}.npy")
+            if os.path.exists(blob):
+                os.utime(blob)
+                continue
+            tmp = os.path.join(blobs_dir, f"{key}.tmp-{os.getpid()}-{threading.get_ident()}.npy")
+            np.save(tmp, arr, allow_pickle=False)
+            os.replace(tmp, blob)
+        _write_json_cached(path, encoded, cached=data, separators=(",", ":"))
+    if collect:
+        _collect_blobs(project_id)
+    return path
+
+
+def load_snapshot_stage(project_id: str, stage: str) -> Optional[Any]:
+    _migrate_snapshot(project_id)
+    path = _stage_path(project_id, stage)
+    blobs_dir = os.path.join(_snapshot_dir(project_id), BLOBS_DIRNAME)
+    try:
+        return _read_json_cached(path, decode=lambda raw: _decode(raw, blobs_dir))
+    except FileNotFoundError:
+        # Этап успели перезаписать, а старые блобы — убрать; читаем заново
+        return _read_json_cached(path, decode=lambda raw: _decode(raw, blobs_dir))
+
+
+def save_snapshot(project_id: str, data: Dict[str, any]) -> str:
+    """Заменяет снапшот целиком: этапы из data сохраняются, остальные удаляются."""
+    _migrate_snapshot(project_id)
+    for stage in snapshot_stages(project_id):
+        if stage not in data:
+            save_snapshot_stage(project_id, stage, None, collect=False)
+    for stage, value in data.items():
+        save_snapshot_stage(project_id, stage, value, collect=False)
+    _collect_blobs(project_id)
+    return _snapshot_dir(project_id)
+
+
+def load_snapshot(project_id: str, stages: Optional[Iterable[str]] = None) -> Optional[Dict[str, any]]:
+    """Собирает снапшот из этапов (по умолчанию — всех сохранённых)."""
+    _migrate_snapshot(project_id)
+    names = snapshot_stages(project_id) if stages is None else list(stages)
+    snapshot = {}
+    for stage in names:
+        value = load_snapshot_stage(project_id, stage)
+        if value is not None:
+            snapshot[stage] = value
+    return snapshot or None
 
 
 def save_snapshot_metadata(project_id: str, metadata: Dict[str, any]) -> str:
     """Сохраняет метаданные снапшота (имена файлов и конфигурацию)"""
     path = os.path.join(project_dir(project_id), "snapshot_meta.json")
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(metadata, f, ensure_ascii=False, indent=2)
-    return path
+    return _write_json_cached(path, metadata, indent=2)
 
 
 def load_snapshot_metadata(project_id: str) -> Optional[Dict[str, any]]:
     """Загружает метаданные снапшота"""
     path = os.path.join(project_dir(project_id), "snapshot_meta.json")
-    if not os.path.exists(path):
-        return None
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return _read_json_cached(path)
 
 
 def get_data_file_path(project_id: str) -> Optional[str]:
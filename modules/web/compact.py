@@ -0,0 +1,152 @@
+"""Компактный формат ответов API и сжатие.
+
+Клиент, приславший Accept: application/x-columnar+json, получает те же
+данные в колоночном виде (остальные — прежний JSON):
+- {"columns", "records": [{...}, ...]} -> {"columns", "$columns": {колонка: [...]}};
+- числовые списки -> {"$f8": base64} (float64 little-endian, пропуски — NaN),
+  при параметре floats=f4 дробные — {"$f4": ...} (float32, для графиков;
+  целые — {"$i4": ...} (int32), если помещаются, иначе float64 — он точен до 2**53);
+- целые арифметические прогрессии -> {"$range": [start, step, count]};
+- равномерные ISO-оси времени без зоны -> {"$time": [start, step_ms, count, unit]},
+  unit — точность исходных строк (D, m, s, ms); кодируются только оси, строки
+  которых восстанавливаются в точности, остальные передаются как есть.
+Обратное преобразование — static/js/utils/Columnar.js.
+
+compress_response сжимает JSON/HTML-ответы gzip или brotli (если установлен
+модуль brotli) по Accept-Encoding.
+"""
+from __future__ import annotations
+
+import base64
+import gzip
+import json
+import re
+from typing import Any, Optional
+
+import numpy as np
+from flask import Response, jsonify, request
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: без него ответы сжимаются gzip
+    brotli = None
+
+
+COLUMNAR_MIMETYPE = "application/x-columnar+json"
+MIN_ITEMS = 16
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_MIMETYPES = ("application/json", COLUMNAR_MIMETYPE, "text/html")
+_ISO_RE = re.compile(r"^\d{4}-\d{2}-\d{2}(T\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?$")
+# Точности, которые клиент восстанавливает без потерь (Date в JS — миллисекунды)
+_TIME_UNITS = {10: "D", 16: "m", 19: "s", 23: "ms"}
+
+
+def _columnar_floats() -> Optional[str]:
+    """'f8'/'f4', если клиент просит колоночный формат, иначе None."""
+    accept = request.headers.get("Accept", "")
+    for part in accept.split(","):
+        fields = [f.strip() for f in part.split(";")]
+        if fields[0] != COLUMNAR_MIMETYPE:
+            continue
+        params = dict(f.split("=", 1) for f in fields[1:] if "=" in f)
+        if params.get("q", "1") in ("0", "0.0"):
+            return None
+        return "f4" if params.get("floats") == "f4" else "f8"
+    return None
+
+
+def _number_list(values: list) -> Optional[np.ndarray]:
+    if not all(v is None or (isinstance(v, (int, float)) and not isinstance(v, bool)) for v in values):
+        return None
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+def _encode_time(values: list) -> Optional[dict]:
+    """{"$time": ...} для равномерной оси, если строки восстанавливаются
+    в точности (та же точность и запись), иначе None."""
+    unit = _TIME_UNITS.get(len(values[0])) if isinstance(values[0], str) else None
+    if unit is None or not all(isinstance(v, str) and _ISO_RE.match(v) for v in values):
+        return None
+    try:
+        stamps = np.array(values, dtype=f"datetime64[{unit}]")
+    except ValueError:
+        return None
+    if np.isnat(stamps).any() or np.datetime_as_string(stamps, unit=unit).tolist() != values:
+        return None
+    ms = stamps.astype("datetime64[ms]").astype(np.int64)
+    steps = np.diff(ms)
+    if not (steps == steps[0]).all():
+        return None
+    return {"$time": [values[0], int(steps[0]), len(values), unit]}
+
+
+def _encode_list(values: list, floats: str) -> Any:
+    if len(values) < MIN_ITEMS:
+        return [encode_columnar(v, floats) for v in values]
+    first = values[0]
+    if isinstance(first, str):
+        axis = _encode_time(values)
+        return values if axis is None else axis
+    if isinstance(first, (dict, list)):
+        return [encode_columnar(v, floats) for v in values]
+    arr = _number_list(values)
+    if arr is None:
+        return values
+    if all(isinstance(v, int) for v in values):
+        steps = np.diff(arr)
+        if (steps == steps[0]).all():
+            return {"$range": [values[0], values[1] - values[0], len(values)]}
+        if abs(arr).max() < 2 ** 31:
+            return {"$i4": base64.b64encode(arr.astype("<i4").tobytes()).decode("ascii")}
+        floats = "f8"
+    dtype = "<f4" if floats == "f4" else "<f8"
+    return {f"${floats}": base64.b64encode(arr.astype(dtype).tobytes()).decode("ascii")}
+
+
+def encode_columnar(obj: Any, floats: str = "f8") -> Any:
+    """Переводит ответ в колоночный формат (см. описание модуля)."""
+    if isinstance(obj, dict):
+        records = obj.get("records")
+        if isinstance(records, list) and records and all(isinstance(r, dict) for r in records):
+            names = list(obj.get("columns") or [])
+            names += [k for k in records[0] if k not in names]
+            out = {k: encode_columnar(v, floats) for k, v in obj.items() if k != "records"}
+            out["$columns"] = {name: _encode_list([r.get(name) for r in records], floats) for name in names}
+            return out
+        return {k: encode_columnar(v, floats) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return _encode_list(obj, floats)
+    return obj
+
+
+def respond(payload: Any, status: int = 200) -> Response:
+    """jsonify с согласованием формата по заголовку Accept."""
+    floats = _columnar_floats()
+    if floats is None:
+        response = jsonify(payload)
+    else:
+        body = json.dumps(encode_columnar(payload, floats), ensure_ascii=False, separators=(",", ":"))
+        response = Response(body, mimetype=COLUMNAR_MIMETYPE)
+    response.status_code = status
+    response.vary.add("Accept")
+    return response
+
+
+def compress_response(response: Response) -> Response:
+    """after_request: сжатие ответа по Accept-Encoding (brotli, затем gzip)."""
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+            or response.status_code in (204, 304) or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+    data = response.get_data()
+    response.vary.add("Accept-Encoding")
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        response.set_data(brotli.compress(data, quality=4))
+        response.headers["Content-Encoding"] = "br"
+    elif accepted["gzip"]:
+        response.set_data(gzip.compress(data, compresslevel=5))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
@@ -1,10 +1,16 @@
+import json
 import os
-from flask import Blueprint, render_template, request, jsonify, abort
-from modules.storage.projects import get_project, update_project, save_snapshot, load_snapshot, save_snapshot_metadata, load_snapshot_metadata, get_data_file_path, delete_project
-from modules.data.ingest import save_uploaded_csv, dataframe_preview, sample_columns, restore_full_snapshot_from_metadata
-from modules.data.preprocess import preprocess_pipeline
-from modules.models.tf_models import ModelConfig, train_and_predict, train_model, iterative_forecast
-import math
+import time
+import uuid
+from flask import Blueprint, Response, render_template, request, jsonify, abort, stream_with_context
+from modules.storage.projects import get_project, update_project, save_snapshot, save_snapshot_stage, load_snapshot_stage, save_snapshot_metadata, load_snapshot_metadata, get_data_file_path, delete_project, get_artifacts_dir, project_dir
+from modules.data.ingest import SNAPSHOT_STAGES, save_uploaded_csv, dataframe_preview, sample_columns, plot_columns, stage_config, stage_source, snapshot_outline, restore_snapshot_stage
+from modules.data.column_cache import build_column_cache, check_append_header
+from modules.data.downsample import METHODS as PLOT_METHODS, PLOT_POINTS
+from modules.data.preprocess import parse_pcts
+from modules.models.sweep import check_base, expand_space, load_leaderboard, sweep_workers
+from modules.web.compact import respond
+from modules.jobs.manager import CORE_BUDGET, FINISHED, submit as submit_job, get_job, get_result as get_job_result, list_jobs, cancel_job, request_stop, read_events
 
 
 project_bp = Blueprint(
@@ -14,6 +20,9 @@ project_bp = Blueprint(
 
 
 BASE_DATA_DIR = os.path.abspath(os.path.join(os.getcwd(), "data", "projects"))
+# Поток событий задачи: сколько держать одно соединение и через сколько переподключаться
+SSE_MAX_SECONDS = float(os.environ.get("SSE_MAX_SECONDS", 30))
+SSE_RETRY_MS = int(os.environ.get("SSE_RETRY_MS", 2000))
 
 
 @project_bp.route("/<project_id>/view")
@@ -22,15 +31,22 @@ def view(project_id: str):
     if not project:
         abort(404)
     
-    # Загружаем метаданные снапшота
-    metadata = load_snapshot_metadata(project_id)
-    data_path = get_data_file_path(project_id)
-    snapshot_old= load_snapshot(project_id) or {}
-    snapshot = restore_full_snapshot_from_metadata(project_id, metadata, data_path, snapshot_old)
-    
+    # В страницу — только метаданные; результаты этапов страница запрашивает сама
+    snapshot = snapshot_outline(load_snapshot_metadata(project_id) or {})
     return render_template("project_view.html", project=project, snapshot=snapshot)
 
 
+@project_bp.route("/<project_id>/snapshot/<stage>")
+def snapshot_stage(project_id: str, stage: str):
+    if not get_project(project_id):
+        return jsonify({"error": "Проект не найден"}), 404
+    if stage not in SNAPSHOT_STAGES:
+        return jsonify({"error": f"Неизвестный этап: {stage}"}), 400
+    metadata = load_snapshot_metadata(project_id) or {}
+    data = restore_snapshot_stage(project_id, stage, metadata, get_data_file_path(project_id))
+    return respond({"ok": True, "stage": stage, "data": data})
+
+
 @project_bp.route("/<project_id>/delete", methods=["GET", "POST"])
 def project_delete(project_id: str):
     project = get_project(project_id)
@@ -66,7 +82,10 @@ def upload(project_id: str):
     should_recreate_snapshot = (current_filename != previous_filename) or not file_exists
     
     update_project(project_id, data_path=path, status="uploaded")
+    # Один разбор CSV в колоночный кэш — дальше все маршруты читают нужные колонки из него
+    build_column_cache(path)
     preview = dataframe_preview(path)
+    preview["source"] = stage_source(path, {})
     
     if should_recreate_snapshot:
         # Пересоздаем метаданные снапшота с нуля
@@ -80,13 +99,49 @@ def upload(project_id: str):
         metadata["has_preview"] = True
         save_snapshot_metadata(project_id, metadata)
         # Обновляем только preview в существующем снапшоте
-        snap = load_snapshot(project_id) or {}
-        snap["preview"] = preview
-        save_snapshot(project_id, snap)
+        save_snapshot_stage(project_id, "preview", preview)
     
     return jsonify({"ok": True, "preview": preview, "recreated": should_recreate_snapshot})
 
 
+@project_bp.route("/<project_id>/append", methods=["POST"])
+def append(project_id: str):
+    """Дописывает новые строки (CSV с тем же заголовком) к данным проекта
+    фоновой задачей append. С полем train=1 та же задача затем дообучает
+    модель на новых окнах.
+    """
+    project = get_project(project_id)
+    if not project or not project.get("data_path"):
+        return jsonify({"error": "Данные не загружены"}), 400
+    if "file" not in request.files:
+        return jsonify({"error": "Файл не найден"}), 400
+    f = request.files["file"]
+    if not f.filename.lower().endswith(".csv"):
+        return jsonify({"error": "Ожидается CSV"}), 400
+
+    train_after = request.form.get("train") in ("1", "true")
+    if train_after:
+        if not project.get("target"):
+            return jsonify({"error": "Не указан target"}), 400
+        if not os.path.exists(os.path.join(get_artifacts_dir(project_id), "model.keras")):
+            return jsonify({"error": "Сначала обучите модель"}), 400
+
+    raw = f.read()
+    try:
+        check_append_header(project["data_path"], raw)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    # Разбор, продление кэша и превью — в задаче; строки ждут её во временном файле
+    upload = os.path.join(project_dir(project_id), f"append-{uuid.uuid4().hex}.csv")
+    with open(upload, "wb") as out:
+        out.write(raw)
+    payload = {"file": upload, "temp_files": [upload], "train": train_after}
+    for key in ("epochs", "replay", "batch_size"):
+        if request.form.get(key):
+            payload[key] = request.form[key]
+    return _submit(project_id, "append", payload)
+
+
 @project_bp.route("/<project_id>/select", methods=["POST"])
 def select_columns(project_id: str):
     project = get_project(project_id)
@@ -110,6 +165,8 @@ def select_columns(project_id: str):
     if time_column and time_column not in cols:
         cols.append(time_column)
     data = sample_columns(project["data_path"], cols)
+    # Для графика — весь файл, прореженный до ширины графика
+    data["plot"] = plot_columns(project["data_path"], cols, axis=time_column)
     update_project(project_id, target=target, features=features, status="selected")
     
     # Обновляем метаданные
@@ -119,12 +176,41 @@ def select_columns(project_id: str):
     save_snapshot_metadata(project_id, metadata)
     
     # Сохраняем только sample для быстрого доступа
-    snap = load_snapshot(project_id) or {}
-    snap["sample"] = data
-    snap["time"] = {"column": time_column, "kind": time_kind, "format": time_format}
-    save_snapshot(project_id, snap)
+    save_snapshot_stage(project_id, "sample", {**data, "source": stage_source(project["data_path"], stage_config("sample", metadata))})
+    save_snapshot_stage(project_id, "time", {"column": time_column, "kind": time_kind, "format": time_format})
     
-    return jsonify({"ok": True, "data": data, "time": {"column": time_column, "kind": time_kind, "format": time_format}})
+    return respond({"ok": True, "data": data, "time": {"column": time_column, "kind": time_kind, "format": time_format}})
+
+
+@project_bp.route("/<project_id>/series")
+def series(project_id: str):
+    """Ряды для графика: ?columns=a,b&start=&stop=&points=&method=lttb|minmax&axis=.
+    Без start/stop — весь файл; при приближении страница запрашивает видимый
+    участок, и если в нём не больше points строк, он приходит без прореживания.
+    """
+    project = get_project(project_id)
+    if not project or not project.get("data_path"):
+        return jsonify({"error": "Данные не загружены"}), 400
+    columns = [c for c in (request.args.get("columns") or "").split(",") if c]
+    if not columns:
+        return jsonify({"error": "Не указаны колонки"}), 400
+    method = request.args.get("method", "lttb")
+    if method not in PLOT_METHODS:
+        return jsonify({"error": f"Неизвестный метод прореживания: {method}"}), 400
+    try:
+        start = request.args.get("start", type=int)
+        stop = request.args.get("stop", type=int)
+        points = min(20_000, max(3, request.args.get("points", PLOT_POINTS, type=int)))
+        data = plot_columns(project["data_path"], columns, points=points, start=start, stop=stop,
+                            method=method, axis=request.args.get("axis") or None)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    return respond({"ok": True, "data": data})
+
+
+def _submit(project_id: str, kind: str, payload: dict):
+    job = submit_job(kind, project_id, payload)
+    return jsonify({"ok": True, "job_id": job["id"], "status": job["status"]}), 202
 
 
 @project_bp.route("/<project_id>/preprocess", methods=["POST"])
@@ -133,41 +219,13 @@ def preprocess(project_id: str):
     if not project or not project.get("data_path"):
         return jsonify({"error": "Данные не загружены"}), 400
     payload = request.get_json(silent=True) or {}
-    target = payload.get("target") or project.get("target")
-    method = payload.get("method", "cusum")
-    if not target:
+    if not (payload.get("target") or project.get("target")):
         return jsonify({"error": "Не указан target"}), 400
-
-    # Обновляем метаданные
-    metadata = load_snapshot_metadata(project_id) or {}
-    metadata["preprocess"] = {"target": target, "method": method}
-    save_snapshot_metadata(project_id, metadata)
-   
-    time_meta = (metadata.get("time") or {}) if isinstance(metadata, dict) else {}
-    time_col = time_meta.get("column")
-    if time_col:
-        df_info = sample_columns(project["data_path"], [target, time_col])
-    else:
-        df_info = sample_columns(project["data_path"], [target])
-
-    import pandas as pd
-    df = pd.DataFrame(df_info["records"])  # ограниченный набор для демо; позже читать весь файл постранично
-    out = preprocess_pipeline(df, target=target, method=method)
-    seg = out["segment"].to_dict(orient="records")
-
-    update_project(project_id, preprocessed=True)
-    
-    # Сохраняем только результаты предобработки для быстрого доступа
-    snap = load_snapshot(project_id) or {}
-    snap["preprocess"] = {"segment": {"columns": list(out["segment"].columns), "records": seg}, "bounds": out["bounds"], "curve": out["curve"]}
-    save_snapshot(project_id, snap)
-    
-    return jsonify({
-        "ok": True,
-        "segment": {"columns": list(out["segment"].columns), "records": seg},
-        "bounds": out["bounds"],
-        "curve": out["curve"],
-    })
+    try:
+        parse_pcts(payload.get("pcts"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return _submit(project_id, "preprocess", payload)
 
 
 @project_bp.route("/<project_id>/train", methods=["POST"])
@@ -176,109 +234,9 @@ def train(project_id: str):
     if not project or not project.get("data_path"):
         return jsonify({"error": "Данные не загружены"}), 400
     payload = request.get_json(silent=True) or {}
-    target = payload.get("target") or project.get("target")
-    model_type = payload.get("model", "mlp")
-    window = int(payload.get("window", 32))
-    horizon = int(payload.get("horizon", 12))
-    epochs = int(payload.get("epochs", 5))
-    batch_size = int(payload.get("batch_size", 32))
-    learning_rate = float(payload.get("learning_rate", 1e-3))
-    val_split = float(payload.get("val_split", 0.2))
-    if not target:
+    if not (payload.get("target") or project.get("target")):
         return jsonify({"error": "Не указан target"}), 400
-    # Загружаем target и, при наличии, временную колонку
-    import pandas as pd
-    metadata = load_snapshot_metadata(project_id) or {}
-    time_meta = (metadata.get("time") or {}) if isinstance(metadata, dict) else {}
-    time_col = time_meta.get("column")
-    usecols = [target] + ([time_col] if time_col else [])
-    df = pd.read_csv(project["data_path"], usecols=usecols)
-    series = df[target].astype(float).to_numpy()
-    cfg = ModelConfig(model_type=model_type, window=window, horizon=horizon, epochs=epochs, batch_size=batch_size, learning_rate=learning_rate, val_split=val_split)
-    # Только обучение на этом этапе
-    train_out = train_model(series, cfg, save_dir=os.path.join(BASE_DATA_DIR, project_id, "artifacts"))
-
-    # Подготовим временные оси для отрисовки прогноза
-    x_axes = {"base": None, "future": None}
-    try:
-        if time_col:
-            kind = time_meta.get("kind", "index")
-            fmt = time_meta.get("format")
-            if kind in ("timestamp_sec", "timestamp_ms"):
-                unit = "s" if kind == "timestamp_sec" else "ms"
-                t = pd.to_datetime(df[time_col], unit=unit, errors="coerce")
-            elif kind == "datetime_format" and fmt:
-                t = pd.to_datetime(df[time_col], format=fmt, errors="coerce")
-            elif kind in ("iso_date", "rfc_2822", "human_readable"):
-                t = pd.to_datetime(df[time_col], errors="coerce")
-            else:
-                t = None
-
-            if t is not None:
-                # сделать наивным без указания неподдерживаемых аргументов
-                if hasattr(t, 'dt'):
-                    x_base = t.dt.tz_localize(None)
-                else:
-                    try:
-                        x_base = t.tz_localize(None)
-                    except Exception:
-                        x_base = t
-                diffs = x_base.diff().dropna()
-                step = diffs.median() if not diffs.empty else pd.Timedelta(seconds=1)
-                last = x_base.iloc[-1]
-                future = [ (last + step * (i+1)).isoformat() for i in range(horizon) ]
-                x_axes["base"] = [d.isoformat() if hasattr(d, 'isoformat') else str(d) for d in x_base]
-                x_axes["future"] = future
-            else:
-                x_axes["base"] = list(range(len(series)))
-                x_axes["future"] = list(range(len(series), len(series)+horizon))
-        else:
-            x_axes["base"] = list(range(len(series)))
-            x_axes["future"] = list(range(len(series), len(series)+horizon))
-    except Exception:
-        x_axes["base"] = list(range(len(series)))
-        x_axes["future"] = list(range(len(series), len(series)+horizon))
-    update_project(project_id, model=model_type, horizon=horizon, status="trained")
-    
-    # Обновляем метаданные
-    metadata = load_snapshot_metadata(project_id) or {}
-    metadata["train"] = {
-        "target": target,
-        "cfg": {"model": model_type, "window": window, "horizon": horizon, "epochs": epochs}
-    }
-    save_snapshot_metadata(project_id, metadata)
-    
-    # Сохраняем только результаты обучения для быстрого доступа
-    # Санитизация значений (NaN/inf -> None)
-    def finite_or_none(v):
-        try:
-            f = float(v)
-            return f if math.isfinite(f) else None
-        except Exception:
-            return None
-
-    tr_loss = finite_or_none(train_out.get('loss'))
-    tr_vloss = finite_or_none(train_out.get('val_loss'))
-    tr_vmae = finite_or_none(train_out.get('val_mae'))
-
-    # Санитизация кривых обучения (NaN/inf -> None)
-    def sanitize_array(arr):
-        if not isinstance(arr, list):
-            return None
-        return [finite_or_none(v) for v in arr]
-
-    loss_curve = sanitize_array(train_out.get('loss_curve')) or []
-    val_loss_curve = sanitize_array(train_out.get('val_loss_curve')) or []
-    mae_curve = sanitize_array(train_out.get('mae_curve')) or []
-    val_mae_curve = sanitize_array(train_out.get('val_mae_curve')) or []
-
-    snap = load_snapshot(project_id) or {}
-    snap["train"] = {"loss": tr_loss, "val_loss": tr_vloss, "val_mae": tr_vmae, "model_file": train_out.get('model_file'), "loss_curve": loss_curve, "val_loss_curve": val_loss_curve, "mae_curve": mae_curve, "val_mae_curve": val_mae_curve, "x": x_axes, "cfg": {
-      "model": model_type, "window": window, "horizon": horizon, "epochs": epochs, "batch_size": batch_size, "learning_rate": learning_rate, "val_split": val_split
-    }}
-    save_snapshot(project_id, snap)
-    
-    return jsonify({"ok": True, "loss": tr_loss, "val_loss": tr_vloss, "val_mae": tr_vmae, "model_file": train_out.get('model_file'), "continued": bool(train_out.get('continued')), "loss_curve": loss_curve, "val_loss_curve": val_loss_curve, "mae_curve": mae_curve, "val_mae_curve": val_mae_curve, "x": x_axes})
+    return _submit(project_id, "train", payload)
 
 
 @project_bp.route("/<project_id>/forecast", methods=["POST"])
@@ -287,61 +245,120 @@ def forecast(project_id: str):
     if not project or not project.get("data_path"):
         return jsonify({"error": "Данные не загружены"}), 400
     payload = request.get_json(silent=True) or {}
-    target = payload.get("target") or project.get("target")
-    steps = int(payload.get("steps", 12))
-    context = payload.get("context")
-    try:
-        context = int(context) if context is not None else None
-    except Exception:
-        context = None
-    if not target:
+    if not (payload.get("target") or project.get("target")):
         return jsonify({"error": "Не указан target"}), 400
+    if not os.path.exists(os.path.join(get_artifacts_dir(project_id), "model.keras")):
+        return jsonify({"error": "Сначала обучите модель"}), 400
+    return _submit(project_id, "forecast", payload)
 
-    # Читаем конфигурацию из снапшота (из последнего обучения)
-    snap = load_snapshot(project_id) or {}
-    train_info = snap.get("train") or {}
-    cfg_info = (train_info.get("cfg") or {})
-    window = int(cfg_info.get("window", 32))
-    horizon = int(cfg_info.get("horizon", 12))
 
-    # Загружаем ряд и метаданные времени
-    import pandas as pd
-    metadata = load_snapshot_metadata(project_id) or {}
-    time_meta = (metadata.get("time") or {}) if isinstance(metadata, dict) else {}
-    time_col = time_meta.get("column")
-    usecols = [target] + ([time_col] if time_col else [])
-    df = pd.read_csv(project["data_path"], usecols=usecols)
-    series = df[target].astype(float).to_numpy()
-
-    model_path = os.path.join(BASE_DATA_DIR, project_id, "artifacts", "model.keras")
-    if not os.path.exists(model_path):
-        return jsonify({"error": "Сначала обучите модель"}), 400
+@project_bp.route("/<project_id>/sweep", methods=["GET", "POST"])
+def sweep(project_id: str):
+    project = get_project(project_id)
+    if not project:
+        abort(404)
+    if request.method == "GET":
+        # Таблица результатов последнего подбора
+        return jsonify({"ok": True, "leaderboard": load_leaderboard(get_artifacts_dir(project_id))})
+    if not project.get("data_path"):
+        return jsonify({"error": "Данные не загружены"}), 400
+    payload = request.get_json(silent=True) or {}
+    if not (payload.get("target") or project.get("target")):
+        return jsonify({"error": "Не указан target"}), 400
+    try:
+        expand_space(payload.get("space") or {}, mode=payload.get("mode", "grid"), n_trials=payload.get("n_trials"))
+        check_base(payload.get("base"))
+        sweep_workers(payload.get("workers"), payload.get("threads_per_trial", 1), CORE_BUDGET)
+    except (ValueError, KeyError, TypeError) as exc:
+        return jsonify({"error": str(exc)}), 400
+    return _submit(project_id, "sweep", payload)
+
+
+def _project_job(project_id: str, job_id: str):
+    job = get_job(job_id)
+    if not job or job.get("project_id") != project_id:
+        abort(404)
+    return job
+
+
+@project_bp.route("/<project_id>/jobs")
+def jobs(project_id: str):
+    return jsonify({"ok": True, "jobs": list_jobs(project_id)})
+
+
+@project_bp.route("/<project_id>/jobs/<job_id>")
+def job_status(project_id: str, job_id: str):
+    job = _project_job(project_id, job_id)
+    out = {"ok": True, **{k: job.get(k) for k in ("id", "kind", "status", "progress", "message", "error", "cancel_requested", "stop_requested")}}
+    if job["status"] == "done":
+        out["result"] = get_job_result(job_id)
+    return respond(out)
+
+
+@project_bp.route("/<project_id>/jobs/<job_id>/result")
+def job_result(project_id: str, job_id: str):
+    job = _project_job(project_id, job_id)
+    if job["status"] != "done":
+        return jsonify({"error": "Задача не завершена", "status": job["status"]}), 409
+    return respond(get_job_result(job_id))
+
+
+@project_bp.route("/<project_id>/jobs/<job_id>/cancel", methods=["POST"])
+def job_cancel(project_id: str, job_id: str):
+    _project_job(project_id, job_id)
+    if not cancel_job(job_id):
+        return jsonify({"error": "Задача уже завершена"}), 409
+    return jsonify({"ok": True})
+
+
+@project_bp.route("/<project_id>/jobs/<job_id>/stop", methods=["POST"])
+def job_stop(project_id: str, job_id: str):
+    _project_job(project_id, job_id)
+    if not request_stop(job_id):
+        return jsonify({"error": "Задача не выполняется"}), 409
+    return jsonify({"ok": True})
 
-    y_pred = iterative_forecast(series, model_path, window=window, steps=steps, horizon=horizon, context=context)
 
-    # Подготовим временную ось продолжения
-    x_future = None
+@project_bp.route("/<project_id>/jobs/<job_id>/events")
+def job_events(project_id: str, job_id: str):
+    """Server-Sent Events: ход выполнения задачи (метрики по эпохам для обучения).
+    id события — байтовое смещение в ленте, поэтому переподключение по
+    Last-Event-ID продолжает поток без повторов.
+    Открытый поток занимает поток gunicorn (gthread), поэтому соединение живёт
+    не дольше SSE_MAX_SECONDS, а пока задача в очереди — закрывается сразу;
+    браузер переподключается сам через retry миллисекунд.
+    """
+    job = _project_job(project_id, job_id)
     try:
-        if time_col:
-            kind = time_meta.get("kind", "index")
-            fmt = time_meta.get("format")
-            if kind in ("timestamp_sec", "timestamp_ms"):
-                unit = "s" if kind == "timestamp_sec" else "ms"
-                t = pd.to_datetime(df[time_col], unit=unit, errors="coerce")
-            elif kind == "datetime_format" and fmt:
-                t = pd.to_datetime(df[time_col], format=fmt, errors="coerce")
-            elif kind in ("iso_date", "rfc_2822", "human_readable"):
-                t = pd.to_datetime(df[time_col], errors="coerce")
+        offset = int(request.headers.get("Last-Event-ID") or request.args.get("offset") or 0)
+    except ValueError:
+        offset = 0
+
+    def stream(offset: int):
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        if job["status"] == "queued":
+            return
+        started = time.time()
+        idle = 0.0
+        while True:
+            events, offset = read_events(job_id, offset)
+            for pos, event in events:
+                yield f"id: {pos}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+            if not events:
+                current = get_job(job_id)
+                if current is None or current["status"] in FINISHED:
+                    status = current["status"] if current else "failed"
+                    yield f"event: end\ndata: {json.dumps({'status': status, 'error': (current or {}).get('error')}, ensure_ascii=False)}\n\n"
+                    return
+                idle += 0.5
+                if idle >= 15:
+                    idle = 0.0
+                    yield ": keep-alive\n\n"
             else:
-                t = None
-            if t is not None:
-                x_base = t.dt.tz_localize(None) if hasattr(t, 'dt') else t
-                diffs = x_base.diff().dropna()
-                step = diffs.median() if not diffs.empty else pd.Timedelta(seconds=1)
-                last = x_base.iloc[-1]
-                x_future = [ (last + step * (i+1)).isoformat() for i in range(steps) ]
-    except Exception:
-        x_future = None
-
-    return jsonify({"ok": True, "prediction": y_pred.tolist(), "x": {"future": x_future}})
+                idle = 0.0
+            if time.time() - started >= SSE_MAX_SECONDS:
+                return  # браузер переподключится с Last-Event-ID
+            time.sleep(0.5)
 
+    return Response(stream_with_context(stream(offset)), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -1,5 +1,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, abort, jsonify
-from modules.storage.projects import list_projects, create_project, get_project
+from modules.storage.projects import list_projects, create_project, get_project, cache_stats
+from modules.web.compact import respond
+from modules.jobs.manager import submit as submit_job, get_job, get_result as get_job_result
 
 web_bp = Blueprint(
     "web", __name__, template_folder="../../templates", 
@@ -29,3 +31,33 @@ def project_detail(project_id: str):
         abort(404)
     return render_template("project_card.html", project=p)
 
+
+
+@web_bp.route("/forecast/batch", methods=["POST"])
+def forecast_batch():
+    # Пачка прогнозов по нескольким проектам/колонкам — одна фоновая задача
+    payload = request.get_json(silent=True) or {}
+    items = payload.get("items")
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Ожидается непустой список items"}), 400
+    if not all(isinstance(it, dict) and it.get("project_id") for it in items):
+        return jsonify({"error": "У каждого элемента должен быть project_id"}), 400
+    job = submit_job("forecast_batch", None, {"items": items})
+    return jsonify({"ok": True, "job_id": job["id"], "status": job["status"]}), 202
+
+
+@web_bp.route("/forecast/batch/<job_id>")
+def forecast_batch_status(job_id: str):
+    job = get_job(job_id)
+    if not job or job.get("kind") != "forecast_batch":
+        abort(404)
+    out = {"ok": True, **{k: job.get(k) for k in ("id", "status", "progress", "message", "error")}}
+    if job["status"] == "done":
+        out["result"] = get_job_result(job_id)
+    return respond(out)
+
+
+@web_bp.route("/stats/cache")
+def stats_cache():
+    # Счётчики кэша чтения проектов и снапшотов (по текущему процессу)
+    return jsonify(cache_stats())
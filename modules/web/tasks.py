@@ -0,0 +1,361 @@
+"""Тяжёлые шаги страницы проекта (предобработка, обучение, прогноз).
+
+Функции выполняются в фоновых задачах (modules.jobs.manager) и возвращают
+тот же JSON, что раньше отдавали маршруты. Сигнатура: (project_id, payload, progress),
+где progress(value, message=None) сообщает ход выполнения.
+"""
+import math
+import os
+from typing import Any, Callable, Dict, Optional
+
+from modules.storage.projects import get_project, update_project, save_snapshot_stage, load_snapshot_stage, save_snapshot_metadata, load_snapshot_metadata, get_artifacts_dir
+from modules.data.ingest import dataframe_preview, extend_preview, preprocess_file, stage_config, stage_source
+from modules.data.column_cache import append_rows, ensure_column_cache, read_columns, read_column_array, rows_at
+from modules.data.downsample import PLOT_POINTS, downsample_indices
+from modules.data.preprocess import parse_pcts
+from modules.data.time_axis import TimeAxis, load_time_axis
+from modules.models.sweep import run_sweep as run_hyper_sweep
+from modules.jobs.manager import CORE_BUDGET
+from modules.models.numpy_runtime import load_exported, numpy_forecast, numpy_batch_forecast
+
+# TensorFlow импортируется только в обучении и прогнозе: рабочий процесс,
+# выполняющий лишь предобработку, не тратит на него время и память.
+
+
+Progress = Callable[..., None]
+
+
+def _project_or_error(project_id: str) -> Dict[str, Any]:
+    project = get_project(project_id)
+    if not project or not project.get("data_path"):
+        raise ValueError("Данные не загружены")
+    return project
+
+
+def run_preprocess(project_id: str, payload: Dict[str, Any], progress: Progress) -> Dict[str, Any]:
+    project = _project_or_error(project_id)
+    target = payload.get("target") or project.get("target")
+    method = payload.get("method", "cusum")
+    pcts = parse_pcts(payload.get("pcts"))
+    if not target:
+        raise ValueError("Не указан target")
+
+    # Обновляем метаданные
+    metadata = load_snapshot_metadata(project_id) or {}
+    metadata["preprocess"] = {"target": target, "method": method}
+    if pcts:
+        metadata["preprocess"]["pcts"] = pcts
+    save_snapshot_metadata(project_id, metadata)
+
+    # Весь файл частями: заполнение пропусков, CUSUM и кривая с переносом состояния
+    progress(0.05, "Предобработка")
+    out = _preprocess_stage(project_id, project["data_path"], stage_config("preprocess", metadata),
+                            lambda share: progress(0.05 + 0.85 * share, "Предобработка"))
+    update_project(project_id, preprocessed=True)
+    return {"ok": True, **out}
+
+
+def _preprocess_stage(project_id: str, data_path: str, cfg: Dict[str, Any],
+                      progress: Optional[Callable[[float], None]] = None) -> Dict[str, Any]:
+    """Предобработка по параметрам этапа cfg с сохранением результата и
+    состояния прохода (этап preprocess_state). Если с прошлого прохода с теми
+    же параметрами в файл только дописывались строки, читаются лишь новые."""
+    saved = load_snapshot_stage(project_id, "preprocess_state")
+    state = None
+    if saved and saved.get("cfg") == cfg:
+        rows = rows_at(ensure_column_cache(data_path), saved.get("data"))
+        if rows is not None and rows == saved["state"]["rows"]:
+            state = saved["state"]
+    out, state = preprocess_file(data_path, cfg["target"], cfg["method"], cfg.get("time"),
+                                 progress=progress, pcts=cfg.get("pcts") or [], state=state)
+    source = stage_source(data_path, cfg)
+    save_snapshot_stage(project_id, "preprocess_state", {"data": source["data"], "cfg": cfg, "state": state})
+    # Сохраняем только результаты предобработки для быстрого доступа
+    save_snapshot_stage(project_id, "preprocess", {**out, "source": source})
+    return out
+
+
+def _time_axis(data_path: str, time_meta: Dict[str, Any]) -> Optional[TimeAxis]:
+    """Ось времени из кэша; None — нет колонки времени или она не разбирается
+    (тогда по оси X идут номера строк)."""
+    try:
+        return load_time_axis(data_path, time_meta)
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+
+def _finite_or_none(v):
+    # Санитизация значений (NaN/inf -> None)
+    try:
+        f = float(v)
+        return f if math.isfinite(f) else None
+    except Exception:
+        return None
+
+
+def _sanitize_array(arr):
+    if not isinstance(arr, list):
+        return None
+    return [_finite_or_none(v) for v in arr]
+
+
+def run_train(project_id: str, payload: Dict[str, Any], progress: Progress) -> Dict[str, Any]:
+    from modules.models.tf_models import ModelConfig, ProgressCallback, train_model, finetune_model
+
+    project = _project_or_error(project_id)
+    metadata = load_snapshot_metadata(project_id) or {}
+    # incremental — дообучение прошлой модели только на строках, дописанных после
+    # прошлого обучения; архитектура, окно и горизонт берутся из него
+    incremental = bool(payload.get("incremental"))
+    prev_train = (metadata.get("train") or {}) if incremental else {}
+    prev_cfg = prev_train.get("cfg") or {}
+    if incremental and (prev_train.get("rows") is None or not prev_cfg):
+        raise ValueError("Нет данных о прошлом обучении для дообучения")
+    target = prev_train.get("target") or payload.get("target") or project.get("target")
+    model_type = prev_cfg.get("model") or payload.get("model", "mlp")
+    window = int(prev_cfg.get("window") or payload.get("window", 32))
+    horizon = int(prev_cfg.get("horizon") or payload.get("horizon", 12))
+    epochs = int(payload.get("epochs", 5))
+    batch_size = int(payload.get("batch_size", 32))
+    learning_rate = float(payload.get("learning_rate", 1e-3))
+    val_split = float(payload.get("val_split", 0.2))
+    if not target:
+        raise ValueError("Не указан target")
+    # Загружаем target; колонка времени разбирается и кэшируется в load_time_axis
+    progress(0.05, "Чтение данных")
+    time_meta = (metadata.get("time") or {}) if isinstance(metadata, dict) else {}
+    series = read_columns(project["data_path"], [target])[target].astype(float).to_numpy()
+    cfg = ModelConfig(model_type=model_type, window=window, horizon=horizon, epochs=epochs, batch_size=batch_size, learning_rate=learning_rate, val_split=val_split)
+    # Только обучение на этом этапе; метрики по эпохам уходят в канал задачи (SSE)
+    progress(0.1, "Обучение")
+
+    def publish(event):
+        message = None
+        if event["event"] == "epoch":
+            loss = event["metrics"].get("loss")
+            message = f"Эпоха {event['epoch']}/{epochs}" + (f", loss {loss:.6f}" if loss is not None else "")
+        progress(0.1 + 0.8 * event["fraction"], message, **event)
+
+    callback = ProgressCallback(
+        publish,
+        every_n_batches=int(payload.get("progress_every_batches", 0) or 0),
+        should_stop=getattr(progress, "stop_requested", None),
+    )
+    if incremental:
+        train_out = finetune_model(series, cfg, get_artifacts_dir(project_id), since=int(prev_train["rows"]),
+                                   replay=float(payload.get("replay", 0.0)), callbacks=[callback])
+    else:
+        train_out = train_model(series, cfg, save_dir=get_artifacts_dir(project_id), callbacks=[callback])
+    progress(0.9, "Сохранение результатов")
+
+    # Подготовим временные оси для отрисовки прогноза; исторический ряд
+    # прорежен до ширины графика (base_row — номера строк, base_y — значения)
+    rows = downsample_indices([series], int(payload.get("plot_points", PLOT_POINTS)))
+    x_axes = {"base": None, "future": None, "base_row": rows.tolist(), "base_y": _sanitize_array(series[rows].tolist())}
+    axis = _time_axis(project["data_path"], time_meta)
+    if axis is not None:
+        x_axes["base"] = axis.labels(rows)
+        x_axes["future"] = axis.future(horizon)
+    else:
+        x_axes["base"] = rows.tolist()
+        x_axes["future"] = list(range(len(series), len(series)+horizon))
+    update_project(project_id, model=model_type, horizon=horizon, status="trained")
+
+    # Обновляем метаданные
+    metadata = load_snapshot_metadata(project_id) or {}
+    metadata["train"] = {
+        "target": target,
+        "cfg": {"model": model_type, "window": window, "horizon": horizon, "epochs": epochs},
+        "rows": int(len(series)),
+    }
+    save_snapshot_metadata(project_id, metadata)
+
+    # Сохраняем только результаты обучения для быстрого доступа
+    tr_loss = _finite_or_none(train_out.get('loss'))
+    tr_vloss = _finite_or_none(train_out.get('val_loss'))
+    tr_vmae = _finite_or_none(train_out.get('val_mae'))
+
+    # Санитизация кривых обучения (NaN/inf -> None)
+    loss_curve = _sanitize_array(train_out.get('loss_curve')) or []
+    val_loss_curve = _sanitize_array(train_out.get('val_loss_curve')) or []
+    mae_curve = _sanitize_array(train_out.get('mae_curve')) or []
+    val_mae_curve = _sanitize_array(train_out.get('val_mae_curve')) or []
+
+    save_snapshot_stage(project_id, "train", {"loss": tr_loss, "val_loss": tr_vloss, "val_mae": tr_vmae, "model_file": train_out.get('model_file'), "loss_curve": loss_curve, "val_loss_curve": val_loss_curve, "mae_curve": mae_curve, "val_mae_curve": val_mae_curve, "x": x_axes, "cfg": {
+      "model": model_type, "window": window, "horizon": horizon, "epochs": epochs, "batch_size": batch_size, "learning_rate": learning_rate, "val_split": val_split
+    }, "source": stage_source(project["data_path"], stage_config("train", metadata))})
+
+    return {"ok": True, "loss": tr_loss, "val_loss": tr_vloss, "val_mae": tr_vmae, "model_file": train_out.get('model_file'), "continued": bool(train_out.get('continued')), "epochs_done": train_out.get('epochs_done'), "incremental": incremental, "new_windows": train_out.get('new_windows'), "replay_windows": train_out.get('replay_windows'), "loss_curve": loss_curve, "val_loss_curve": val_loss_curve, "mae_curve": mae_curve, "val_mae_curve": val_mae_curve, "x": x_axes}
+
+
+def run_append(project_id: str, payload: Dict[str, Any], progress: Progress) -> Dict[str, Any]:
+    """Дописывает строки из загруженного файла (payload["file"]) к данным
+    проекта; при payload["train"] затем дообучает модель на новых окнах."""
+    project = _project_or_error(project_id)
+    upload = payload.get("file")
+    if not upload or not os.path.exists(upload):
+        raise ValueError("Файл с новыми строками не найден")
+    path = project["data_path"]
+    progress(0.05, "Дописывание строк")
+    try:
+        with open(upload, "rb") as f:
+            manifest, added = append_rows(path, f.read())
+    finally:
+        os.remove(upload)
+
+    # preview продлеваем по новым строкам, если он был посчитан для файла до этого
+    # дописывания; остальные этапы пересчитаются лениво по изменившемуся хэшу данных
+    progress(0.2, "Обновление превью")
+    parent = (manifest.get("appends") or [{}])[-1].get("parent") if len(added) else None
+    preview = load_snapshot_stage(project_id, "preview")
+    if preview and parent and (preview.get("source") or {}).get("data") == parent and "info" in preview:
+        preview = extend_preview(preview, added)
+    else:
+        preview = dataframe_preview(path)
+    preview["source"] = stage_source(path, {})
+    save_snapshot_stage(project_id, "preview", preview)
+
+    out = {"ok": True, "rows_added": int(len(added)), "rows": int(manifest["rows"]), "preview": preview}
+    # Предобработка, актуальная до дописывания, продолжается по новым строкам
+    cfg = stage_config("preprocess", load_snapshot_metadata(project_id) or {})
+    stored = load_snapshot_stage(project_id, "preprocess")
+    if cfg and parent and stored and stored.get("source") == {"data": parent, "cfg": cfg}:
+        progress(0.25, "Предобработка новых строк")
+        _preprocess_stage(project_id, path, cfg)
+        out["preprocessed"] = True
+    if payload.get("train") and len(added):
+        def train_progress(value, message=None, **extra):
+            progress(0.3 + 0.7 * value, message, **extra)
+        train_progress.stop_requested = getattr(progress, "stop_requested", None)
+        params = {"incremental": True, **{k: payload[k] for k in ("epochs", "replay", "batch_size") if k in payload}}
+        out["train"] = run_train(project_id, params, train_progress)
+    return out
+
+
+def run_forecast(project_id: str, payload: Dict[str, Any], progress: Progress) -> Dict[str, Any]:
+    project = _project_or_error(project_id)
+    target = payload.get("target") or project.get("target")
+    steps = int(payload.get("steps", 12))
+    context = payload.get("context")
+    try:
+        context = int(context) if context is not None else None
+    except Exception:
+        context = None
+    if not target:
+        raise ValueError("Не указан target")
+
+    # Читаем конфигурацию из снапшота (из последнего обучения)
+    train_info = load_snapshot_stage(project_id, "train") or {}
+    cfg_info = (train_info.get("cfg") or {})
+    window = int(cfg_info.get("window", 32))
+    horizon = int(cfg_info.get("horizon", 12))
+
+    # Загружаем ряд и метаданные времени
+    progress(0.1, "Чтение данных")
+    metadata = load_snapshot_metadata(project_id) or {}
+    time_meta = (metadata.get("time") or {}) if isinstance(metadata, dict) else {}
+    series = read_columns(project["data_path"], [target])[target].astype(float).to_numpy()
+
+    model_path = os.path.join(get_artifacts_dir(project_id), "model.keras")
+    if not os.path.exists(model_path):
+        raise ValueError("Сначала обучите модель")
+
+    progress(0.3, "Прогноз")
+    # auto — NumPy-модель (model.npz), если экспорт актуален, иначе TensorFlow
+    mode = payload.get("mode", "auto")
+    np_model = load_exported(model_path) if mode in ("auto", "numpy") else None
+    if mode == "numpy" and np_model is None:
+        raise ValueError("Нет актуальной экспортированной модели (model.npz)")
+    if np_model is not None:
+        y_pred = numpy_forecast(series, np_model, steps=steps, horizon=horizon, context=context)
+    else:
+        from modules.models.tf_models import iterative_forecast
+        y_pred = iterative_forecast(series, model_path, window=window, steps=steps, horizon=horizon, context=context,
+                                    mode="compiled" if mode == "auto" else mode)
+
+    # Временная ось продолжения: по точке на каждое значение прогноза (steps * horizon)
+    axis = _time_axis(project["data_path"], time_meta)
+    if axis is not None:
+        x_future = axis.future(len(y_pred))
+    else:
+        x_future = list(range(len(series), len(series) + len(y_pred)))
+
+    return {"ok": True, "prediction": y_pred.tolist(), "x": {"future": x_future}}
+
+
+def run_sweep(project_id: str, payload: Dict[str, Any], progress: Progress) -> Dict[str, Any]:
+    project = _project_or_error(project_id)
+    target = payload.get("target") or project.get("target")
+    if not target:
+        raise ValueError("Не указан target")
+    progress(0.02, "Чтение данных")
+    series = read_columns(project["data_path"], [target])[target].astype(float).to_numpy()
+    board = run_hyper_sweep(
+        series,
+        payload.get("space") or {},
+        get_artifacts_dir(project_id),
+        mode=payload.get("mode", "grid"),
+        n_trials=payload.get("n_trials"),
+        base=payload.get("base"),
+        min_epochs=int(payload.get("min_epochs", 2)),
+        max_epochs=int(payload.get("max_epochs", 18)),
+        eta=int(payload.get("eta", 3)),
+        workers=payload.get("workers"),
+        threads_per_trial=int(payload.get("threads_per_trial", 1)),
+        seed=int(payload.get("seed", 0)),
+        progress=progress,
+        should_stop=getattr(progress, "stop_requested", None),
+        core_budget=CORE_BUDGET,
+    )
+    return {"ok": True, "leaderboard": board}
+
+
+def run_forecast_batch(project_id: Any, payload: Dict[str, Any], progress: Progress) -> Dict[str, Any]:
+    """Прогноз для многих (проект, target) за раз; задача не привязана к проекту.
+    Ошибка в одном элементе не мешает остальным — она возвращается в его ответе.
+    """
+    items = payload.get("items") or []
+    results: list = [None] * len(items)
+    requests, positions = [], []
+    progress(0.05, "Чтение данных")
+    for pos, item in enumerate(items):
+        pid = item.get("project_id")
+        try:
+            project = _project_or_error(pid)
+            target = item.get("target") or project.get("target")
+            if not target:
+                raise ValueError("Не указан target")
+            cfg_info = (load_snapshot_stage(pid, "train") or {}).get("cfg") or {}
+            window = int(cfg_info.get("window", 32))
+            model_path = os.path.join(get_artifacts_dir(pid), "model.keras")
+            if not os.path.exists(model_path):
+                raise ValueError("Сначала обучите модель")
+            context = item.get("context")
+            context = int(context) if context is not None else None
+            # С диска читаем только хвост колонки, нужный для первого окна
+            column = read_column_array(project["data_path"], target)
+            tail = column[-max(window, context or 0):].astype(float)
+            if min(len(tail), context or len(tail)) < window:
+                raise ValueError("Недостаточно точек контекста для окна модели")
+            requests.append({"series": tail, "model_path": model_path, "window": window,
+                             "horizon": int(cfg_info.get("horizon", 12)), "steps": int(item.get("steps", 12)),
+                             "context": context})
+            positions.append(pos)
+            results[pos] = {"project_id": pid, "target": target}
+        except (ValueError, TypeError) as exc:
+            results[pos] = {"project_id": pid, "target": item.get("target"), "error": str(exc)}
+
+    progress(0.3, "Прогноз")
+    predictions = numpy_batch_forecast(requests)
+    rest = [i for i, pred in enumerate(predictions) if pred is None]
+    if rest:
+        # Модели без экспорта в NumPy считаем через TensorFlow
+        from modules.models.tf_models import batch_forecast
+        for i, pred in zip(rest, batch_forecast([requests[i] for i in rest])):
+            predictions[i] = pred
+    for pos, pred in zip(positions, predictions):
+        if isinstance(pred, Exception):
+            results[pos]["error"] = str(pred)
+        else:
+            results[pos]["prediction"] = pred.tolist()
+    return {"ok": True, "results": results}
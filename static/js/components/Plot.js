@@ -1,11 +1,16 @@
 import ParserTool from "../utils/parsers.js"
+import DOMUtils from "../utils/DOMUtils.js";
+import Columnar from "../utils/Columnar.js";
 
-// Отрисовка графика
-function drawPlot(plotId, target, features, data, timeMeta) {
-  const el = document.getElementById(plotId);
-  const cols = data.columns;
-  const rows = data.records;
-  let x = Array.from({ length: rows.length }, (_, i) => i);
+const LAYOUT = {
+  paper_bgcolor: '#111418',
+  plot_bgcolor: '#111418',
+  font: { color: '#e6e6e6' },
+};
+
+// Ось X по строкам данных: индекс или разобранная временная колонка
+function buildX(cols, rows, timeMeta) {
+  let x = cols.includes('_row') ? rows.map((r) => r._row) : Array.from({ length: rows.length }, (_, i) => i);
   // Если в сэмпле есть временная колонка — используем её
   if (timeMeta && timeMeta.column && cols.includes(timeMeta.column)) {
     const col = timeMeta.column;
@@ -26,11 +31,21 @@ function drawPlot(plotId, target, features, data, timeMeta) {
       x = rows.map((r) => r[col]);
     }
   }
+  return x;
+}
+
+function buildTraces(target, features, data, timeMeta) {
+  const cols = data.columns;
+  const rows = data.records;
+  const x = buildX(cols, rows, timeMeta);
+  // Номера строк файла — для запроса участка при приближении
+  const customdata = cols.includes('_row') ? rows.map((r) => r._row) : undefined;
   const traces = [];
   if (target && cols.includes(target)) {
     traces.push({
       x,
       y: rows.map((r) => r[target]),
+      customdata,
       name: target,
       mode: 'lines',
     });
@@ -40,18 +55,79 @@ function drawPlot(plotId, target, features, data, timeMeta) {
       traces.push({
         x,
         y: rows.map((r) => r[f]),
+        customdata,
         name: f,
         mode: 'lines',
       });
     }
   });
+  return traces;
+}
+
+function axisValue(v) {
+  if (v instanceof Date) return v.getTime();
+  if (typeof v === 'number') return v;
+  const t = Date.parse(String(v).replace(' ', 'T'));
+  return Number.isNaN(t) ? Number(v) : t;
+}
+
+// Прореженный график (records с _row): при приближении видимый участок
+// запрашивается с сервера, двойной клик возвращает обзор всего ряда
+function bindRangeZoom(el, target, features, overview, timeMeta) {
+  let busy = false;
+  let seq = 0;
+  el.on('plotly_relayout', async (ev) => {
+    if (busy) return;
+    if (ev['xaxis.autorange']) {
+      busy = true;
+      try { await Plotly.react(el, buildTraces(target, features, overview, timeMeta), LAYOUT); } finally { busy = false; }
+      return;
+    }
+    const r0 = ev['xaxis.range[0]'];
+    const r1 = ev['xaxis.range[1]'];
+    const trace = el.data && el.data[0];
+    if (r0 === undefined || r1 === undefined || !trace || !trace.customdata) return;
+    const a = axisValue(r0);
+    const b = axisValue(r1);
+    const xs = trace.x.map(axisValue);
+    if (xs.some(Number.isNaN) || Number.isNaN(a) || Number.isNaN(b)) return;
+    // Ближайшие отобранные точки за границами видимой области
+    let i0 = 0;
+    while (i0 < xs.length - 1 && xs[i0 + 1] <= a) i0++;
+    let i1 = xs.length - 1;
+    while (i1 > 0 && xs[i1 - 1] >= b) i1--;
+    const columns = overview.columns.filter((c) => c !== '_row');
+    const params = new URLSearchParams({
+      columns: columns.join(','),
+      start: trace.customdata[i0],
+      stop: trace.customdata[i1] + 1,
+      points: Math.max(200, Math.round(el.clientWidth || 1000)),
+    });
+    if (timeMeta && timeMeta.column) params.set('axis', timeMeta.column);
+    const req = ++seq;
+    // Для графика хватает float32
+    const body = await Columnar.fetchJSON(`/project/${DOMUtils.getProjectIdFromAppRoot()}/series?${params}`, {}, 'f4');
+    if (req !== seq || !body.ok) return;
+    busy = true;
+    try {
+      await Plotly.react(el, buildTraces(target, features, body.data, timeMeta),
+        { ...LAYOUT, xaxis: { range: [r0, r1] } });
+    } finally {
+      busy = false;
+    }
+  });
+}
+
+// Отрисовка графика
+function drawPlot(plotId, target, features, data, timeMeta) {
+  const el = document.getElementById(plotId);
+  const traces = buildTraces(target, features, data, timeMeta);
   // Очистка предыдущего графика и отрисовка заново
   try { Plotly.purge(el); } catch(_) {}
-  Plotly.newPlot(el, traces, {
-    paper_bgcolor: '#111418',
-    plot_bgcolor: '#111418',
-    font: { color: '#e6e6e6' },
-  });
+  Plotly.newPlot(el, traces, LAYOUT);
+  if (data.columns.includes('_row') && data.size > data.records.length) {
+    bindRangeZoom(el, target, features, data, timeMeta);
+  }
 }
 
 // Обновленная функция прорисовки прогноза
@@ -63,6 +139,10 @@ function drawForecast(target, prediction, xAxes) {
     baseX = existing.x;
     baseY = existing.y;
   }
+  // Обучение возвращает исторический ряд, прореженный до ширины графика
+  if (xAxes && Array.isArray(xAxes.base_y)) {
+    baseY = xAxes.base_y;
+  }
 
   // Формируем оси X для будущего периода прогнозирования
   const xFuture = xAxes && xAxes.future ? xAxes.future : Array.from({ length: prediction.length }, (_, i) => baseX.length + i);
@@ -85,18 +165,37 @@ function drawForecast(target, prediction, xAxes) {
   drawPlot('forecast_plot', target, ['x', 'y'], data, {});
 }
 
-// Отрисовка результатов предварительной обработки
-function drawPP(curve) {
-  const cx = curve.x || [];
-  const cy = curve.y || [];
+// Отрисовка результатов предварительной обработки; curves — кривые для нескольких порогов
+function drawPP(curve, curves) {
+  const traces = (Array.isArray(curves) && curves.length)
+    ? curves.map((c) => ({
+      x: c.x || [], y: c.y || [], mode: 'lines+markers', name: `±${+(c.pct * 100).toFixed(2)}%`,
+    }))
+    : [{ x: curve.x || [], y: curve.y || [], mode: 'lines+markers', name: 'Δ% длительность' }];
   try { Plotly.purge('pp_curve'); } catch(_) {}
-  Plotly.newPlot('pp_curve', [
-    { x: cx, y: cy, mode: 'lines+markers', name: 'Δ% длительность' },
-  ], {
+  Plotly.newPlot('pp_curve', traces, {
+    paper_bgcolor: '#111418',
+    plot_bgcolor: '#111418',
+    font: { color: '#e6e6e6' },
+  });
+}
+
+// Кривые обучения по эпохам (вызывается и по ходу обучения, и по его завершении)
+function drawTrainCurve(lossCurve, valLossCurve) {
+  const epochs = (lossCurve || []).map((_, i) => i + 1);
+  const traces = [];
+  if (Array.isArray(lossCurve) && lossCurve.length) {
+    traces.push({ x: epochs, y: lossCurve, name: 'loss', mode: 'lines' });
+  }
+  if (Array.isArray(valLossCurve) && valLossCurve.length) {
+    traces.push({ x: epochs.slice(0, valLossCurve.length), y: valLossCurve, name: 'val_loss', mode: 'lines' });
+  }
+  if (!traces.length) return;
+  Plotly.react('train_curve', traces, {
     paper_bgcolor: '#111418',
     plot_bgcolor: '#111418',
     font: { color: '#e6e6e6' },
   });
 }
 
-export default { drawPlot, drawForecast, drawPP };
\ No newline at end of file
+export default { drawPlot, drawForecast, drawPP, drawTrainCurve };
\ No newline at end of file
@@ -1,4 +1,5 @@
 import DOMUtils from "../utils/DOMUtils.js";
+import Columnar from "../utils/Columnar.js";
 import renderTable from "./Table.js";
 import PlotModule from "./Plot.js"
 import RestoreModule from "../utils/RestoreState.js"
@@ -148,8 +149,7 @@ async function applySelection(){
     kind: document.getElementById('time_kind')?.value || 'index',
     format: document.getElementById('time_format')?.value || null,
   };
-  const res = await fetch(`/project/${DOMUtils.getProjectIdFromAppRoot()}/select`, {method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({target, features, time })});
-  const data = await res.json();
+  const data = await Columnar.fetchJSON(`/project/${DOMUtils.getProjectIdFromAppRoot()}/select`, {method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({target, features, time })});
   let tableData = [];
   for (let i=0 ; i < 5; i++) {
     tableData.push(data.data.records[i]);
@@ -157,7 +157,8 @@ async function applySelection(){
 
   if(data.data){
     renderTable('seleted-table', data.data.columns, tableData);
-    PlotModule.drawPlot('plot', target, features, data.data, data.time);
+    // График — по прореженному ряду всего файла (plot), таблица — по первым строкам
+    PlotModule.drawPlot('plot', target, features, data.data.plot || data.data, data.time);
     RestoreModule.setCurrentSnap({ selection: { target, features }, time: time, sample: data.data });
   }
 }
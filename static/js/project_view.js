@@ -2,6 +2,7 @@ import PlotModule from "./components/Plot.js"
 import SelectionModule from "./components/Selector.js"
 import DOMUtils from "./utils/DOMUtils.js";
 import RestoreModule from "./utils/RestoreState.js"
+import JobsModule from "./utils/Jobs.js";
 
 import renderPreview from "./components/Preview.js";
 import renderTable from "./components/Table.js";
@@ -14,6 +15,8 @@ import appendTrainLog from "./components/TrainLog.js";
 function initApp() {
   // Текущее клиентское состояние (минимальный снапшот)
   let currentSnap = null;
+  // id фоновой задачи обучения, пока она выполняется
+  let currentTrainJob = null;
 
   
 
@@ -78,6 +81,24 @@ function initApp() {
       appendTrainLog('Ошибка парсинга ответа сервера');
       throw err;
     }
+    if (data.job_id) {
+      // Живые метрики по эпохам приходят через SSE, итог — по завершении задачи
+      currentTrainJob = data.job_id;
+      const liveLoss = [];
+      const liveValLoss = [];
+      try {
+        data = await JobsModule.followJob(data.job_id, (ev) => {
+          if (ev.message) appendTrainLog(ev.message);
+          if (ev.event === 'epoch' && ev.metrics) {
+            liveLoss.push(ev.metrics.loss);
+            if (ev.metrics.val_loss !== undefined) liveValLoss.push(ev.metrics.val_loss);
+            PlotModule.drawTrainCurve(liveLoss, liveValLoss);
+          }
+        });
+      } finally {
+        currentTrainJob = null;
+      }
+    }
     if (!data.ok) {
       alert(data.error || 'Ошибка');
       appendTrainLog(`Ошибка: ${data.error || 'неизвестно'}`);
@@ -89,6 +110,7 @@ function initApp() {
     if (typeof data.val_mae === 'number') info.push(`Val MAE: ${Number(data.val_mae).toFixed(6)}`);
     if (data.model_file) info.push(`Файл: ${data.model_file}`);
     if (data.continued) info.push('(дообучение)');
+    if (data.epochs_done && data.epochs_done < epochs) info.push(`(остановлено на эпохе ${data.epochs_done})`);
     document.getElementById('train_info').textContent = info.join(' | ');
     RestoreModule.setCurrentSnap({ train: { loss: data.loss, val_loss: data.val_loss, val_mae: data.val_mae, model_file: data.model_file, x: data.x } });
     appendTrainLog(info.join(' | '));
@@ -96,24 +118,16 @@ function initApp() {
 
     // График кривых обучения
     try {
-      const epochs = (data.loss_curve || []).map((_, i) => i + 1);
-      const traces = [];
-      if (Array.isArray(data.loss_curve) && data.loss_curve.length) {
-        traces.push({ x: epochs, y: data.loss_curve, name: 'loss', mode: 'lines' });
-      }
-      if (Array.isArray(data.val_loss_curve) && data.val_loss_curve.length) {
-        traces.push({ x: epochs.slice(0, data.val_loss_curve.length), y: data.val_loss_curve, name: 'val_loss', mode: 'lines' });
-      }
-      if (traces.length) {
-        try { Plotly.purge('train_curve'); } catch(_) {}
-        Plotly.newPlot('train_curve', traces, {
-          paper_bgcolor: '#111418',
-          plot_bgcolor: '#111418',
-          font: { color: '#e6e6e6' },
-        });
-      }
+      PlotModule.drawTrainCurve(data.loss_curve, data.val_loss_curve);
     } catch (_) {}
   }
+
+  // Досрочная остановка текущего обучения
+  async function stopTrain() {
+    if (!currentTrainJob) return;
+    const out = await JobsModule.stopJob(currentTrainJob);
+    if (out.ok) appendTrainLog('Запрошена остановка обучения...');
+  }
   async function runForecast() {
     const target = document.getElementById('target')?.value;
     if (!target) {
@@ -127,8 +141,7 @@ function initApp() {
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({ target, steps, context }),
     });
-    const data = await res.json();
-    comsole.log("predict",data);
+    const data = await JobsModule.resolveResponse(await res.json());
     if (!data.ok) {
       alert(data.error || 'Ошибка прогноза');
       return;
@@ -145,12 +158,17 @@ function initApp() {
       alert('Сначала выберите target');
       return;
     }
+    // Пороги кривой длительности в процентах через запятую; один порог 5% — прежняя кривая
+    const pcts = (document.getElementById('pp_pcts')?.value || '')
+      .split(',').map((v) => parseFloat(v)).filter((v) => Number.isFinite(v)).map((v) => v / 100);
+    const body = { target, method };
+    if (pcts.length && !(pcts.length === 1 && pcts[0] === 0.05)) body.pcts = pcts;
     const res = await fetch(`/project/${DOMUtils.getProjectIdFromAppRoot()}/preprocess`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ target, method }),
+      body: JSON.stringify(body),
     });
-    const data = await res.json();
+    const data = await JobsModule.resolveResponse(await res.json());
     if (!data.ok) {
       alert(data.error || 'Ошибка');
       return;
@@ -178,7 +196,9 @@ function initApp() {
     );
 
     // Дополнительно выводим график кривых изменений длительности
-    PlotModule.drawPP(data.curve);
+    PlotModule.drawPP(data.curve, data.curves);
+    const info = document.getElementById('pp_info');
+    if (info) info.textContent = '';
     RestoreModule.setCurrentSnap({ preprocess: data });
   }
 
@@ -196,6 +216,8 @@ function initApp() {
     
     const tr = document.getElementById('train_run');
     if(tr){ tr.addEventListener('click', runTrain); }
+    const ts = document.getElementById('train_stop');
+    if(ts){ ts.addEventListener('click', stopTrain); }
     const fr = document.getElementById('forecast_run');
     if(fr){ fr.addEventListener('click', runForecast); }
     
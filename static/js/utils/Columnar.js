@@ -0,0 +1,60 @@
+// Колоночный формат ответов API (modules/web/compact.py): запрос с Accept
+// и обратное преобразование в привычный JSON (records, списки, ISO-строки)
+const COLUMNAR = 'application/x-columnar+json';
+// Длина ISO-строки для точности оси времени ($time)
+const TIME_WIDTH = { D: 10, m: 16, s: 19, ms: 23 };
+
+function typedArray(b64, Type) {
+  const bin = atob(b64);
+  const bytes = new Uint8Array(bin.length);
+  for (let i = 0; i < bin.length; i++) bytes[i] = bin.charCodeAt(i);
+  // NaN — пропуск, как null в обычном JSON
+  return Array.from(new Type(bytes.buffer), (v) => (Number.isNaN(v) ? null : v));
+}
+
+function decodeValue(v) {
+  if (Array.isArray(v)) return v.map(decodeValue);
+  if (!v || typeof v !== 'object') return v;
+  if (v.$f8 !== undefined) return typedArray(v.$f8, Float64Array);
+  if (v.$i4 !== undefined) return typedArray(v.$i4, Int32Array);
+  if (v.$f4 !== undefined) return typedArray(v.$f4, Float32Array);
+  if (v.$range) {
+    const [start, step, count] = v.$range;
+    return Array.from({ length: count }, (_, i) => start + step * i);
+  }
+  if (v.$time) {
+    // Наивное время кодируется как UTC: отрезаем 'Z', чтобы строки остались без зоны,
+    // и оставляем исходную точность записи (дата, минуты, секунды или миллисекунды)
+    const [start, step, count, unit] = v.$time;
+    const t0 = Date.parse(`${start.length === 10 ? `${start}T00:00` : start}Z`);
+    const width = TIME_WIDTH[unit] || 23;
+    return Array.from({ length: count }, (_, i) => new Date(t0 + step * i).toISOString().slice(0, width));
+  }
+  const out = {};
+  Object.entries(v).forEach(([k, val]) => { out[k] = decodeValue(val); });
+  if (out.$columns) {
+    const cols = out.$columns;
+    const names = Object.keys(cols);
+    const length = names.length ? cols[names[0]].length : 0;
+    out.records = Array.from({ length }, (_, i) => {
+      const row = {};
+      names.forEach((n) => { row[n] = cols[n][i]; });
+      return row;
+    });
+    delete out.$columns;
+  }
+  return out;
+}
+
+// fetch + JSON с запросом колоночного формата; floats: 'f8' или 'f4' (точность чисел)
+async function fetchJSON(url, options = {}, floats = 'f8') {
+  const headers = Object.assign({}, options.headers || {}, {
+    Accept: `${COLUMNAR}; floats=${floats}, application/json;q=0.9`,
+  });
+  const res = await fetch(url, Object.assign({}, options, { headers }));
+  const body = await res.json();
+  const type = res.headers.get('Content-Type') || '';
+  return type.startsWith(COLUMNAR) ? decodeValue(body) : body;
+}
+
+export default { fetchJSON, decodeValue };
@@ -0,0 +1,75 @@
+import DOMUtils from "./DOMUtils.js";
+import Columnar from "./Columnar.js";
+
+const POLL_MS = 1000;
+
+// Ожидание фоновой задачи: опрос статуса до завершения, возвращает результат задачи
+async function waitJob(jobId, onProgress) {
+  const url = `/project/${DOMUtils.getProjectIdFromAppRoot()}/jobs/${jobId}`;
+  while (true) {
+    const job = await Columnar.fetchJSON(url);
+    if (onProgress) onProgress(job);
+    if (job.status === 'done') return job.result;
+    if (job.status === 'failed') return { ok: false, error: job.error || 'Ошибка выполнения задачи' };
+    if (job.status === 'cancelled') return { ok: false, error: 'Задача отменена' };
+    await new Promise((resolve) => setTimeout(resolve, POLL_MS));
+  }
+}
+
+// Ответ маршрута: либо готовый результат, либо id фоновой задачи
+async function resolveResponse(data, onProgress) {
+  if (data && data.job_id) {
+    return waitJob(data.job_id, onProgress);
+  }
+  return data;
+}
+
+async function cancelJob(jobId) {
+  const res = await fetch(`/project/${DOMUtils.getProjectIdFromAppRoot()}/jobs/${jobId}/cancel`, { method: 'POST' });
+  return res.json();
+}
+
+// Досрочная остановка обучения: модель, обученная к этому моменту, сохраняется
+async function stopJob(jobId) {
+  const res = await fetch(`/project/${DOMUtils.getProjectIdFromAppRoot()}/jobs/${jobId}/stop`, { method: 'POST' });
+  return res.json();
+}
+
+// Поток событий задачи (SSE): onEvent — на каждое событие, onEnd — по завершении задачи.
+// Сервер закрывает соединение каждые ~30 с (и сразу, пока задача в очереди);
+// EventSource переподключается сам и продолжает с Last-Event-ID.
+function streamEvents(jobId, onEvent, onEnd, onFail) {
+  const source = new EventSource(`/project/${DOMUtils.getProjectIdFromAppRoot()}/jobs/${jobId}/events`);
+  source.onmessage = (e) => {
+    try { onEvent(JSON.parse(e.data)); } catch (_) {}
+  };
+  source.addEventListener('end', (e) => {
+    source.close();
+    if (onEnd) {
+      try { onEnd(JSON.parse(e.data)); } catch (_) { onEnd({}); }
+    }
+  });
+  // CLOSED после ошибки — браузер не будет переподключаться (например, 404)
+  source.onerror = () => {
+    if (source.readyState === EventSource.CLOSED && onFail) onFail();
+  };
+  return source;
+}
+
+// Ожидание задачи с событиями через SSE: пока поток открыт, статус не опрашивается;
+// результат запрашивается один раз по событию end (или опросом, если SSE недоступен)
+function followJob(jobId, onEvent) {
+  if (typeof EventSource === 'undefined') return waitJob(jobId);
+  return new Promise((resolve) => {
+    let settled = false;
+    const finish = () => {
+      if (settled) return;
+      settled = true;
+      source.close();
+      resolve(waitJob(jobId));
+    };
+    const source = streamEvents(jobId, onEvent, finish, finish);
+  });
+}
+
+export default { waitJob, resolveResponse, cancelJob, stopJob, streamEvents, followJob };
@@ -1,6 +1,7 @@
 import PlotModule from "../components/Plot.js"
 import SelectionModule from "../components/Selector.js"
 import DOMUtils from "./DOMUtils.js";
+import Columnar from "./Columnar.js";
 
 import renderPreview from "../components/Preview.js";
 import renderTable from "../components/Table.js";
@@ -8,17 +9,37 @@ import updateSteps from "../components/Steps.js"
 
 
 
+// Снапшот с уже подгруженными этапами
+let currentSnap = null;
+
 function setCurrentSnap(partial) {
-  let currentSnap = DOMUtils.getSnapshot();
-  currentSnap = Object.assign({}, currentSnap || {}, partial || {});
+  currentSnap = Object.assign({}, currentSnap || DOMUtils.getSnapshot() || {}, partial || {});
   updateSteps(currentSnap);
 }
-  
+
+// Результаты этапа запрашиваются отдельно: страница открывается без тяжёлых данных
+async function fetchStage(stage) {
+  const projectId = DOMUtils.getProjectIdFromAppRoot();
+  try {
+    const body = await Columnar.fetchJSON(`/project/${projectId}/snapshot/${stage}`);
+    return (body && body.data) || null;
+  } catch {
+    return null;
+  }
+}
+
 // Восстановление ранее сохранённых состояний
-function restore() {
+async function restore() {
   const snap = DOMUtils.getSnapshot();
-  console.log(snap);
   if (!snap) return;
+  updateSteps(snap);
+
+  const stages = snap.stages || [];
+  const loaded = await Promise.all(stages.map(fetchStage));
+  stages.forEach((stage, i) => {
+    if (loaded[i]) snap[stage] = loaded[i];
+  });
+  currentSnap = Object.assign({}, snap, currentSnap || {});
   
   if (snap.preview && snap.preview.info) {
     renderPreview(snap.preview.head, snap.preview.info.column_names);
@@ -40,7 +61,7 @@ function restore() {
     const sel = snap.selection || {};
     const t = sel.target;
     const f = sel.features || [];
-    PlotModule.drawPlot("plot", t, f, snap.sample, snap.time);
+    PlotModule.drawPlot("plot", t, f, snap.sample.plot || snap.sample, snap.time);
     if (t) {
       const tgtSel = document.getElementById('target');
       if (tgtSel) {
@@ -72,7 +93,10 @@ function restore() {
     );
 
     // Дополнительно выводим график кривых изменений длительности
-    PlotModule.drawPP(snap.preprocess.curve);
+    PlotModule.drawPP(snap.preprocess.curve, snap.preprocess.curves);
+    // Данные изменились после предобработки: сервер не пересчитывает её при открытии страницы
+    const info = document.getElementById('pp_info');
+    if (info) info.textContent = snap.preprocess.stale ? 'Данные изменились — результат устарел, выполните предобработку заново' : '';
   }
   if (snap.train) {
     document.getElementById('train_info').textContent = `Loss: ${Number(snap.train.loss).toFixed(6)}`;
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from modules.data.column_cache import append_rows, build_column_cache, read_columns
+
+
+def _write(path, text):
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_text_row_in_later_chunk_keeps_numbers(tmp_path):
+    # Текст встречается только в последней части: числа не должны обрезаться
+    csv = _write(tmp_path / "d.csv", "a,b\n1234.5678,1\n1235.5678,2\n1236.5678,3\nx,4\n,5\n")
+    manifest = build_column_cache(csv, chunksize=3)
+    assert manifest["columns"][0]["text"]
+    df = read_columns(csv)
+    assert df["a"].tolist()[:4] == ["1234.5678", "1235.5678", "1236.5678", "x"]
+    assert pd.isna(df["a"].iloc[4])
+    assert df["b"].tolist() == [1, 2, 3, 4, 5]
+
+
+def test_numeric_chunks_without_text(tmp_path):
+    csv = _write(tmp_path / "d.csv", "a\n1\n2\n3\n4.5\n")
+    build_column_cache(csv, chunksize=2)
+    assert np.allclose(read_columns(csv)["a"], [1, 2, 3, 4.5])
+
+
+def test_append_longer_value_to_text_column(tmp_path):
+    csv = _write(tmp_path / "d.csv", "a\nab\ncd\n")
+    build_column_cache(csv)
+    append_rows(csv, b"a\n123456789\n")
+    assert read_columns(csv)["a"].tolist() == ["ab", "cd", "123456789"]
+
+
+def test_append_text_to_numeric_column(tmp_path):
+    csv = _write(tmp_path / "d.csv", "a,b\n1.5,1\n22.25,2\n,3\n")
+    build_column_cache(csv)
+    manifest, _ = append_rows(csv, b"a,b\nx,4\n")
+    assert manifest["columns"][0]["text"]
+    df = read_columns(csv)
+    assert df["a"].tolist()[:2] == ["1.5", "22.25"]
+    assert pd.isna(df["a"].iloc[2])
+    assert df["a"].iloc[3] == "x"
+    assert df["b"].tolist() == [1, 2, 3, 4]
+
+
+def test_append_numbers_to_text_column(tmp_path):
+    csv = _write(tmp_path / "d.csv", "a,b\nxyz,1\n")
+    build_column_cache(csv)
+    append_rows(csv, b"a,b\n7,2\n123456,3\n")
+    assert read_columns(csv)["a"].tolist() == ["xyz", "7", "123456"]